@@ -0,0 +1,69 @@
+"""Latency of cached vs uncached AIModel completions.
+
+The first call for each prompt goes to the local fake Groq server; repeats
+(including whitespace/case variants of the same prompt) are served from the
+response cache.
+
+    python benchmarks/bench_ai_cache.py --repeats 10000
+    python benchmarks/bench_ai_cache.py --shared-db /tmp/ai_cache.db
+"""
+import argparse
+import json
+import os
+import time
+
+from common import import_app, summarize
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+PROMPTS = ["Say hi", "What is Aizeeno?", "How much does the Pro plan cost?", "Summarize this page"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=10000)
+    parser.add_argument('--shared-db', help='back the cache with this SQLite file (AI_CACHE_DB)')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(config=FakeGroqConfig(first_token_ms=300, tokens_per_sec=200, n_tokens=40)).start_background()
+    env = {'GROQ_API_KEY': 'bench-fake-key', 'GROQ_BASE_URL': fake.base_url}
+    if args.shared_db:
+        if os.path.exists(args.shared_db):
+            os.remove(args.shared_db)
+        env['AI_CACHE_DB'] = args.shared_db
+    import_app(**env)
+    import ai_model
+
+    model = ai_model.default_model
+    misses = []
+    for p in PROMPTS:
+        t0 = time.perf_counter()
+        model.process('chat', p)
+        misses.append((time.perf_counter() - t0) * 1e6)
+
+    hits = []
+    for i in range(args.repeats):
+        p = PROMPTS[i % len(PROMPTS)]
+        if i % 2:
+            p = f"  {p.upper()} "
+        t0 = time.perf_counter()
+        model.process('chat', p)
+        hits.append((time.perf_counter() - t0) * 1e6)
+
+    results = {
+        'miss_us': summarize(misses),
+        'hit_us': summarize(hits),
+        'upstream_calls': fake.requests_served,
+        'cache': ai_model.response_cache.stats(),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"miss p50 {results['miss_us']['p50']:>12.1f}us")
+    print(f"hit  p50 {results['hit_us']['p50']:>12.1f}us   p99 {results['hit_us']['p99']:.1f}us")
+    print(f"upstream calls: {fake.requests_served} for {len(PROMPTS) + args.repeats} requests")
+    print(f"cache: {results['cache']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Many prompts: sequential /api/chat calls vs one /api/chat/batch request.
+
+Sends ``--prompts`` prompts (``--duplicates`` of them repeats of earlier
+ones) to the Flask app served over HTTP, backed by a fake Groq server with
+``--first-token-ms`` of latency and the response cache off. Compares one
+``/api/chat`` call per prompt with a single batch request, buffered and as
+NDJSON (where the first result arrives as soon as one prompt finishes),
+and reports wall time, time to first result and upstream calls.
+
+    python benchmarks/bench_chat_batch.py --prompts 40 --concurrency 8
+"""
+import argparse
+import json
+import time
+
+import httpx
+
+from common import import_app, serve_wsgi
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prompts', type=int, default=40)
+    parser.add_argument('--duplicates', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--first-token-ms', type=float, default=300.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(config=FakeGroqConfig(first_token_ms=args.first_token_ms, tokens_per_sec=500, n_tokens=20))
+    fake.start_background()
+    main_mod = import_app(GROQ_API_KEY='bench-fake-key', GROQ_BASE_URL=fake.base_url, AI_CACHE_SIZE=0,
+                          RATE_LIMITS=0, STARTUP_CHECKS=0, AI_BATCH_CONCURRENCY=args.concurrency)
+    _, base = serve_wsgi(main_mod.app)
+    http = httpx.Client(timeout=120)
+
+    distinct = args.prompts - args.duplicates
+    prompts = [f'Question number {i}' for i in range(distinct)]
+    prompts += [prompts[i % distinct] for i in range(args.duplicates)]
+    results = {}
+
+    def run(name, fn):
+        before = fake.requests_served
+        start = time.perf_counter()
+        first = fn()
+        results[name] = {'wall_ms': (time.perf_counter() - start) * 1000,
+                         'first_result_ms': (first - start) * 1000,
+                         'upstream_calls': fake.requests_served - before}
+
+    def sequential():
+        first = None
+        for p in prompts:
+            r = http.post(f'{base}/api/chat', json={'message': p})
+            assert r.is_success and r.json()['response']
+            first = first or time.perf_counter()
+        return first
+
+    def batch():
+        r = http.post(f'{base}/api/chat/batch', json={'items': prompts})
+        assert r.is_success and all('response' in line for line in r.json()['results'])
+        return time.perf_counter()
+
+    def batch_stream():
+        first, seen = None, 0
+        with http.stream('POST', f'{base}/api/chat/batch', json={'items': prompts, 'stream': True}) as r:
+            for raw in r.iter_lines():
+                line = json.loads(raw)
+                if 'response' in line:
+                    seen += 1
+                    first = first or time.perf_counter()
+        assert seen == len(prompts)
+        return first
+
+    # Each run uses fresh prompt text so coalescing never spans runs
+    for name, fn in (('sequential', sequential), ('batch', batch), ('batch ndjson', batch_stream)):
+        prompts = [f'{name}: {p}' for p in prompts]
+        run(name, fn)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.prompts} prompts ({args.duplicates} repeats), concurrency {args.concurrency}, "
+          f"{args.first_token_ms:.0f}ms upstream latency")
+    print(f"{'':<14} {'wall':>9} {'first':>9} {'upstream':>9}")
+    for name, r in results.items():
+        print(f"{name:<14} {r['wall_ms']:>7.0f}ms {r['first_result_ms']:>7.0f}ms {r['upstream_calls']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Time-to-first-token and total latency: buffered ``/api/chat`` vs SSE ``/api/chat/stream``.
+
+Boots the Flask app against a local fake Groq server so no API key or
+network is needed:
+
+    python benchmarks/bench_chat_stream.py --requests 10 --first-token-ms 400 --tokens-per-sec 80
+"""
+import argparse
+import http.client
+import json
+import time
+from urllib.parse import urlparse
+
+from common import import_app, serve_wsgi, summarize
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+
+def _post(base_url, path, payload):
+    """POST and return (ttft, total) in seconds; TTFT is the first SSE token or the full body."""
+    u = urlparse(base_url)
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=60)
+    body = json.dumps(payload)
+    start = time.perf_counter()
+    conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+    resp = conn.getresponse()
+    ttft = None
+    if resp.getheader('Content-Type', '').startswith('text/event-stream'):
+        while True:
+            line = resp.readline()
+            if not line:
+                break
+            if ttft is None and line.startswith(b'data: ') and b'"token"' in line:
+                ttft = time.perf_counter() - start
+    else:
+        resp.read()
+    total = time.perf_counter() - start
+    conn.close()
+    return (ttft if ttft is not None else total), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--first-token-ms', type=float, default=400.0)
+    parser.add_argument('--tokens-per-sec', type=float, default=80.0)
+    parser.add_argument('--tokens', type=int, default=120)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(config=FakeGroqConfig(args.first_token_ms, args.tokens_per_sec, args.tokens)).start_background()
+    main_mod = import_app(GROQ_API_KEY='bench-fake-key', GROQ_BASE_URL=fake.base_url, AI_CACHE_SIZE=0)
+    _, base_url = serve_wsgi(main_mod.app)
+
+    results = {}
+    for label, path in (('buffered', '/api/chat'), ('stream', '/api/chat/stream')):
+        ttfts, totals = [], []
+        for _ in range(args.requests):
+            ttft, total = _post(base_url, path, {'message': 'Say hi'})
+            ttfts.append(ttft * 1000)
+            totals.append(total * 1000)
+        results[label] = {'ttft_ms': summarize(ttfts), 'total_ms': summarize(totals)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<10}{'ttft p50':>12}{'ttft p95':>12}{'total p50':>12}{'total p95':>12}")
+    for label, r in results.items():
+        print(f"{label:<10}{r['ttft_ms']['p50']:>10.1f}ms{r['ttft_ms']['p95']:>10.1f}ms"
+              f"{r['total_ms']['p50']:>10.1f}ms{r['total_ms']['p95']:>10.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
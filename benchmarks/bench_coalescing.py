@@ -0,0 +1,105 @@
+"""Upstream calls saved by coalescing identical in-flight prompts.
+
+Fires a burst of ``--requests`` concurrent chats drawn from ``--prompts``
+distinct starter prompts at a fake Groq server, with the response cache
+off so every saving comes from coalescing. Runs once with coalescing and
+once without, buffered or ``--stream`` and on the thread or ``--async``
+path, and reports the upstream calls made and the latency seen by clients.
+
+    python benchmarks/bench_coalescing.py --requests 200 --prompts 5 --stream
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import import_app, summarize
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+STARTERS = [
+    'Explain quantum computing in simple terms',
+    'Write a poem about the ocean',
+    'Give me three dinner ideas',
+    'How do I center a div in CSS?',
+    'Summarize the plot of Hamlet',
+    'What is the capital of Australia?',
+    'Suggest a name for my cat',
+    'Tell me a fun fact about space',
+]
+
+
+def run_threads(model, prompts, stream, concurrency):
+    def one(prompt):
+        start = time.perf_counter()
+        if stream:
+            text = ''.join(model.process_stream('chat', prompt))
+        else:
+            text = model.process('chat', prompt)
+        assert text
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, prompts))
+
+
+async def run_async(model, prompts, stream):
+    async def one(prompt):
+        start = time.perf_counter()
+        if stream:
+            text = ''.join([t async for t in model.aprocess_stream('chat', prompt)])
+        else:
+            text = await model.aprocess('chat', prompt)
+        assert text
+        return (time.perf_counter() - start) * 1000
+
+    return await asyncio.gather(*(one(p) for p in prompts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--prompts', type=int, default=5, help='distinct prompts in the burst')
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--async', dest='use_async', action='store_true')
+    parser.add_argument('--first-token-ms', type=float, default=400.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(config=FakeGroqConfig(first_token_ms=args.first_token_ms, tokens_per_sec=200, n_tokens=40))
+    fake.start_background()
+    import_app(GROQ_API_KEY='bench-fake-key', GROQ_BASE_URL=fake.base_url)
+    import ai_model
+
+    rng = random.Random(7)
+    prompts = [rng.choice(STARTERS[:args.prompts]) for _ in range(args.requests)]
+    # Vary whitespace and case: normalization maps these onto the same key
+    prompts = [p.upper() if i % 3 == 0 else f"  {p} " for i, p in enumerate(prompts)]
+
+    results = {}
+    for coalesce in (False, True):
+        model = ai_model.AIModel(cache=ai_model.ResponseCache(maxsize=0), coalesce=coalesce)
+        before = fake.requests_served
+        if args.use_async:
+            ai_model._async_client = None  # the pooled client is bound to the loop that created it
+            latencies = asyncio.run(run_async(model, prompts, args.stream))
+        else:
+            latencies = run_threads(model, prompts, args.stream, concurrency=args.requests)
+        results['coalesced' if coalesce else 'independent'] = {
+            'upstream_calls': fake.requests_served - before,
+            'latency_ms': summarize(latencies),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    mode = f"{'async' if args.use_async else 'threads'}, {'stream' if args.stream else 'buffered'}"
+    print(f"{args.requests} requests over {args.prompts} prompts ({mode})")
+    print(f"{'':<12} {'upstream':>9} {'p50':>8} {'p95':>8}")
+    for name, r in results.items():
+        print(f"{name:<12} {r['upstream_calls']:>9} {r['latency_ms']['p50']:>6.0f}ms {r['latency_ms']['p95']:>6.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Cold start: process start to first served request.
+
+Starts ``--runs`` fresh interpreters that import the app and serve one
+request through the test client, against a fake Stripe that adds
+``--stripe-ms`` per call. The first run starts with an empty price cache;
+later runs reuse it. Reports import time, time to first response and when
+the background startup checks finished.
+
+    python benchmarks/bench_cold_start.py --runs 5 --stripe-ms 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import ROOT, summarize
+from fake_stripe import FakeStripeServer
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, 'benchmarks')
+from common import import_app
+main = import_app()
+t_import = time.perf_counter()
+r = main.app.test_client().get('/api/stripe-config')
+assert r.status_code == 200, r.status_code
+t_first = time.perf_counter()
+main.STARTUP.wait(30)
+t_checks = time.perf_counter()
+print(json.dumps({'import_ms': (t_import - t0) * 1000, 'first_request_ms': (t_first - t0) * 1000,
+                  'checks_done_ms': (t_checks - t0) * 1000}))
+"""
+
+
+def run_child(env):
+    out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--stripe-ms', type=float, default=300.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    stripe = FakeStripeServer(latency_ms=args.stripe_ms).start_background()
+    cache_file = os.path.join(tempfile.mkdtemp(), 'stripe_prices.json')
+    env = dict(os.environ, STORAGE_BACKEND='memory', GROQ_API_KEY='bench-fake-key',
+               PRICE_CACHE_FILE=cache_file, **stripe.env())
+
+    runs = []
+    for i in range(args.runs):
+        before = stripe.requests_served
+        result = run_child(env)
+        result['stripe_calls'] = stripe.requests_served - before
+        runs.append(result)
+
+    results = {
+        'cold': runs[0],
+        'warm': {k: summarize([r[k] for r in runs[1:]]) for k in ('import_ms', 'first_request_ms', 'checks_done_ms')},
+        'serial_validation_estimate_ms': 3 * args.stripe_ms,
+        'runs': runs,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'run':>4} {'import':>9} {'first req':>10} {'checks':>9} {'stripe calls':>13}")
+    for i, r in enumerate(runs):
+        print(f"{i:>4} {r['import_ms']:>7.0f}ms {r['first_request_ms']:>8.0f}ms {r['checks_done_ms']:>7.0f}ms "
+              f"{r['stripe_calls']:>13}")
+    print(f"(validating 3 prices serially at import used to add ~{3 * args.stripe_ms:.0f}ms before the first request)")
+
+
+if __name__ == '__main__':
+    main()
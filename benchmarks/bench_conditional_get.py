@@ -0,0 +1,67 @@
+"""Bytes and time per conversation read: full body, gzip, and a 304 revalidation.
+
+Saves ``--conversations`` chats of ``--turns`` turns for one user, then
+times GET /api/conversations (a page of ``--limit``) and GET
+/api/conversations/<id> through the Flask test client, three ways: no
+Accept-Encoding, gzip, and a revalidation carrying the ETag from a
+previous response. Also times /api/stripe-config, which is now a
+prebuilt body.
+
+    python benchmarks/bench_conditional_get.py --conversations 200 --turns 20 --requests 500
+"""
+import argparse
+import json
+import time
+
+from common import import_app, summarize
+
+
+def timed(client, url, headers, n):
+    samples, size, status = [], 0, None
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        samples.append((time.perf_counter() - start) * 1e6)
+        size, status = len(response.data), response.status_code
+    return {'status': status, 'bytes': size, 'us': summarize(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    main_module = import_app(STRIPE_PUBLISHABLE_KEY='pk_test_bench')
+    client = main_module.app.test_client()
+    auth = {'Authorization': f"Bearer {main_module.SESSIONS.issue('bench')['access_token']}"}
+    for i in range(args.conversations):
+        client.post('/api/conversations', headers=auth, json={'id': f'c{i}', 'title': f'Chat {i}',
+                                                              'user': 'How do I profile a Python web app?',
+                                                              'ai': 'Start with...'})
+        main_module.CONVERSATIONS.append_messages(f'c{i}', [
+            (role, f'{role} message {t} about profiling, flame graphs and sampling overhead ' * 4)
+            for t in range(args.turns) for role in ('user', 'assistant')])
+
+    results = {}
+    for name, url in (('list', f'/api/conversations?limit={args.limit}'),
+                      ('conversation', '/api/conversations/c7'),
+                      ('stripe_config', '/api/stripe-config')):
+        etag = client.get(url, headers=auth).headers['ETag']
+        results[f'{name}_full'] = timed(client, url, auth, args.requests)
+        results[f'{name}_gzip'] = timed(client, url, {'Accept-Encoding': 'gzip', **auth}, args.requests)
+        results[f'{name}_304'] = timed(client, url, {'If-None-Match': etag, **auth}, args.requests)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for key, value in results.items():
+        print(f"{key:<22} {value['status']}  {value['bytes']:>8} B  p50 {value['us']['p50']:>8.1f}us  "
+              f"p95 {value['us']['p95']:>8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Streaming NDJSON export/import throughput and memory for conversation history.
+
+Exports ``--conversations`` synthetic chats (``--turns`` turns each),
+made one at a time by a generator, through the same ndjson_chunks /
+gzip_chunks pipeline as /api/conversations/export and the CLI, into a
+temporary .ndjson.gz. The export runs twice: once timed, once under
+tracemalloc with the peak sampled at 1%, 10% and 100% of the records,
+to show that memory stays flat. The file is then read back through
+ndjson_lines / import_lines into a fresh SQLite store. ``--import-count``
+records are saved in IMPORT_BATCH_SIZE batches, and ``--single-count``
+records one commit each, for comparison.
+
+    python benchmarks/bench_export.py --conversations 1000000 --turns 4 --import-count 100000
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import common  # noqa: F401  (puts py_system on sys.path)
+from context_window import make_message
+from conversation_transfer import (IMPORT_BATCH_SIZE, gzip_chunks, import_lines, ndjson_chunks, ndjson_lines,
+                                   read_chunks)
+from storage import SQLiteBackend
+
+
+def synthetic(n, turns):
+    for i in range(n):
+        messages = [make_message(role, f'{role} turn {t} of chat {i}: how do generators keep memory flat?')
+                    for t in range(turns) for role in ('user', 'assistant')]
+        yield {'id': f'c{i}', 'owner': f'user{i % 5000}', 'title': f'Chat {i}', 'user': messages[0]['content'],
+               'ai': messages[1]['content'] if turns else '', 'ts': 1.7e9 + i, 'messages': messages,
+               'token_count': sum(m['tokens'] for m in messages)}
+
+
+def export(path, records):
+    with open(path, 'wb') as out:
+        for chunk in gzip_chunks(ndjson_chunks(records)):
+            out.write(chunk)
+
+
+def peaks(n, turns, path):
+    # Records pass one at a time; the peak after 1% of them should match the peak after all
+    marks = {max(1, n // 100): '1%', max(1, n // 10): '10%', n: '100%'}
+    sampled = {}
+
+    def watched():
+        for i, record in enumerate(synthetic(n, turns), 1):
+            yield record
+            if i in marks:
+                sampled[marks[i]] = tracemalloc.get_traced_memory()[1] / 1024
+
+    tracemalloc.start()
+    export(path, watched())
+    tracemalloc.stop()
+    return sampled
+
+
+def timed_import(path, db, count, batch_size):
+    backend = SQLiteBackend(db)
+    start = time.perf_counter()
+    with open(path, 'rb') as source:
+        lines = itertools.islice(ndjson_lines(read_chunks(source)), count)
+        result = import_lines(lines, backend.save_conversations, keep_owner=True, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    backend.close()
+    return {'records': result.imported, 'failed': result.failed, 'seconds': elapsed,
+            'records_per_s': result.imported / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversations', type=int, default=1_000_000)
+    parser.add_argument('--turns', type=int, default=4)
+    parser.add_argument('--import-count', type=int, default=100_000)
+    parser.add_argument('--single-count', type=int, default=2_000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.ndjson.gz')
+        start = time.perf_counter()
+        export(path, synthetic(args.conversations, args.turns))
+        elapsed = time.perf_counter() - start
+        results['export'] = {'records': args.conversations, 'seconds': elapsed,
+                             'records_per_s': args.conversations / elapsed,
+                             'gzip_mb': os.path.getsize(path) / 1e6}
+        results['export_peak_kib'] = peaks(args.conversations, args.turns, os.path.join(tmp, 'again.ndjson.gz'))
+        results['import_batched'] = timed_import(path, os.path.join(tmp, 'batched.db'), args.import_count,
+                                                 IMPORT_BATCH_SIZE)
+        results['import_one_per_commit'] = timed_import(path, os.path.join(tmp, 'single.db'), args.single_count, 1)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    e = results['export']
+    print(f"export   {e['records']:>9} records in {e['seconds']:.1f}s ({e['records_per_s']:,.0f}/s), "
+          f"{e['gzip_mb']:.1f} MB gzip")
+    print('export peak traced memory (KiB) at', ', '.join(f'{k}: {v:,.0f}' for k, v in results['export_peak_kib'].items()))
+    for key in ('import_batched', 'import_one_per_commit'):
+        r = results[key]
+        print(f"{key:<22} {r['records']:>8} records in {r['seconds']:.1f}s ({r['records_per_s']:,.0f}/s)")
+
+
+if __name__ == '__main__':
+    main()
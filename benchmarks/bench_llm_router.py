@@ -0,0 +1,118 @@
+"""LLM router under injected latency and failures.
+
+Starts three fake providers and drives ``--requests`` buffered chat
+completions per phase at ``--concurrency``:
+
+* ``primary``   fastest, but ``--slow-rate`` of its calls take ``--slow-ms`` longer
+* ``secondary`` steady and a bit slower
+* ``flaky``     fast but fails ``--flaky-errors`` of its calls
+
+Phases: normal traffic, a primary outage (every call fails), then recovery
+once the breaker cooldown has passed. Each phase runs against three
+set-ups: primary only (the old behaviour), routed with failover, and routed
+with failover plus hedging. Reports success rate, latency percentiles and
+which backends served the traffic.
+
+    python benchmarks/bench_llm_router.py --requests 200 --concurrency 16
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+MODEL = 'bench-model'
+
+
+def run_phase(router, n, concurrency):
+    latencies, failures = [], 0
+    messages = [{'role': 'user', 'content': 'hi'}]
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            router.complete(MODEL, messages, 0.7)
+            return time.perf_counter() - start
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(one, range(n)):
+            if result is None:
+                failures += 1
+            else:
+                latencies.append(result * 1000)
+    return {'ok': len(latencies) / n, 'latency_ms': common.summarize(latencies), 'failures': failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--slow-rate', type=float, default=0.04)
+    parser.add_argument('--slow-ms', type=float, default=1500.0)
+    parser.add_argument('--flaky-errors', type=float, default=0.3)
+    parser.add_argument('--cooldown', type=float, default=2.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    os.environ['LLM_BREAKER_COOLDOWN'] = str(args.cooldown)
+    from llm_router import GroqProvider, LLMRouter
+
+    configs = {
+        'primary': FakeGroqConfig(first_token_ms=150, tokens_per_sec=400, n_tokens=20,
+                                  slow_rate=args.slow_rate, slow_ms=args.slow_ms),
+        'secondary': FakeGroqConfig(first_token_ms=300, tokens_per_sec=400, n_tokens=20),
+        'flaky': FakeGroqConfig(first_token_ms=100, tokens_per_sec=400, n_tokens=20, error_rate=args.flaky_errors),
+    }
+    servers = {name: FakeGroqServer(config=cfg).start_background() for name, cfg in configs.items()}
+
+    def build(routes, hedge):
+        providers = [GroqProvider(name, base_url=servers[name].base_url, api_key='bench') for name in routes]
+        router = LLMRouter(providers[0], hedge=hedge)
+        for p in providers[1:]:
+            router.add_provider(p)
+        router.set_route(MODEL, routes)
+        return router
+
+    setups = {
+        'primary only': build(['primary'], hedge=False),
+        'failover': build(['primary', 'secondary', 'flaky'], hedge=False),
+        'failover+hedge': build(['primary', 'secondary', 'flaky'], hedge=True),
+    }
+    phases = [('normal', 0.0), ('primary outage', 1.0), ('recovered', 0.0)]
+
+    results = {}
+    for setup, router in setups.items():
+        results[setup] = {}
+        for phase, primary_errors in phases:
+            configs['primary'].error_rate = primary_errors
+            if phase == 'recovered':
+                time.sleep(args.cooldown)
+            before = {b.provider.name: b.requests - b.errors for b in router.backends(MODEL)}
+            r = run_phase(router, args.requests, args.concurrency)
+            r['served_by'] = {b.provider.name: b.requests - b.errors - before[b.provider.name]
+                              for b in router.backends(MODEL)}
+            results[setup][phase] = r
+        results[setup]['router'] = router.stats()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'setup':<16} {'phase':<15} {'ok':>6} {'p50':>8} {'p95':>8} {'p99':>8}  served by")
+    for setup, by_phase in results.items():
+        for phase, _ in phases:
+            r = by_phase[phase]
+            lat = r['latency_ms']
+            served = ' '.join(f"{k}={v}" for k, v in r['served_by'].items() if v)
+            print(f"{setup:<16} {phase:<15} {r['ok']:>6.0%} {lat['p50']:>6.0f}ms {lat['p95']:>6.0f}ms "
+                  f"{lat['p99']:>6.0f}ms  {served}")
+        stats = by_phase['router']
+        print(f"{'':<16} hedges={stats['hedges']} hedge_wins={stats['hedge_wins']} failovers={stats['failovers']}")
+
+
+if __name__ == '__main__':
+    main()
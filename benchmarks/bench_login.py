@@ -0,0 +1,77 @@
+"""Login throughput through the hashing pool, per worker count.
+
+Each run creates users, then hammers ``/api/auth/login`` from
+``--clients`` threads (default: as many as the queue admits) and reports
+logins/sec overall and per hashing worker. Requests rejected with 429
+(queue full) are counted separately.
+
+    python benchmarks/bench_login.py --workers 1 2 4 --logins 400
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import import_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--clients', type=int)
+    parser.add_argument('--iterations', type=int, default=100_000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    main_mod = import_app(GROQ_API_KEY='bench-fake-key', PBKDF2_ITERATIONS=args.iterations)
+    from password_hashing import PasswordHasher
+
+    client = main_mod.app.test_client()
+    for i in range(args.users):
+        client.post('/api/auth/signup', json={'username': f"bench{i}", 'password': 'pw'})
+
+    results = []
+    for workers in args.workers:
+        main_mod.HASHER.shutdown()
+        max_pending = max(workers, 1) * 8
+        clients = args.clients or max_pending
+        main_mod.HASHER = PasswordHasher(iterations=args.iterations, workers=workers, max_pending=max_pending)
+        # Warm the pool so process start-up is not measured
+        main_mod.HASHER.hash('warmup')
+        statuses = []
+
+        def one(i):
+            r = main_mod.app.test_client().post('/api/auth/login',
+                                                json={'username': f"bench{i % args.users}", 'password': 'pw'})
+            statuses.append(r.status_code)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(one, range(args.logins)))
+        elapsed = time.perf_counter() - t0
+        ok = statuses.count(200)
+        results.append({
+            'workers': workers,
+            'clients': clients,
+            'logins_per_s': ok / elapsed,
+            'logins_per_s_per_worker': ok / elapsed / max(workers, 1),
+            'ok': ok,
+            'rejected_429': statuses.count(429),
+        })
+    main_mod.HASHER.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"PBKDF2-SHA256 x{args.iterations}")
+    print(f"{'workers':>8}{'clients':>8}{'logins/s':>12}{'per worker':>12}{'ok':>8}{'429':>8}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['clients']:>8}{r['logins_per_s']:>12.1f}{r['logins_per_s_per_worker']:>12.1f}"
+              f"{r['ok']:>8}{r['rejected_429']:>8}")
+
+
+if __name__ == '__main__':
+    main()
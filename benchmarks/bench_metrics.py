@@ -0,0 +1,79 @@
+"""Per-call cost of the metrics and logging added to the hot paths.
+
+Times histogram observations and counter increments, a full /metrics
+render, and a log call through the queue handler versus a synchronous
+StreamHandler writing to a stream that stalls for ``--write-ms`` per line
+(a slow terminal, a blocked pipe).
+
+    python benchmarks/bench_metrics.py --ops 200000 --log-calls 200 --write-ms 2
+"""
+import argparse
+import json
+import logging
+import time
+
+import common  # noqa: F401  (puts py_system on sys.path)
+import logs
+from metrics import Registry
+
+
+class SlowStream:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def per_call_us(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=200000)
+    parser.add_argument('--log-calls', type=int, default=200)
+    parser.add_argument('--write-ms', type=float, default=2.0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    registry = Registry()
+    hist = registry.histogram('bench_seconds', 'bench', ('route', 'status'))
+    counter = registry.counter('bench_total', 'bench', ('model',))
+    for i in range(50):
+        hist.observe(0.01 * i, route=f'/r{i}', status=200)
+    results = {
+        'histogram_observe_us': per_call_us(lambda: hist.observe(0.042, route='/api/chat', status=200), args.ops),
+        'counter_inc_us': per_call_us(lambda: counter.inc(12, model='llama-3.1-8b-instant'), args.ops),
+        'render_ms': per_call_us(registry.render, 200) / 1000,
+    }
+
+    slow = SlowStream(args.write_ms / 1000)
+    sync_logger = logging.getLogger('bench.sync')
+    sync_logger.propagate = False
+    sync_logger.setLevel(logging.INFO)
+    sync_logger.addHandler(logging.StreamHandler(slow))
+    results['log_sync_us'] = per_call_us(lambda: sync_logger.info('chat served', extra={'plan': 'pro'}),
+                                         args.log_calls)
+
+    logs.LOG_QUEUE_SIZE = args.log_calls * 2
+    logs.setup_logging(level='INFO', stream=slow)
+    queued_logger = logging.getLogger('bench.queued')
+    results['log_queued_us'] = per_call_us(lambda: queued_logger.info('chat served', extra={'plan': 'pro'}),
+                                           args.log_calls)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for key, value in results.items():
+        print(f"{key:<24}{value:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
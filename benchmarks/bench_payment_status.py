@@ -0,0 +1,111 @@
+"""Stripe calls and latency of /api/payment-status polling after checkout.
+
+Simulates ``--sessions`` checkouts whose frontend polls payment-status
+``--polls`` times each against a stub Stripe client that charges
+``--stripe-ms`` per call. Each session turns paid after a few polls, either
+reported by a checkout.session.completed webhook or, with ``--no-webhooks``,
+only visible by asking Stripe. The old handler made two Stripe calls per
+poll.
+
+    python benchmarks/bench_payment_status.py --sessions 100 --polls 8 --stripe-ms 150
+"""
+import argparse
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from common import import_app, summarize
+
+
+class StubStripe:
+    """Just enough of the stripe module for the subscription mirror."""
+
+    def __init__(self, delay_ms, price_id):
+        self.delay = delay_ms / 1000.0
+        self.items = {'data': [{'price': {'id': price_id}}]}
+        self.paid = set()
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.checkout = SimpleNamespace(Session=SimpleNamespace(retrieve=self._session))
+        self.Subscription = SimpleNamespace(retrieve=self._subscription)
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+
+    def _subscription(self, sub_id):
+        self._count()
+        return {'id': sub_id, 'status': 'active', 'customer': 'cus_' + sub_id[4:], 'items': self.items}
+
+    def _session(self, session_id, expand=None):
+        self._count()
+        n = session_id[3:]
+        paid = session_id in self.paid
+        sub = {'id': f"sub_{n}", 'status': 'active', 'customer': f"cus_{n}", 'items': self.items} if paid else None
+        return {'id': session_id, 'payment_status': 'paid' if paid else 'unpaid',
+                'customer': f"cus_{n}", 'subscription': sub, 'metadata': {'username': f"poll{n}"}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--polls', type=int, default=8)
+    parser.add_argument('--paid-after', type=int, default=3, help='polls before the payment completes')
+    parser.add_argument('--stripe-ms', type=float, default=150.0)
+    parser.add_argument('--no-webhooks', action='store_true')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    main_mod = import_app(GROQ_API_KEY='bench-fake-key', STRIPE_PENDING_TTL=0)
+    stub = StubStripe(args.stripe_ms, main_mod.SUBSCRIPTION_PRICES['pro'])
+    main_mod.SUBSCRIPTIONS.stripe = stub
+    client = main_mod.app.test_client()
+    for i in range(args.sessions):
+        main_mod.USERS.add(main_mod.UserRecord(f"poll{i}", 'x', None))
+
+    latencies = []
+
+    def poll(i):
+        session_id = f"cs_{i}"
+        headers = {'Authorization': f"Bearer {main_mod.SESSIONS.issue(f'poll{i}')['access_token']}"}
+        for n in range(args.polls):
+            if n == args.paid_after:
+                stub.paid.add(session_id)
+                if not args.no_webhooks:
+                    main_mod.STRIPE_EVENTS.process({
+                        'id': f"evt_{i}", 'type': 'checkout.session.completed', 'created': time.time(),
+                        'data': {'object': {'id': session_id, 'payment_status': 'paid', 'customer': f"cus_{i}",
+                                            'subscription': f"sub_{i}", 'metadata': {'username': f"poll{i}"}}}})
+            s = time.perf_counter()
+            r = client.post('/api/payment-status', json={'session_id': session_id}, headers=headers)
+            latencies.append((time.perf_counter() - s) * 1000)
+            assert r.status_code == 200, r.get_data(as_text=True)
+        r = client.get(f"/api/user-subscription/poll{i}", headers=headers)
+        assert r.get_json()['payment'] is True, r.get_json()
+
+    threads = [threading.Thread(target=poll, args=(i,)) for i in range(args.sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    total_polls = args.sessions * args.polls
+    results = {
+        'polls': total_polls,
+        'stripe_calls': stub.calls,
+        'stripe_calls_before': 2 * total_polls,
+        'poll_ms': summarize(latencies),
+        'mirror': main_mod.SUBSCRIPTIONS.stats(),
+        'webhooks': not args.no_webhooks,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{total_polls} polls -> {stub.calls} Stripe calls (previously {2 * total_polls})")
+    print(f"poll p50 {results['poll_ms']['p50']:.1f}ms  p95 {results['poll_ms']['p95']:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
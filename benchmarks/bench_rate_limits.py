@@ -0,0 +1,94 @@
+"""Cost and behaviour of the chat rate limiter.
+
+Measures what one admission check (``RateLimiter.check``) plus a usage
+charge costs per request with the in-process counter store and with the
+shared SQLite store, across ``--threads`` threads and ``--users`` distinct
+users. Then drives ``/api/chat`` on the Flask app (against a fake Groq
+server) with a burst from one free-plan user and shows how many requests
+were admitted, how many got a 429, and the Retry-After handed back.
+
+    python benchmarks/bench_rate_limits.py --checks 20000 --threads 8
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import import_app, summarize
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+
+def bench_store(store, checks, threads, users):
+    from rate_limits import RateLimiter
+    # Plans large enough that every check is admitted: this measures bookkeeping, not denials
+    plans = {'free': {'per_minute': 10 ** 9, 'burst': 10 ** 9, 'daily_tokens': 10 ** 12}}
+    limiter = RateLimiter(store, plans=plans, ip_limit={'per_minute': 10 ** 9, 'burst': 10 ** 9})
+
+    def one(i):
+        start = time.perf_counter()
+        user = f"user{i % users}"
+        limiter.check(user, f"10.0.{i % 250}.1", 'free')
+        limiter.charge(user, None, 50)
+        return (time.perf_counter() - start) * 1e6
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(checks)))
+    elapsed = time.perf_counter() - start
+    return {'checks_per_sec': checks / elapsed, 'latency_us': summarize(latencies)}
+
+
+def bench_enforcement(main, fake, burst):
+    client = main.app.test_client()
+    # Limits follow the access token, not a username in the body
+    headers = {'Authorization': f"Bearer {main.SESSIONS.issue('bench-free-user')['access_token']}"}
+    statuses, retry_after = {}, set()
+    for i in range(burst):
+        resp = client.post('/api/chat', json={'message': f'hello {i}'}, headers=headers)
+        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+        if resp.status_code == 429:
+            retry_after.add(resp.headers.get('Retry-After'))
+    quota = client.get('/api/quota', headers=headers).get_json()
+    return {'statuses': statuses, 'retry_after': sorted(retry_after), 'quota': quota,
+            'upstream_calls': fake.requests_served}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--burst', type=int, default=20, help='back-to-back chats from one free user')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(config=FakeGroqConfig(first_token_ms=5, tokens_per_sec=5000, n_tokens=10))
+    fake.start_background()
+    app_main = import_app(GROQ_API_KEY='bench-fake-key', GROQ_BASE_URL=fake.base_url, STARTUP_CHECKS='0')
+    from rate_limits import MemoryCounterStore, SQLiteCounterStore
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = {'memory': MemoryCounterStore(), 'sqlite': SQLiteCounterStore(os.path.join(tmp, 'limits.db'))}
+        for name, store in stores.items():
+            results[name] = bench_store(store, args.checks, args.threads, args.users)
+    results['enforcement'] = bench_enforcement(app_main, fake, args.burst)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.checks} checks, {args.threads} threads, {args.users} users")
+    print(f"{'store':<8} {'checks/s':>10} {'p50':>8} {'p99':>8}")
+    for name in ('memory', 'sqlite'):
+        r = results[name]
+        print(f"{name:<8} {r['checks_per_sec']:>10.0f} {r['latency_us']['p50']:>6.0f}us {r['latency_us']['p99']:>6.0f}us")
+    e = results['enforcement']
+    print(f"\n{args.burst} chats from one free user: statuses={e['statuses']} retry_after={e['retry_after']} "
+          f"upstream={e['upstream_calls']}")
+    print(f"quota: {e['quota'].get('used_tokens')} of {e['quota'].get('daily_tokens')} tokens used")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Conversation search latency with the inverted index versus a linear scan.
+
+Builds ``--conversations`` synthetic chats (Zipf-distributed words) spread
+over ``--users`` owners, plus one heavy owner with ``--heavy`` chats, in a
+ConversationStore. Reports the heavy owner's first search, which indexes
+their history, then times single-word, two-word and prefix queries for a
+typical and for the heavy owner. The baseline lowercases and scans
+every title/user/ai field, as a search without an index would have to.
+
+    python benchmarks/bench_search.py --conversations 100000 --users 2000 --heavy 10000 --queries 200
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from common import summarize
+from conversation_store import ConversationStore
+
+WORDS = [f'w{i}' for i in range(20000)] + ['python', 'recursion', 'recursive', 'pizza', 'stripe', 'invoice',
+                                           'docker', 'kubernetes', 'async', 'database']
+
+
+def sentence(rng, n):
+    # Zipf-ish: a few words are very common, most are rare
+    return ' '.join(WORDS[min(int(rng.paretovariate(1.1)) - 1, len(WORDS) - 1)] if rng.random() < 0.9
+                    else rng.choice(WORDS[-10:]) for _ in range(n))
+
+
+def build(args, rng):
+    store = ConversationStore()
+    items = []
+    owners = [f'user{i}' for i in range(args.users)]
+    for i in range(args.conversations):
+        owner = 'heavy' if i < args.heavy else rng.choice(owners)
+        item = {'id': f'c{i}', 'owner': owner, 'title': sentence(rng, 5), 'user': sentence(rng, 20),
+                'ai': sentence(rng, 60), 'ts': float(i)}
+        store.save(item)
+        items.append(item)
+    return store, items
+
+
+def linear_search(items, owner, query):
+    terms = query.lower().split()
+    return [item for item in items if item.get('owner') == owner
+            and all(t in f"{item['title']} {item['user']} {item['ai']}".lower() for t in terms)]
+
+
+def timed_ms(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversations', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--heavy', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--linear-queries', type=int, default=5)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    store, items = build(args, rng)
+    # The heavy owner's partition is indexed on their first search
+    tracemalloc.start()
+    start = time.perf_counter()
+    store.search('heavy', 'python', 20)
+    results = {'heavy_first_search_s': time.perf_counter() - start,
+               'index_bytes_per_conversation': tracemalloc.get_traced_memory()[0] / args.heavy}
+    tracemalloc.stop()
+
+    kinds = {
+        'one_word': lambda: rng.choice(WORDS[-10:]),
+        'two_words': lambda: f"{rng.choice(WORDS[-10:])} {rng.choice(WORDS[:50])}",
+        'prefix': lambda: rng.choice(['recur', 'pyth', 'dock', 'w12', 'as']),
+    }
+    for owner in ('user7', 'heavy'):
+        for kind, make in kinds.items():
+            queries = [make() for _ in range(args.queries)]
+            results[f'{owner}_{kind}_ms'] = timed_ms(lambda q: store.search(owner, q, 20), queries)
+    linear = [rng.choice(WORDS[-10:]) for _ in range(args.linear_queries)]
+    results['linear_scan_ms'] = timed_ms(lambda q: linear_search(items, 'heavy', q), linear)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"heavy owner's first search (builds their index) {results['heavy_first_search_s']:.2f}s, "
+          f"{results['index_bytes_per_conversation']:.0f} index bytes/conversation")
+    for key, value in results.items():
+        if isinstance(value, dict):
+            print(f"{key:<28} p50 {value['p50']:>8.2f}  p95 {value['p95']:>8.2f}  p99 {value['p99']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Cost of authenticating a request: signed token versus re-checking the password.
+
+Times ``SessionTokens.verify`` for tokens already in the verification
+cache, for first-seen tokens (full HMAC check), and both again with the
+revocation set in a SQLite file as with several workers. With SQLite it
+also times cached verifies while a second instance on the same file (another
+worker) rotates a refresh token every ``--refresh-every`` verifies, which is
+what makes each process catch up on the file. The baseline is one PBKDF2
+password check at ``--iterations``, which is what re-sending credentials on
+every call would cost.
+
+    python benchmarks/bench_sessions.py --tokens 2000 --rounds 20 --iterations 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (puts py_system on sys.path)
+from password_hashing import PasswordHasher
+from sessions import MemoryRevocations, SessionTokens, SQLiteRevocations
+
+
+def per_call_us(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def measure(tokens: SessionTokens, n: int, rounds: int) -> dict:
+    issued = [tokens.issue(f'user{i}')['access_token'] for i in range(n)]
+    first = per_call_us(tokens.verify, issued)
+    cached = per_call_us(tokens.verify, issued * rounds)
+    return {'verify_first_us': first, 'verify_cached_us': cached}
+
+
+def measure_under_refresh(tokens: SessionTokens, other: SessionTokens, n: int, rounds: int, every: int) -> float:
+    issued = [tokens.issue(f'user{i}')['access_token'] for i in range(n)]
+    refresh = [other.issue(f'device{i}')['refresh_token'] for i in range(8)]
+    for token in issued:
+        tokens.verify(token)
+
+    def verify(i):
+        if i % every == 0:
+            slot = (i // every) % len(refresh)
+            refresh[slot] = other.rotate(refresh[slot])[1]['refresh_token']
+        tokens.verify(issued[i % n])
+
+    return per_call_us(verify, range(n * rounds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=100_000)
+    parser.add_argument('--refresh-every', type=int, default=10)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    secret = os.urandom(32).hex()
+    results = {'memory': measure(SessionTokens(secret, MemoryRevocations()), args.tokens, args.rounds)}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sessions.db')
+        results['sqlite'] = measure(SessionTokens(secret, SQLiteRevocations(path)), args.tokens, args.rounds)
+        results['sqlite']['verify_under_refresh_us'] = measure_under_refresh(
+            SessionTokens(secret, SQLiteRevocations(path)), SessionTokens(secret, SQLiteRevocations(path)),
+            args.tokens, args.rounds, args.refresh_every)
+
+    hasher = PasswordHasher(iterations=args.iterations, workers=0)
+    pwd_hash, salt, iterations = hasher.hash('correct horse')
+    results['pbkdf2_verify_us'] = per_call_us(lambda _: hasher.verify('correct horse', pwd_hash, salt, iterations),
+                                              range(5))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for store in ('memory', 'sqlite'):
+        for key, value in results[store].items():
+            print(f"{store + ' ' + key:<28}{value:>12.2f}")
+    print(f"{'pbkdf2 verify_us':<28}{results['pbkdf2_verify_us']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
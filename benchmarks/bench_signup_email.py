@@ -0,0 +1,68 @@
+"""Signup latency with the welcome email on the background job queue.
+
+Signs up ``--users`` accounts against a local SMTP sink that charges
+``--connect-delay-ms`` per connection, then waits for the queue to drain
+and reports signup latency, total delivery time and how many SMTP
+connections the pooled, batched mailer needed. ``--bounces`` more signups
+use addresses the sink refuses with a 550; their jobs must be parked after
+a single attempt rather than retried.
+
+    python benchmarks/bench_signup_email.py --users 50 --connect-delay-ms 300
+"""
+import argparse
+import json
+import time
+
+from common import import_app, summarize
+from fake_smtp import FakeSMTPServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--connect-delay-ms', type=float, default=300.0)
+    parser.add_argument('--bounces', type=int, default=2)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(connect_delay_ms=args.connect_delay_ms).start_background()
+    main_mod = import_app(GROQ_API_KEY='bench-fake-key', HASH_WORKERS=0, PBKDF2_ITERATIONS=1000, **smtp.env())
+    client = main_mod.app.test_client()
+
+    latencies = []
+    t0 = time.perf_counter()
+    for i in range(args.users):
+        s = time.perf_counter()
+        r = client.post('/api/auth/signup', json={'username': f"mail{i}", 'password': 'pw', 'email': f"mail{i}@example.com"})
+        latencies.append((time.perf_counter() - s) * 1000)
+        assert r.status_code == 200, r.get_data(as_text=True)
+    for i in range(args.bounces):
+        r = client.post('/api/auth/signup', json={'username': f"bounce{i}", 'password': 'pw',
+                                                 'email': f"bounce{i}@example.com"})
+        assert r.status_code == 200, r.get_data(as_text=True)
+    main_mod.JOBS.wait_idle(timeout=120)
+    delivered_s = time.perf_counter() - t0
+    dead = main_mod.JOBS.dead()
+
+    results = {
+        'signup_ms': summarize(latencies),
+        'all_delivered_s': delivered_s,
+        'messages': smtp.messages,
+        'smtp_connections': smtp.connections,
+        'inline_estimate_s': args.users * args.connect_delay_ms / 1000.0,
+        'bounced': smtp.bounced,
+        'parked': len(dead),
+        'parked_after_one_attempt': sum(1 for job in dead if job['attempts'] == 1),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"signup p50 {results['signup_ms']['p50']:.1f}ms  p95 {results['signup_ms']['p95']:.1f}ms")
+    print(f"{smtp.messages} emails delivered in {delivered_s:.2f}s over {smtp.connections} SMTP connection(s)")
+    print(f"(inline sending would have added ~{args.connect_delay_ms:.0f}ms to every signup)")
+    print(f"{results['bounced']} recipient(s) refused; {results['parked']} job(s) parked, "
+          f"{results['parked_after_one_attempt']} after a single attempt")
+
+
+if __name__ == '__main__':
+    main()
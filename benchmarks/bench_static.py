@@ -0,0 +1,127 @@
+"""Requests/sec for pages and static files: send_from_directory vs the asset manifest.
+
+Serves the same routes from a bare Flask app that hands each hit to
+``send_from_directory`` (the old handlers) and from the real app, which
+answers from the precompressed manifest. Each round fires ``--requests``
+GETs from ``--concurrency`` threads asking for gzip; the manifest is also
+measured with a warm browser cache (If-None-Match, answered 304).
+
+    python benchmarks/bench_static.py --requests 2000 --concurrency 16
+"""
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from common import ROOT, import_app, serve_wsgi
+
+PATHS = ['/', '/templates/chat.html', '/login.html', '/subscription', '/static/script.js']
+
+
+def legacy_app():
+    from flask import Flask, send_from_directory
+    templates = os.path.join(ROOT, 'templates')
+    app = Flask('legacy_static', static_folder=os.path.join(ROOT, 'static'), static_url_path='/static')
+
+    @app.route('/')
+    def index_page():
+        return send_from_directory(templates, 'index.html')
+
+    @app.route('/<path:page>')
+    def serve_template_page(page):
+        allowed_ext = ('.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.svg', '.ico', '.json')
+        if any(page.endswith(ext) for ext in allowed_ext):
+            return send_from_directory(templates, page.replace('..', ''))
+        return send_from_directory(templates, 'index.html')
+
+    @app.route('/templates/<path:page>')
+    def serve_templates_dir(page):
+        return send_from_directory(templates, page.replace('..', ''))
+
+    @app.route('/subscription')
+    def subscription_page():
+        return send_from_directory(templates, 'subscription.html')
+
+    return app
+
+
+def run(base_url, paths, total, concurrency, etags=None):
+    u = urlparse(base_url)
+    counter = iter(range(total))
+    lock = threading.Lock()
+    stats = {'bytes': 0, 'status': {}}
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            path = paths[i % len(paths)]
+            headers = {'Accept-Encoding': 'gzip, br'}
+            if etags and path in etags:
+                headers['If-None-Match'] = etags[path]
+            conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+            conn.request('GET', path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+            conn.close()
+            with lock:
+                stats['bytes'] += len(body)
+                stats['status'][resp.status] = stats['status'].get(resp.status, 0) + 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {'rps': total / elapsed, 'kb_per_request': stats['bytes'] / total / 1024, 'status': stats['status']}
+
+
+def fetch_etags(base_url, paths):
+    u = urlparse(base_url)
+    etags = {}
+    for path in paths:
+        conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+        conn.request('GET', path, headers={'Accept-Encoding': 'gzip, br'})
+        resp = conn.getresponse()
+        resp.read()
+        if resp.getheader('ETag'):
+            etags[path] = resp.getheader('ETag')
+        conn.close()
+    return etags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    main_mod = import_app(STARTUP_CHECKS=0)
+    _, legacy_url = serve_wsgi(legacy_app())
+    _, manifest_url = serve_wsgi(main_mod.app)
+    manifest_paths = PATHS + [main_mod.ASSETS.url_for('/static/script.js')]
+
+    results = {
+        'send_from_directory': run(legacy_url, PATHS, args.requests, args.concurrency),
+        'manifest': run(manifest_url, manifest_paths, args.requests, args.concurrency),
+        'manifest_304': run(manifest_url, manifest_paths, args.requests, args.concurrency,
+                            etags=fetch_etags(manifest_url, manifest_paths)),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<22}{'req/s':>10}{'KB/req':>10}  status")
+    for label, r in results.items():
+        print(f"{label:<22}{r['rps']:>10.0f}{r['kb_per_request']:>10.1f}  {r['status']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Write/read throughput of the storage backends.
+
+    python benchmarks/bench_storage.py --users 20000 --updates 20000 --conversations 20000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (puts py_system on sys.path)
+from storage import JsonlBackend, SQLiteBackend
+
+
+def _rate(n, fn):
+    t0 = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t0)
+
+
+def run(backend_factory, args):
+    backend = backend_factory()
+    users = [{'username': f"user{i}", 'password': 'x' * 64, 'salt': 's' * 32, 'name': f"User {i}",
+              'email': f"user{i}@example.com", 'subscription': 'free', 'payment': False} for i in range(args.users)]
+    convs = [{'id': f"c{i}", 'title': f"Chat {i}", 'user': 'hello ' * 20, 'ai': 'world ' * 60, 'ts': float(i)}
+             for i in range(args.conversations)]
+    row = {
+        'insert_user_per_s': _rate(len(users), lambda: [backend.insert_user(u) for u in users]),
+        'update_field_per_s': _rate(args.updates, lambda: [
+            backend.update_user(f"user{i % args.users}", {'payment': True}) for i in range(args.updates)]),
+        'save_conversation_per_s': _rate(len(convs), lambda: [backend.save_conversation(c) for c in convs]),
+    }
+    backend.close()
+    # Reopen, as on a restart, and time a full load of every record
+    t0 = time.perf_counter()
+    backend = backend_factory()
+    loaded = len(list(backend.load_users())) + len(list(backend.load_conversations()))
+    row['restart_load_per_s'] = loaded / (time.perf_counter() - t0)
+    backend.close()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, 'bench.db')
+        results['sqlite (synchronous=NORMAL)'] = run(lambda: SQLiteBackend(db), args)
+        db_full = os.path.join(tmp, 'bench_full.db')
+        results['sqlite (synchronous=FULL)'] = run(lambda: SQLiteBackend(db_full, synchronous='FULL'), args)
+        log = os.path.join(tmp, 'bench.jsonl')
+        results['jsonl (fsync)'] = run(lambda: JsonlBackend(log), args)
+        log_nofsync = os.path.join(tmp, 'bench_nofsync.jsonl')
+        results['jsonl (no fsync)'] = run(lambda: JsonlBackend(log_nofsync, fsync=False), args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    cols = ['insert_user_per_s', 'update_field_per_s', 'save_conversation_per_s', 'restart_load_per_s']
+    print(f"{'backend':<28}" + ''.join(f"{c.replace('_per_s', ''):>20}" for c in cols))
+    for name, row in results.items():
+        print(f"{name:<28}" + ''.join(f"{row[c]:>18.0f}/s" for c in cols))
+
+
+if __name__ == '__main__':
+    main()
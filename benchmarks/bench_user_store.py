@@ -0,0 +1,80 @@
+"""Lookup cost of the indexed user repository as the user count grows.
+
+Also times the old linear scan over a list of dicts for comparison (only up
+to --linear-max users, since it grows with n).
+
+    python benchmarks/bench_user_store.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import common  # noqa: F401  (puts py_system on sys.path)
+from user_store import UserRecord, UserRepository
+
+
+def build(n):
+    repo = UserRepository()
+    for i in range(n):
+        repo.add(UserRecord(username=f"user{i}", password='x' * 64, salt='s' * 32, name=f"User {i}",
+                            email=f"user{i}@example.com", stripe_customer_id=f"cus_{i:08d}"))
+    return repo
+
+
+def per_op_ns(fn, keys):
+    t0 = time.perf_counter_ns()
+    for k in keys:
+        fn(k)
+    return (time.perf_counter_ns() - t0) / len(keys)
+
+
+def linear_find(users, username):
+    for u in users:
+        if u.get('username') == username:
+            return u
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--linear-max', type=int, default=10000)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    results = []
+    for n in args.sizes:
+        tracemalloc.start()
+        repo = build(n)
+        mem = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        ids = [rng.randrange(n) for _ in range(args.lookups)]
+        row = {
+            'users': n,
+            'bytes_per_user': mem / n,
+            'by_username_ns': per_op_ns(repo.get, [f"user{i}" for i in ids]),
+            'by_email_ns': per_op_ns(repo.get_by_email, [f"user{i}@example.com" for i in ids]),
+            'by_customer_ns': per_op_ns(repo.get_by_customer, [f"cus_{i:08d}" for i in ids]),
+        }
+        if n <= args.linear_max:
+            users = [u.to_dict() for u in repo]
+            sample = [f"user{i}" for i in ids[:1000]]
+            row['linear_scan_ns'] = per_op_ns(lambda k: linear_find(users, k), sample)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'users':>10}{'B/user':>10}{'username':>12}{'email':>12}{'customer':>12}{'linear':>14}")
+    for r in results:
+        linear = f"{r['linear_scan_ns']:>12.0f}ns" if 'linear_scan_ns' in r else f"{'-':>14}"
+        print(f"{r['users']:>10}{r['bytes_per_user']:>10.0f}{r['by_username_ns']:>10.0f}ns"
+              f"{r['by_email_ns']:>10.0f}ns{r['by_customer_ns']:>10.0f}ns{linear}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Check that abandoned LLM calls hand back a circuit breaker's half-open probe.
+
+A backend whose breaker has cooled down lets exactly one probe request
+through. If that request is cancelled (a losing hedge, a client that
+disconnects mid-stream) it says nothing about the backend's health, and
+the probe must be released; otherwise the breaker stays half-open with
+the probe taken and the router never offers that backend again. Runs
+four scenarios against in-process fake providers:
+
+* ``hedge``   async buffered call; the probing backend is the hedge and loses
+* ``stream``  sync stream closed by the client after the first token
+* ``astream`` async stream closed by the client after the first token
+* ``astream-wait`` async stream cancelled while waiting for the first token
+
+Exits 1 if any backend is left unavailable.
+
+    python benchmarks/check_llm_breaker.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+import common  # noqa: F401  (puts py_system on sys.path)
+
+MODEL = 'check-model'
+MESSAGES = [{'role': 'user', 'content': 'hi'}]
+
+
+def main():
+    os.environ['LLM_BREAKER_COOLDOWN'] = '0'
+    os.environ['LLM_HEDGE_DEFAULT_MS'] = '50'
+    from llm_router import LLMRouter, Provider
+
+    class Fake(Provider):
+        def __init__(self, name, delay):
+            super().__init__(name)
+            self.delay = delay
+
+        def stream(self, model, messages, temperature, timeout):
+            for token in ('a', 'b', 'c'):
+                time.sleep(self.delay)
+                yield token
+
+        async def acomplete(self, model, messages, temperature, timeout):
+            await asyncio.sleep(self.delay)
+            return self.name
+
+        async def astream(self, model, messages, temperature, timeout):
+            for token in ('a', 'b', 'c'):
+                await asyncio.sleep(self.delay)
+                yield token
+
+    def build(routes):
+        # The 'probe' backend has just tripped and cooled down: its next call is the probe
+        providers = [Fake(name, delay) for name, delay in routes]
+        router = LLMRouter(providers[0], hedge=True)
+        for p in providers[1:]:
+            router.add_provider(p)
+        router.set_route(MODEL, [name for name, _ in routes])
+        for backend in router.backends(MODEL):
+            if backend.provider.name == 'probe':
+                backend.breaker._trip()
+        return router
+
+    def probe_freed(router, name):
+        backend = next(b for b in router.backends(MODEL) if b.provider.name == name)
+        return backend in router.candidates(MODEL), backend.breaker.state
+
+    async def hedge():
+        router = build([('primary', 0.2), ('probe', 1.0)])
+        winner = await router.acomplete(MODEL, MESSAGES, 0.7)
+        await asyncio.sleep(0)  # let the cancelled hedge finish
+        return router, winner == 'primary' and router.hedges == 1
+
+    def stream():
+        router = build([('probe', 0.01)])
+        tokens = router.stream(MODEL, MESSAGES, 0.7)
+        ok = next(tokens) == 'a'
+        tokens.close()
+        return router, ok
+
+    async def astream():
+        router = build([('probe', 0.01)])
+        tokens = router.astream(MODEL, MESSAGES, 0.7)
+        ok = await tokens.__anext__() == 'a'
+        await tokens.aclose()
+        return router, ok
+
+    async def astream_wait():
+        router = build([('probe', 1.0)])
+
+        async def consume():
+            async for _ in router.astream(MODEL, MESSAGES, 0.7):
+                pass
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return router, task.cancelled()
+
+    failed = False
+    for name, run in (('hedge', lambda: asyncio.run(hedge())), ('stream', stream),
+                      ('astream', lambda: asyncio.run(astream())),
+                      ('astream-wait', lambda: asyncio.run(astream_wait()))):
+        router, ran = run()
+        available, state = probe_freed(router, 'probe')
+        ok = ran and available
+        failed |= not ok
+        print(f"{name:<12} {'OK' if ok else 'FAIL'}  breaker {state}, offered again: {available}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Check that state written by one worker process is seen by the others.
+
+Starts ``--workers`` separate interpreters, each importing the app and
+serving it on its own port over the same SQLite storage, job queue,
+rate-limit, cache and session files and one SESSION_SECRET (what
+gunicorn.conf.py sets up for its workers). Then, for ``--rounds`` users,
+signs up on one worker, logs in on the next, updates the profile on a
+third with the token from the login and saves a conversation
+that every worker must list. Last it posts a subscription webhook to one
+worker; every worker must then report the subscription's status. Exits 1
+on the first disagreement.
+
+    python benchmarks/check_multiworker.py --workers 3 --rounds 20
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT
+
+CHILD = r"""
+import os, sys, threading
+sys.path.insert(0, 'benchmarks')
+from common import import_app, serve_wsgi
+main = import_app(STORAGE_BACKEND=os.environ['STORAGE_BACKEND'])
+server, base = serve_wsgi(main.app)
+print(server.server_port, flush=True)
+threading.Event().wait()
+"""
+
+
+def call(port, method, path, payload=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request(method, path, body=json.dumps(payload) if payload is not None else None, headers=headers)
+    resp = conn.getresponse()
+    body = json.loads(resp.read() or b'{}')
+    conn.close()
+    return resp.status, body
+
+
+def start_workers(n, env):
+    procs, ports = [], []
+    for _ in range(n):
+        proc = subprocess.Popen([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        procs.append(proc)
+        ports.append(int(proc.stdout.readline()))
+    return procs, ports
+
+
+def check(ports, rounds):
+    n = len(ports)
+    for i in range(rounds):
+        a, b, c = ports[i % n], ports[(i + 1) % n], ports[(i + 2) % n]
+        username = f'mw{i}_{int(time.time() * 1000)}'
+        status, body = call(a, 'POST', '/api/auth/signup',
+                            {'username': username, 'password': 'secret-pw', 'email': f'{username}@example.com'})
+        if status != 200:
+            return f'signup on :{a} failed: {status} {body}'
+        status, body = call(b, 'POST', '/api/auth/login', {'username': username, 'password': 'secret-pw'})
+        if status != 200:
+            return f'user created on :{a} cannot log in on :{b}: {status} {body}'
+        status, body = call(c, 'POST', '/api/auth/update', {'updates': {'name': f'Name {i}'}}, body['access_token'])
+        if status != 200:
+            return f'user created on :{a} cannot be updated on :{c} with a token from :{b}: {status} {body}'
+        status, body = call(a, 'POST', '/api/auth/login', {'username': username, 'password': 'secret-pw'})
+        if body.get('user', {}).get('name') != f'Name {i}':
+            return f'update made on :{c} not visible on :{a}: {body}'
+        token = body['access_token']
+        status, body = call(b, 'POST', '/api/conversations', {'user': 'hi', 'ai': 'hello'}, token)
+        conv_id = body.get('item', {}).get('id')
+        for port in ports:
+            status, body = call(port, 'GET', '/api/conversations', token=token)
+            if [item['id'] for item in body.get('conversations', [])] != [conv_id]:
+                return f'conversation saved on :{b} not listed on :{port}: {body}'
+        event = {'id': f'evt_{username}', 'type': 'customer.subscription.updated', 'created': int(time.time()),
+                 'data': {'object': {'id': f'sub_{username}', 'status': 'active', 'metadata': {'username': username}}}}
+        call(c, 'POST', '/webhook', event)
+        for port in ports:
+            # Applied by a queue worker in whichever process claims the job
+            deadline = time.time() + 10
+            while True:
+                status, body = call(port, 'GET', f'/api/user-subscription/{username}', token=token)
+                if body.get('subscription_status') == 'active' or time.time() > deadline:
+                    break
+                time.sleep(0.05)
+            if body.get('subscription_status') != 'active':
+                return f'subscription webhook sent to :{c} not visible on :{port}: {body}'
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, STORAGE_BACKEND='sqlite', STORAGE_PATH=os.path.join(tmp, 'app.db'),
+                   JOBS_DB=os.path.join(tmp, 'jobs.db'), RATE_LIMIT_DB=os.path.join(tmp, 'rate_limits.db'),
+                   AI_CACHE_DB=os.path.join(tmp, 'ai_cache.db'), SESSION_DB=os.path.join(tmp, 'sessions.db'),
+                   STRIPE_MIRROR_DB=os.path.join(tmp, 'stripe_mirror.db'),
+                   SESSION_SECRET=os.urandom(16).hex(), SMTP_HOST='', STRIPE_WEBHOOK_SECRET='', LOG_LEVEL='WARNING')
+        procs, ports = start_workers(args.workers, env)
+        try:
+            error = check(ports, args.rounds)
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait()
+    if error:
+        print(f'FAIL: {error}')
+        sys.exit(1)
+    print(f'OK: {args.rounds} users consistent across {args.workers} workers')
+
+
+if __name__ == '__main__':
+    main()
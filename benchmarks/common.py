@@ -0,0 +1,62 @@
+"""Shared helpers for the benchmark scripts.
+
+The app lives in ``py_system/`` and uses flat imports (``from ai_model import
+...``), so the scripts put that directory on ``sys.path`` and configure the
+environment *before* importing ``main``.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PY_SYSTEM = os.path.join(ROOT, 'py_system')
+if PY_SYSTEM not in sys.path:
+    sys.path.insert(0, PY_SYSTEM)
+
+
+def import_app(**env):
+    """Import ``main`` with the given environment overrides and return the module."""
+    # Benchmarks never touch the real data/ store unless asked to
+    env.setdefault('STORAGE_BACKEND', 'memory')
+    for key, value in env.items():
+        os.environ[key] = str(value)
+    import main
+    return main
+
+
+def serve_wsgi(app, host='127.0.0.1', port=0):
+    """Run a WSGI app on a threaded Werkzeug server in the background; returns (server, base_url)."""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(samples):
+    return {
+        'n': len(samples),
+        'mean': sum(samples) / len(samples) if samples else float('nan'),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
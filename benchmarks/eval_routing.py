@@ -0,0 +1,163 @@
+"""Offline evaluation of the chat prompt router against a labelled corpus.
+
+Each line of ``--corpus`` is {"prompt": ..., "label": "fast" | "large"},
+where "large" marks prompts the 8B model answers noticeably worse. The
+report gives accuracy, the confusion matrix, the share of traffic kept on
+the fast model, the classifier's own cost per prompt, and estimated spend
+and answer time against sending everything to the large model. Completion
+lengths and model throughputs are assumptions (``--completion-tokens``,
+``--fast-tps``, ``--large-tps``), so compare runs rather than trusting the
+absolute numbers.
+
+The shipped weights were fitted on this corpus, so scoring them against it
+would overstate accuracy. The report is therefore k-fold (``--folds``): each
+prompt is routed with weights refitted on the other folds' scored prompts.
+``--in-sample`` scores the shipped (or ``--fit``) weights on the whole corpus
+instead, for comparison.
+
+``--fit`` retrains the logistic weights on all the prompts the rules leave to
+the scorer (L2-regularised gradient descent) and prints BIAS/WEIGHTS to paste
+into py_system/prompt_routing.py.
+
+    python benchmarks/eval_routing.py
+    python benchmarks/eval_routing.py --fit --folds 5
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+
+from common import ROOT, summarize
+from context_window import count_tokens
+from prompt_routing import PromptRouter, estimate_cost, prompt_features
+
+FAST_MODEL, LARGE_MODEL = 'llama-3.1-8b-instant', 'llama-3.1-70b-versatile'
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def fit(rows, epochs=3000, lr=0.5, l2=0.01):
+    """Logistic regression by batch gradient descent; returns (bias, weights)."""
+    samples = [(prompt_features(r['prompt']), 1.0 if r['label'] == 'large' else 0.0) for r in rows]
+    names = list(samples[0][0])
+    bias, weights = 0.0, dict.fromkeys(names, 0.0)
+    for _ in range(epochs):
+        grad_b, grad = 0.0, dict.fromkeys(names, 0.0)
+        for features, y in samples:
+            z = bias + sum(weights[n] * features[n] for n in names)
+            err = 1 / (1 + math.exp(-z)) - y
+            grad_b += err
+            for n in names:
+                grad[n] += err * features[n]
+        bias -= lr * grad_b / len(samples)
+        for n in names:
+            weights[n] -= lr * (grad[n] / len(samples) + l2 * weights[n])
+    return round(bias, 3), {n: round(w, 3) for n, w in weights.items()}
+
+
+def scored_rows(rows):
+    # The rules settle short, chit-chat, code and long prompts; only the rest reach the weights
+    router = PromptRouter(weights={})
+    return [r for r in rows if router.classify(r['prompt']).reason == 'scored']
+
+
+def cross_validate(rows, folds, threshold, seed=7):
+    """Split rows into folds; returns (router, held-out rows) pairs, each router fitted without its fold."""
+    rows = rows[:]
+    random.Random(seed).shuffle(rows)
+    scored = {id(r) for r in scored_rows(rows)}
+    pairs = []
+    for k in range(folds):
+        bias, weights = fit([r for i, r in enumerate(rows) if i % folds != k and id(r) in scored])
+        pairs.append((PromptRouter(weights=weights, bias=bias, threshold=threshold), rows[k::folds]))
+    return pairs
+
+
+def evaluate(pairs, args):
+    """Route each (router, rows) pair's rows with its router and report on all of them together."""
+    confusion, reasons, scored = Counter(), Counter(), Counter()
+    spend = {'routed': 0.0, 'all_large': 0.0, 'all_fast': 0.0}
+    seconds = {'routed': 0.0, 'all_large': 0.0, 'all_fast': 0.0}
+    classify_us = []
+    for router, row in ((router, row) for router, rows in pairs for row in rows):
+        start = time.perf_counter()
+        route = router.classify(row['prompt'])
+        classify_us.append((time.perf_counter() - start) * 1e6)
+        chosen = 'large' if route.large else 'fast'
+        confusion[(row['label'], chosen)] += 1
+        reasons[route.reason] += 1
+        if route.reason == 'scored':
+            scored[chosen == row['label']] += 1
+        tokens = count_tokens(row['prompt'])
+        for plan, model in (('routed', LARGE_MODEL if route.large else FAST_MODEL),
+                            ('all_large', LARGE_MODEL), ('all_fast', FAST_MODEL)):
+            spend[plan] += estimate_cost(model, tokens, args.completion_tokens)
+            seconds[plan] += args.completion_tokens / (args.large_tps if model == LARGE_MODEL else args.fast_tps)
+    n = sum(confusion.values())
+    fast = confusion[('fast', 'fast')] + confusion[('large', 'fast')]
+    return {
+        'prompts': n,
+        'accuracy': (confusion[('fast', 'fast')] + confusion[('large', 'large')]) / n,
+        'confusion': {f'{label}->{chosen}': confusion[(label, chosen)]
+                      for label in ('fast', 'large') for chosen in ('fast', 'large')},
+        'scored_accuracy': scored[True] / max(1, sum(scored.values())),
+        'fast_share': fast / n,
+        'reasons': dict(reasons),
+        'classify_us': summarize(classify_us),
+        'usd_per_1k_prompts': {plan: total / n * 1000 for plan, total in spend.items()},
+        'mean_answer_s': {plan: total / n for plan, total in seconds.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=os.path.join(ROOT, 'benchmarks', 'data', 'routing_prompts.jsonl'))
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--completion-tokens', type=int, default=300)
+    parser.add_argument('--fast-tps', type=float, default=750, help='assumed 8B output tokens/s')
+    parser.add_argument('--large-tps', type=float, default=250, help='assumed 70B output tokens/s')
+    parser.add_argument('--fit', action='store_true')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--in-sample', action='store_true', help='score the weights on the corpus they were fitted on')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    rows = load(args.corpus)
+    router = PromptRouter() if args.threshold is None else PromptRouter(threshold=args.threshold)
+    if args.fit:
+        scored = scored_rows(rows)
+        bias, weights = fit(scored)
+        router = PromptRouter(weights=weights, bias=bias, threshold=router.threshold)
+
+    if args.in_sample:
+        results = evaluate([(router, rows)], args)
+        method = 'in-sample'
+    else:
+        results = evaluate(cross_validate(rows, args.folds, router.threshold), args)
+        method = f'{args.folds}-fold held-out'
+    results['method'] = method
+    if args.fit:
+        print(f"# {len(scored)} scored prompts, {method} accuracy {results['scored_accuracy']:.1%}")
+        print(f'BIAS = {bias}')
+        print('WEIGHTS: Dict[str, float] = ' + json.dumps(weights, indent=4).replace('"', "'"))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['prompts']} prompts, {method} accuracy {results['accuracy']:.1%} "
+          f"(scored prompts {results['scored_accuracy']:.1%}), {results['fast_share']:.1%} kept on the fast model")
+    print('confusion (label->route):', results['confusion'])
+    print('decided by:', results['reasons'])
+    print(f"classify p50 {results['classify_us']['p50']:.1f}us  p99 {results['classify_us']['p99']:.1f}us")
+    for plan in ('routed', 'all_large', 'all_fast'):
+        print(f"{plan:<10} ${results['usd_per_1k_prompts'][plan]:.4f} per 1k prompts, "
+              f"~{results['mean_answer_s'][plan]:.2f}s mean answer")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Local stand-in for the Groq chat completions API.
+
+Speaks just enough of the OpenAI-compatible wire format used by the `groq`
+SDK (``POST /openai/v1/chat/completions``, buffered or ``stream=True``) for
+benchmarks to run without network access or an API key.
+
+    python benchmarks/fake_groq.py --port 8099 --first-token-ms 400 --tokens-per-sec 80
+
+Point the app at it with ``GROQ_BASE_URL=http://127.0.0.1:8099`` and any
+non-empty ``GROQ_API_KEY``. ``error_rate`` and ``slow_rate``/``slow_ms``
+inject failures and tail latency, e.g. for exercising the LLM router.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGroqConfig:
+    def __init__(self, first_token_ms=400.0, tokens_per_sec=80.0, n_tokens=60,
+                 error_rate=0.0, error_status=503, slow_rate=0.0, slow_ms=0.0):
+        # first_token_ms models prompt processing, tokens_per_sec the decode rate
+        self.first_token_ms = first_token_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.n_tokens = n_tokens
+        # Fraction of requests answered with error_status, and fraction delayed by an extra slow_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+    def first_token_delay(self) -> float:
+        extra = self.slow_ms if self.slow_rate and random.random() < self.slow_rate else 0.0
+        return (self.first_token_ms + extra) / 1000.0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeGroq/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        self.server.count_request()
+        cfg = self.server.config
+        if cfg.error_rate and random.random() < cfg.error_rate:
+            self._error(cfg.error_status)
+            return
+        model = body.get('model', 'fake-model')
+        tokens = [f"tok{i} " for i in range(cfg.n_tokens)]
+        if body.get('stream'):
+            self._stream(model, tokens, cfg)
+        else:
+            self._buffered(model, tokens, cfg)
+
+    def _error(self, status):
+        payload = json.dumps({'error': {'message': 'injected failure', 'type': 'server_error'}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _completion_id(self):
+        return f"chatcmpl-fake-{time.time_ns()}"
+
+    def _buffered(self, model, tokens, cfg):
+        time.sleep(cfg.first_token_delay() + len(tokens) / cfg.tokens_per_sec)
+        payload = json.dumps({
+            'id': self._completion_id(),
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 8, 'completion_tokens': len(tokens), 'total_tokens': 8 + len(tokens)},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, model, tokens, cfg):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        cid = self._completion_id()
+        created = int(time.time())
+        time.sleep(cfg.first_token_delay())
+        for i, tok in enumerate(tokens):
+            if i:
+                time.sleep(1.0 / cfg.tokens_per_sec)
+            chunk = {
+                'id': cid,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'content': tok}, 'finish_reason': None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        final = {
+            'id': cid,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        }
+        self._write_chunk(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, config: FakeGroqConfig = None):
+        super().__init__((host, port), _Handler)
+        self.config = config or FakeGroqConfig()
+        self.requests_served = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests_served += 1
+
+    def start_background(self) -> 'FakeGroqServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--first-token-ms', type=float, default=400.0)
+    parser.add_argument('--tokens-per-sec', type=float, default=80.0)
+    parser.add_argument('--tokens', type=int, default=60)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    config = FakeGroqConfig(args.first_token_ms, args.tokens_per_sec, args.tokens,
+                            error_rate=args.error_rate, slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+    server = FakeGroqServer(args.host, args.port, config)
+    print(f"Fake Groq listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Minimal local SMTP sink for benchmarks (no TLS; AUTH PLAIN accepts anything).
+
+Accepts mail and counts connections and messages. ``connect_delay_ms``
+stands in for the TCP + STARTTLS + login cost of a real provider.
+Recipients whose address starts with ``bounce`` are refused with a 550,
+like a mailbox that does not exist. Run the app against it with
+``SMTP_HOST=127.0.0.1 SMTP_PORT=<port> SMTP_STARTTLS=0`` and any
+SMTP_USER/SMTP_PASS.
+
+    python benchmarks/fake_smtp.py --port 8025 --connect-delay-ms 300
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        time.sleep(server.connect_delay_ms / 1000.0)
+        self._reply('220 fake-smtp ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode('ascii', 'replace').strip().upper()
+            if cmd.startswith('EHLO'):
+                self.wfile.write(b'250-fake-smtp\r\n250-SIZE 10485760\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n')
+                self.wfile.flush()
+            elif cmd.startswith('AUTH'):
+                self._reply('235 Authentication successful')
+            elif cmd.startswith('RCPT') and cmd.partition(':')[2].strip(' <').startswith('BOUNCE'):
+                with server.lock:
+                    server.bounced += 1
+                self._reply('550 No such user')
+            elif cmd.startswith('HELO') or cmd.startswith('MAIL') or cmd.startswith('RCPT') \
+                    or cmd.startswith('RSET') or cmd.startswith('NOOP'):
+                self._reply('250 OK')
+            elif cmd.startswith('DATA'):
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                with server.lock:
+                    server.messages += 1
+                self._reply('250 OK queued')
+            elif cmd.startswith('QUIT'):
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, connect_delay_ms=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.connect_delay_ms = connect_delay_ms
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.bounced = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def env(self) -> dict:
+        return {'SMTP_HOST': '127.0.0.1', 'SMTP_PORT': str(self.port), 'SMTP_STARTTLS': '0',
+                'SMTP_USER': 'bench', 'SMTP_PASS': 'bench', 'SMTP_FROM': 'bench@example.com'}
+
+    def start_background(self) -> 'FakeSMTPServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--connect-delay-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeSMTPServer(port=args.port, connect_delay_ms=args.connect_delay_ms)
+    print(f"Fake SMTP listening on 127.0.0.1:{server.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
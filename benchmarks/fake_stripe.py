@@ -0,0 +1,151 @@
+"""Local stand-in for the parts of the Stripe API the app calls.
+
+Serves ``GET /v1/prices/<id>``, ``POST /v1/checkout/sessions``,
+``GET /v1/checkout/sessions/<id>`` and ``GET /v1/subscriptions/<id>`` with
+``latency_ms`` added to every call, and counts requests per endpoint.
+Sessions are reported paid once they are ``paid_after`` seconds old.
+
+    python benchmarks/fake_stripe.py --port 8098 --latency-ms 150
+
+Point the app at it with ``STRIPE_API_BASE=http://127.0.0.1:8098`` and any
+``STRIPE_SECRET_KEY`` (e.g. ``sk_test_fake``).
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeStripe/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send(404, {'error': {'type': 'invalid_request_error', 'message': f"No such object: {self.path}"}})
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.split('?')[0].strip('/').split('/')
+        time.sleep(server.latency_ms / 1000.0)
+        if parts[:2] == ['v1', 'prices'] and len(parts) == 3:
+            server.count('prices.retrieve')
+            self._send(200, server.price(parts[2]))
+        elif parts[:3] == ['v1', 'checkout', 'sessions'] and len(parts) == 4:
+            server.count('checkout.sessions.retrieve')
+            session = server.session(parts[3], expand='subscription' in self.path)
+            self._send(200, session) if session else self._not_found()
+        elif parts[:2] == ['v1', 'subscriptions'] and len(parts) == 3:
+            server.count('subscriptions.retrieve')
+            self._send(200, server.subscription(parts[2]))
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        time.sleep(server.latency_ms / 1000.0)
+        if self.path.split('?')[0] == '/v1/checkout/sessions':
+            server.count('checkout.sessions.create')
+            metadata = {k[len('metadata['):-1]: v[0] for k, v in form.items() if k.startswith('metadata[')}
+            self._send(200, server.create_session(metadata))
+        else:
+            self._not_found()
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0.0, paid_after=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency_ms = latency_ms
+        self.paid_after = paid_after
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        return {'STRIPE_API_BASE': self.base_url, 'STRIPE_SECRET_KEY': 'sk_test_fake',
+                'STRIPE_PUBLISHABLE_KEY': 'pk_test_fake'}
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    @property
+    def requests_served(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def price(self, price_id: str) -> dict:
+        return {'id': price_id, 'object': 'price', 'active': True, 'currency': 'usd', 'unit_amount': 1000,
+                'product': f"prod_{price_id[-6:]}", 'recurring': {'interval': 'month'}}
+
+    def create_session(self, metadata: dict) -> dict:
+        with self._lock:
+            n = len(self._sessions) + 1
+            session_id = f"cs_test_fake_{n}"
+            self._sessions[session_id] = {'created': time.time(), 'n': n, 'metadata': metadata}
+        return self.session(session_id)
+
+    def subscription(self, sub_id: str) -> dict:
+        n = sub_id.rsplit('_', 1)[-1]
+        return {'id': sub_id, 'object': 'subscription', 'status': 'active', 'customer': f"cus_fake_{n}",
+                'cancel_at_period_end': False, 'current_period_end': int(time.time()) + 30 * 86400,
+                'items': {'object': 'list', 'data': [{'price': self.price('price_fake')}]}}
+
+    def session(self, session_id: str, expand: bool = False) -> dict:
+        with self._lock:
+            known = self._sessions.get(session_id)
+        if known is None:
+            # Unknown ids (e.g. from a replayed workload) behave like completed checkouts
+            known = {'created': 0, 'n': session_id.rsplit('_', 1)[-1], 'metadata': {}}
+        paid = time.time() - known['created'] >= self.paid_after
+        sub_id = f"sub_fake_{known['n']}"
+        return {
+            'id': session_id, 'object': 'checkout.session', 'mode': 'subscription',
+            'url': f"https://checkout.stripe.test/{session_id}",
+            'payment_status': 'paid' if paid else 'unpaid', 'status': 'complete' if paid else 'open',
+            'customer': f"cus_fake_{known['n']}", 'metadata': known['metadata'],
+            'subscription': (self.subscription(sub_id) if expand else sub_id) if paid else None,
+        }
+
+    def start_background(self) -> 'FakeStripeServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--latency-ms', type=float, default=150.0)
+    parser.add_argument('--paid-after', type=float, default=2.0)
+    args = parser.parse_args()
+    server = FakeStripeServer(args.host, args.port, args.latency_ms, args.paid_after)
+    print(f"Fake Stripe listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
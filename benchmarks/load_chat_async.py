@@ -0,0 +1,121 @@
+"""Concurrency load test: sync worker pool vs the asyncio/ASGI chat path.
+
+Fires ``--concurrency`` simultaneous chat calls at a local fake Groq server
+and compares:
+
+* ``sync``  - ``AIModel.process`` on a fixed pool of ``--sync-workers`` threads,
+  the way a pool of sync Flask workers handles ``/api/chat``;
+* ``async`` - ``AIModel.aprocess`` on one event loop with the shared
+  connection pool;
+* ``asgi``  - real HTTP requests to ``py_system/asgi.py`` served by uvicorn
+  in this process (skipped if uvicorn is not installed).
+
+    python benchmarks/load_chat_async.py --concurrency 300 --first-token-ms 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import import_app, summarize
+from fake_groq import FakeGroqConfig, FakeGroqServer
+
+
+def run_sync(ai_model, n, workers):
+    latencies = []
+
+    def one(_):
+        t0 = time.perf_counter()
+        ai_model.default_model.process('chat', 'Say hi')
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one, range(n)))
+    return time.perf_counter() - start, latencies
+
+
+async def _run_async(ai_model, n):
+    latencies = []
+
+    async def one():
+        t0 = time.perf_counter()
+        await ai_model.default_model.aprocess('chat', 'Say hi')
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    return time.perf_counter() - start, latencies
+
+
+async def _run_asgi(n):
+    import httpx
+    import uvicorn
+    import asgi
+
+    config = uvicorn.Config(asgi.app, host='127.0.0.1', port=0, log_level='error', backlog=4096)
+    server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    latencies = []
+    limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120) as http:
+        async def one():
+            t0 = time.perf_counter()
+            r = await http.post('/api/chat', json={'message': 'Say hi'})
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        elapsed = time.perf_counter() - start
+
+    server.should_exit = True
+    await serve_task
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=300)
+    parser.add_argument('--sync-workers', type=int, default=16)
+    parser.add_argument('--first-token-ms', type=float, default=500.0)
+    parser.add_argument('--tokens-per-sec', type=float, default=2000.0)
+    parser.add_argument('--tokens', type=int, default=40)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeGroqServer(config=FakeGroqConfig(args.first_token_ms, args.tokens_per_sec, args.tokens)).start_background()
+    import_app(GROQ_API_KEY='bench-fake-key', GROQ_BASE_URL=fake.base_url, AI_CACHE_SIZE=0)
+    import ai_model
+
+    results = {}
+    elapsed, lat = run_sync(ai_model, args.concurrency, args.sync_workers)
+    results['sync'] = {'elapsed_s': elapsed, 'rps': args.concurrency / elapsed, 'latency_ms': summarize(lat)}
+
+    elapsed, lat = asyncio.run(_run_async(ai_model, args.concurrency))
+    results['async'] = {'elapsed_s': elapsed, 'rps': args.concurrency / elapsed, 'latency_ms': summarize(lat)}
+
+    try:
+        ai_model._async_client = None  # rebind the pool to uvicorn's loop
+        elapsed, lat = asyncio.run(_run_asgi(args.concurrency))
+        results['asgi'] = {'elapsed_s': elapsed, 'rps': args.concurrency / elapsed, 'latency_ms': summarize(lat)}
+    except ImportError as e:
+        print(f"skipping asgi run: {e}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.concurrency} concurrent chats, upstream latency ~{args.first_token_ms:.0f}ms")
+    print(f"{'path':<8}{'elapsed':>10}{'req/s':>10}{'p50':>10}{'p95':>10}")
+    for label, r in results.items():
+        lat = r['latency_ms']
+        print(f"{label:<8}{r['elapsed_s']:>9.2f}s{r['rps']:>10.1f}{lat['p50']:>8.0f}ms{lat['p95']:>8.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
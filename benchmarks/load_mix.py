@@ -0,0 +1,302 @@
+"""Mixed-traffic load test of the whole app against local fakes.
+
+Boots ``main`` against a fake Groq (``--first-token-ms`` / ``--tokens-per-sec``),
+a fake Stripe and a fake SMTP sink, seeds users and conversations, then runs
+``--clients`` closed-loop virtual users for ``--duration`` seconds. Each user
+picks a scenario by weight from ``--mix`` and sends it over real HTTP:
+
+    chat           POST /api/chat
+    stream         POST /api/chat/stream (read to the final frame)
+    login          POST /api/auth/login
+    conversations  GET  /api/conversations (one page for a seeded user)
+    new_chat       POST /api/conversations/new
+    webhook        POST /webhook (signed invoice/subscription events)
+    signup         POST /api/auth/signup (queues a welcome email)
+
+Reports requests/sec and p50/p95/p99 latency per scenario and writes them,
+with the commit and settings, to a JSON file. ``--compare`` prints the change
+against an earlier result and exits non-zero if any scenario's p95 or
+throughput regressed by more than ``--threshold`` percent.
+
+    python benchmarks/load_mix.py --clients 32 --duration 30
+    python benchmarks/load_mix.py --compare benchmarks/results/load_mix-<commit>-<time>.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from common import ROOT, import_app, serve_wsgi, summarize
+from fake_groq import FakeGroqConfig, FakeGroqServer
+from fake_smtp import FakeSMTPServer
+from fake_stripe import FakeStripeServer
+from replay_webhooks import SECRET, sign
+
+DEFAULT_MIX = 'chat=30,stream=10,login=15,conversations=25,new_chat=5,webhook=10,signup=5'
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+PROMPTS = ['Say hi', 'Summarize the plot of Hamlet', 'What is a closure?', 'Write a haiku about rain',
+           'Explain HTTP caching', 'Give me three dinner ideas', 'How do I reverse a list in Python?']
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ('-dirty' if dirty else '')
+    except OSError:
+        return 'unknown'
+
+
+class Client:
+    """One virtual user: a connection-per-request HTTP client and the seeded users it acts as."""
+
+    def __init__(self, base_url, rng, users):
+        u = urlparse(base_url)
+        self.host, self.port = u.hostname, u.port
+        self.rng = rng
+        self.tokens = users
+        self.users = list(users)
+        self.signups = 0
+
+    def request(self, method, path, payload=None, headers=None, raw=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        body = raw if raw is not None else (json.dumps(payload) if payload is not None else None)
+        hdrs = {'Content-Type': 'application/json'} if body is not None else {}
+        hdrs.update(headers or {})
+        try:
+            conn.request(method, path, body=body, headers=hdrs)
+            resp = conn.getresponse()
+            # Read to the end so streamed replies are timed in full
+            resp.read()
+            return resp.status
+        finally:
+            conn.close()
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def auth(self):
+        # Bearer header of a random seeded user; the server takes the user from the token
+        return {'Authorization': f"Bearer {self.tokens[self.user()]}"}
+
+
+def s_chat(c):
+    return c.request('POST', '/api/chat', {'message': c.rng.choice(PROMPTS)}, headers=c.auth())
+
+
+def s_stream(c):
+    return c.request('POST', '/api/chat/stream', {'message': c.rng.choice(PROMPTS)}, headers=c.auth())
+
+
+def s_login(c):
+    return c.request('POST', '/api/auth/login', {'username': c.user(), 'password': 'bench-password'})
+
+
+def s_conversations(c):
+    return c.request('GET', "/api/conversations?limit=20", headers=c.auth())
+
+
+def s_new_chat(c):
+    return c.request('POST', '/api/conversations/new', {}, headers=c.auth())
+
+
+def s_webhook(c):
+    i = c.rng.randrange(len(c.users))
+    if c.rng.random() < 0.5:
+        event = {'type': 'invoice.paid',
+                 'data': {'object': {'customer': f"cus_load_{i}", 'subscription': f"sub_load_{i}"}}}
+    else:
+        event = {'type': 'customer.subscription.updated', 'data': {'object': {
+            'id': f"sub_load_{i}", 'customer': f"cus_load_{i}", 'status': 'active',
+            'items': {'data': [{'price': {'id': 'price_pro'}}]}}}}
+    event.update(id=f"evt_load_{c.rng.getrandbits(48):x}", created=int(time.time()))
+    body = json.dumps(event).encode()
+    return c.request('POST', '/webhook', raw=body, headers={'Stripe-Signature': sign(body)})
+
+
+def s_signup(c):
+    c.signups += 1
+    name = f"new_{threading.get_ident():x}_{c.signups}"
+    return c.request('POST', '/api/auth/signup', {'username': name, 'password': 'bench-password',
+                                                  'email': f"{name}@example.com"})
+
+
+SCENARIOS = {'chat': s_chat, 'stream': s_stream, 'login': s_login, 'conversations': s_conversations,
+             'new_chat': s_new_chat, 'webhook': s_webhook, 'signup': s_signup}
+
+
+def seed(main_mod, users, conversations_per_user):
+    # Returns {username: access token}
+    names = {}
+    for i in range(users):
+        name = f"load{i}"
+        main_mod.create_user(name, 'bench-password', f"Load User {i}", f"{name}@example.com")
+        main_mod.update_user(name, {'payment': True, 'subscription': 'pro', 'stripe_customer_id': f"cus_load_{i}",
+                                    'stripe_subscription_id': f"sub_load_{i}"})
+        for j in range(conversations_per_user):
+            main_mod.CONVERSATIONS.save({'id': f"{name}-c{j}", 'owner': name, 'title': f"Chat {j}",
+                                         'user': PROMPTS[j % len(PROMPTS)], 'ai': 'ok', 'ts': time.time() - j})
+        names[name] = main_mod.SESSIONS.issue(name)['access_token']
+    main_mod.STRIPE_EVENTS.plans_by_price['price_pro'] = 'pro'
+    return names
+
+
+def run(base_url, mix, clients, duration, warmup, users, seed_value):
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        client = Client(base_url, rng, users)
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                status = SCENARIOS[name](client)
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - t0
+            if t0 >= measure_from:
+                with lock:
+                    samples[name].append(elapsed * 1000)
+                    statuses[name][str(status)] = statuses[name].get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    measured = time.perf_counter() - measure_from
+
+    scenarios = {}
+    for name in names:
+        ok = sum(n for s, n in statuses[name].items() if s.startswith('2'))
+        scenarios[name] = {'requests': len(samples[name]), 'ok': ok, 'errors': len(samples[name]) - ok,
+                           'statuses': statuses[name], 'rps': len(samples[name]) / measured,
+                           'latency_ms': summarize(samples[name])}
+    total = [ms for name in names for ms in samples[name]]
+    return {'elapsed_s': measured, 'rps': len(total) / measured, 'latency_ms': summarize(total),
+            'scenarios': scenarios}
+
+
+def compare(baseline, current, threshold):
+    """Print per-scenario changes; returns the scenarios that regressed beyond threshold percent."""
+    regressed = []
+    print(f"\nvs {baseline['meta']['commit']} ({baseline['meta']['timestamp']})")
+    print(f"{'scenario':<15}{'req/s':>18}{'p95 ms':>22}")
+    for name, cur in current['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old or not old['requests'] or not cur['requests']:
+            continue
+        rps_change = (cur['rps'] - old['rps']) / old['rps'] * 100 if old['rps'] else 0.0
+        p95_change = (cur['latency_ms']['p95'] - old['latency_ms']['p95']) / old['latency_ms']['p95'] * 100 \
+            if old['latency_ms']['p95'] else 0.0
+        flag = ''
+        if rps_change < -threshold or p95_change > threshold:
+            regressed.append(name)
+            flag = '  REGRESSED'
+        print(f"{name:<15}{old['rps']:>7.1f} -> {cur['rps']:>6.1f} ({rps_change:+5.0f}%)"
+              f"{old['latency_ms']['p95']:>8.1f} -> {cur['latency_ms']['p95']:>6.1f} ({p95_change:+5.0f}%){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"scenario=weight list (default {DEFAULT_MIX})")
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--conversations', type=int, default=20, help='seeded conversations per user')
+    parser.add_argument('--first-token-ms', type=float, default=300.0)
+    parser.add_argument('--tokens-per-sec', type=float, default=400.0)
+    parser.add_argument('--tokens', type=int, default=60)
+    parser.add_argument('--stripe-ms', type=float, default=100.0)
+    parser.add_argument('--smtp-connect-ms', type=float, default=50.0)
+    parser.add_argument('--pbkdf2-iterations', type=int, help='defaults to the app setting')
+    parser.add_argument('--ai-cache', action='store_true', help='keep the response cache on (off by default)')
+    parser.add_argument('--rate-limits', action='store_true', help='keep per-plan rate limits on (off by default)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='result file (default benchmarks/results/load_mix-<commit>-<time>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    groq = FakeGroqServer(config=FakeGroqConfig(args.first_token_ms, args.tokens_per_sec, args.tokens)).start_background()
+    stripe = FakeStripeServer(latency_ms=args.stripe_ms).start_background()
+    smtp = FakeSMTPServer(connect_delay_ms=args.smtp_connect_ms).start_background()
+    env = dict(GROQ_API_KEY='bench-fake-key', GROQ_BASE_URL=groq.base_url, STRIPE_WEBHOOK_SECRET=SECRET,
+               AI_CACHE_SIZE=os.getenv('AI_CACHE_SIZE', '2048') if args.ai_cache else 0,
+               RATE_LIMITS=1 if args.rate_limits else 0, LOG_LEVEL='WARNING', **stripe.env(), **smtp.env())
+    if args.pbkdf2_iterations:
+        env['PBKDF2_ITERATIONS'] = args.pbkdf2_iterations
+    main_mod = import_app(**env)
+    users = seed(main_mod, args.users, args.conversations)
+    _, base_url = serve_wsgi(main_mod.app)
+
+    result = run(base_url, mix, args.clients, args.duration, args.warmup, users, args.seed)
+    main_mod.JOBS.wait_idle(timeout=30)
+    main_mod.WEBHOOK_JOBS.wait_idle(timeout=30)
+    result['upstream'] = {'groq_requests': groq.requests_served, 'stripe_requests': stripe.requests_served,
+                          'smtp_messages': smtp.messages}
+    result['meta'] = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'server': 'werkzeug-threaded',
+        'args': vars(args),
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"load_mix-{result['meta']['commit']}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{args.clients} clients, {result['elapsed_s']:.1f}s measured, {result['rps']:.1f} req/s overall")
+        print(f"{'scenario':<15}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, s in result['scenarios'].items():
+            lat = s['latency_ms']
+            print(f"{name:<15}{s['requests']:>7}{s['errors']:>8}{s['rps']:>9.1f}"
+                  f"{lat['p50']:>7.1f}ms{lat['p95']:>7.1f}ms{lat['p99']:>7.1f}ms")
+        print(f"upstream: {result['upstream']}")
+        print(f"results written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressed = compare(json.load(f), result, args.threshold)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Replay recorded Stripe events through the /webhook pipeline.
+
+Posts every event in ``--events`` (NDJSON, a JSON list, or the ``{"data":
+[...]}`` shape of ``stripe events list``) to ``/webhook`` with a valid
+signature, then waits for the webhook workers to drain. Reports the ack
+latency Stripe would see, end-to-end processing throughput and how many
+redeliveries were dropped as duplicates.
+
+Without ``--events`` a synthetic stream is generated: ``--users`` customers
+going through checkout, renewals, plan changes and cancellations, with
+``--dup-rate`` of the events delivered twice.
+
+    python benchmarks/replay_webhooks.py --users 500 --dup-rate 0.1
+    python benchmarks/replay_webhooks.py --events recorded.ndjson --workers 8
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import time
+
+from common import import_app, summarize
+
+SECRET = 'whsec_bench'
+PRICES = {'starter': 'price_starter', 'pro': 'price_pro', 'elite': 'price_elite'}
+
+
+def load_events(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return data['data'] if data.get('object') == 'list' else [data]
+    return data
+
+
+def synthetic_events(users, dup_rate, seed=1):
+    rng = random.Random(seed)
+    events = []
+    n = 0
+
+    def event(etype, obj):
+        nonlocal n
+        n += 1
+        return {'id': f"evt_bench_{n}", 'type': etype, 'created': int(time.time()), 'data': {'object': obj}}
+
+    for i in range(users):
+        cus, sub = f"cus_bench_{i}", f"sub_bench_{i}"
+        plan = rng.choice(list(PRICES))
+        events.append(event('checkout.session.completed', {
+            'id': f"cs_bench_{i}", 'mode': 'subscription', 'customer': cus, 'subscription': sub,
+            'payment_status': 'paid', 'metadata': {'username': f"bench{i}", 'plan': plan}}))
+        events.append(event('invoice.paid', {'id': f"in_bench_{i}", 'customer': cus, 'subscription': sub}))
+        if rng.random() < 0.3:
+            plan = rng.choice(list(PRICES))
+            events.append(event('customer.subscription.updated', {
+                'id': sub, 'customer': cus, 'status': 'active',
+                'items': {'data': [{'price': {'id': PRICES[plan]}}]}}))
+        if rng.random() < 0.1:
+            events.append(event('customer.subscription.deleted', {'id': sub, 'customer': cus, 'status': 'canceled'}))
+    # Redeliveries arrive later, interleaved with new events
+    for e in rng.sample(events, int(len(events) * dup_rate)):
+        events.insert(rng.randrange(events.index(e) + 1, len(events) + 1), e)
+    return events
+
+
+def sign(payload: bytes) -> str:
+    ts = int(time.time())
+    mac = hmac.new(SECRET.encode(), f"{ts}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={mac}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', help='recorded events file; synthetic events are generated if omitted')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--dup-rate', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    main_mod = import_app(GROQ_API_KEY='bench-fake-key', STRIPE_WEBHOOK_SECRET=SECRET, WEBHOOK_WORKERS=args.workers)
+    events = load_events(args.events) if args.events else synthetic_events(args.users, args.dup_rate)
+    if not args.events:
+        main_mod.STRIPE_EVENTS.plans_by_price.update({pid: name for name, pid in PRICES.items()})
+        for i in range(args.users):
+            main_mod.USERS.add(main_mod.UserRecord(f"bench{i}", 'x', None, email=f"bench{i}@example.com"))
+    client = main_mod.app.test_client()
+
+    acks = []
+    duplicates = 0
+    t0 = time.perf_counter()
+    for e in events:
+        body = json.dumps(e).encode()
+        s = time.perf_counter()
+        r = client.post('/webhook', data=body, headers={'Stripe-Signature': sign(body)},
+                        content_type='application/json')
+        acks.append((time.perf_counter() - s) * 1000)
+        assert r.status_code == 200, r.get_data(as_text=True)
+        duplicates += bool(r.get_json().get('duplicate'))
+    acked_s = time.perf_counter() - t0
+    main_mod.WEBHOOK_JOBS.wait_idle(timeout=300)
+    processed_s = time.perf_counter() - t0
+
+    results = {
+        'events': len(events),
+        'duplicates_dropped': duplicates,
+        'ack_ms': summarize(acks),
+        'acked_per_s': len(events) / acked_s,
+        'processed': main_mod.WEBHOOK_JOBS.completed,
+        'processed_per_s': main_mod.WEBHOOK_JOBS.completed / processed_s,
+        'dead': len(main_mod.WEBHOOK_JOBS.dead()),
+        'workers': args.workers,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['events']} events, {duplicates} duplicate deliveries dropped, {results['dead']} dead")
+    print(f"ack        p50 {results['ack_ms']['p50']:.2f}ms  p95 {results['ack_ms']['p95']:.2f}ms  "
+          f"({results['acked_per_s']:.0f}/s)")
+    print(f"processed  {results['processed']} events at {results['processed_per_s']:.0f}/s "
+          f"with {args.workers} worker(s)")
+
+
+if __name__ == '__main__':
+    main()
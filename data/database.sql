@@ -0,0 +1,36 @@
+-- Schema for the SQLite storage backend (py_system/storage.py).
+-- Applied on every start, so statements must stay idempotent.
+
+CREATE TABLE IF NOT EXISTS users (
+    username               TEXT PRIMARY KEY,
+    password               TEXT NOT NULL,
+    salt                   TEXT,
+    iterations             INTEGER,
+    name                   TEXT,
+    email                  TEXT,
+    subscription           TEXT NOT NULL DEFAULT 'free',
+    payment                INTEGER NOT NULL DEFAULT 0,
+    stripe_customer_id     TEXT,
+    stripe_subscription_id TEXT
+);
+
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE INDEX IF NOT EXISTS users_customer ON users (stripe_customer_id);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id   TEXT PRIMARY KEY,
+    ts   REAL NOT NULL,
+    data TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS conversations_ts ON conversations (ts);
+
+-- Change log for multi-worker deployments: each write records (kind, key) and
+-- the writing process, so other workers refresh just the rows that changed
+-- (see SQLiteBackend.sync in storage.py). Old entries are trimmed.
+CREATE TABLE IF NOT EXISTS changes (
+    seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind   TEXT NOT NULL,
+    key    TEXT NOT NULL,
+    origin TEXT NOT NULL
+);
@@ -1,6 +1,22 @@
+import asyncio
 import os
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from groq import Groq
+
+from context_window import build_context, context_budget, count_tokens
+from llm_router import GroqProvider, LLMRouter, router_from_env
+from metrics import LLM_COST, LLM_FIRST_TOKEN, LLM_IN_FLIGHT, LLM_LATENCY, LLM_ROUTED, LLM_TOKENS, REGISTRY, stats_collector
+from prompt_routing import PROMPT_ROUTING, PromptRouter, estimate_cost
+from single_flight import AsyncSingleFlight, SingleFlight
+
+if TYPE_CHECKING:
+    from groq import AsyncGroq, Groq
 
 # Load .env file
 load_dotenv()
@@ -8,42 +24,508 @@ load_dotenv()
 # Get API key
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY is missing! Add it in Railway Variables.")
+# Upper bound on concurrent upstream connections shared by all async requests
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "500"))
+
+# Clients are built on first use: importing the groq SDK is a large share of app start-up,
+# and a missing key should fail the chat request rather than the whole import.
+_client: Optional["Groq"] = None
+_async_client: Optional["AsyncGroq"] = None
+_client_lock = threading.Lock()
+
+
+def _require_api_key() -> str:
+    if not GROQ_API_KEY:
+        raise ValueError("GROQ_API_KEY is missing! Add it in Railway Variables.")
+    return GROQ_API_KEY
+
+
+def get_client() -> "Groq":
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from groq import Groq
+                _client = Groq(api_key=_require_api_key())
+    return _client
+
+
+def get_async_client() -> "AsyncGroq":
+    # Created lazily so the pooled httpx client binds to the serving event loop
+    global _async_client
+    if _async_client is None:
+        import httpx
+        from groq import AsyncGroq, DefaultAsyncHttpxClient
+        limits = httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS,
+                              max_keepalive_connections=GROQ_MAX_CONNECTIONS)
+        _async_client = AsyncGroq(api_key=_require_api_key(),
+                                  http_client=DefaultAsyncHttpxClient(limits=limits))
+    return _async_client
+
+
+# Groq is the default provider for every model; LLM_PROVIDERS / LLM_ROUTES add fallbacks (see llm_router.py)
+router = router_from_env(GroqProvider("groq", client_factory=get_client, async_client_factory=get_async_client))
+
+
+# ==================== RESPONSE CACHE ====================
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "2048"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "3600"))
+# Optional SQLite file so several workers share hits (e.g. data/ai_cache.db)
+AI_CACHE_DB = os.getenv("AI_CACHE_DB")
+# Concurrent identical prompts share one upstream call (see single_flight.py)
+AI_COALESCE = os.getenv("AI_COALESCE", "1") != "0"
+# Most prompts of one process_many batch that may be in flight at once
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "8"))
+
+CacheKey = Tuple[str, str, float]
+# (index, reply, error) for one item of a batch; exactly one of reply/error is set
+BatchResult = Tuple[int, Optional[str], Optional[BaseException]]
+
+
+def normalize_prompt(prompt: str, casefold: bool = True) -> str:
+    # Collapse whitespace; case is only folded for chat prompts since identifiers matter in code
+    text = " ".join(prompt.split())
+    return text.casefold() if casefold else text
+
+
+class ResponseCache:
+    """LRU + TTL cache of completions keyed on (model, normalized prompt, temperature)."""
+
+    def __init__(self, maxsize: int = AI_CACHE_SIZE, ttl: float = AI_CACHE_TTL, db_path: Optional[str] = AI_CACHE_DB):
+        self.ttl = ttl
+        self.enabled = maxsize > 0
+        self._local = TTLCache(maxsize=max(maxsize, 1), ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_path = db_path
+        self._conns = threading.local()
+        if db_path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers in other workers proceed during writes
+        conn = getattr(self._conns, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conns.conn = conn
+        return conn
+
+    def get(self, key: Optional[CacheKey]) -> Optional[str]:
+        if not self.enabled or key is None:
+            return None
+        with self._lock:
+            value = self._local.get(key)
+        if value is None and self.db_path:
+            try:
+                row = self._db().execute(
+                    "SELECT value FROM ai_cache WHERE key = ? AND expires > ?", (json.dumps(key), time.time())
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row:
+                value = row[0]
+                with self._lock:
+                    self._local[key] = value
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
 
-# Initialize client
-client = Groq(api_key=GROQ_API_KEY)
+    def set(self, key: Optional[CacheKey], value: str):
+        if not self.enabled or key is None or not value:
+            return
+        with self._lock:
+            self._local[key] = value
+        if self.db_path:
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, value, expires) VALUES (?, ?, ?)",
+                    (json.dumps(key), value, time.time() + self.ttl),
+                )
+            except sqlite3.Error:
+                pass
+
+    # The shared table is a SQLite file with a 5 s busy timeout: async callers
+    # reach it from a worker thread so a locked database never stalls the event loop
+    async def aget(self, key: Optional[CacheKey]) -> Optional[str]:
+        if self.db_path and self.enabled and key is not None:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: Optional[CacheKey], value: str):
+        if self.db_path and self.enabled and key is not None and value:
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self.hits = 0
+            self.misses = 0
+        if self.db_path:
+            self._db().execute("DELETE FROM ai_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "size": len(self._local),
+                "maxsize": self._local.maxsize if self.enabled else 0,
+                "ttl": self.ttl,
+                "shared": bool(self.db_path),
+            }
+
+
+response_cache = ResponseCache()
 
 
 class AIModel:
-    def __init__(self, model_text="llama-3.1-8b-instant", model_code="llama-3.1-70b-versatile"):
+    def __init__(self, model_text="llama-3.1-8b-instant", model_code="llama-3.1-70b-versatile", cache: Optional[ResponseCache] = None,
+                 llm_router: Optional[LLMRouter] = None, coalesce: bool = AI_COALESCE,
+                 prompt_router: Optional[PromptRouter] = None, routing: bool = PROMPT_ROUTING):
         self.model_text = model_text
         self.model_code = model_code
+        # Chat/text prompts that look hard go to model_code instead (see prompt_routing.py)
+        self.prompt_router = (prompt_router or PromptRouter()) if routing else None
+        self.cache = cache if cache is not None else response_cache
+        # Model names are routes: the router picks which provider/backend serves each call
+        self.router = llm_router if llm_router is not None else router
+        # Only requests with a cache key (no history) are coalesced
+        self.flights = SingleFlight() if coalesce else None
+        self.async_flights = AsyncSingleFlight() if coalesce else None
+
+    def _request(self, mode: str, prompt: str, history: Optional[List[dict]] = None,
+                 allow_large: bool = True) -> Tuple[str, List[dict], float, Optional[CacheKey]]:
+        # Resolve (model, messages, temperature) plus the cache key for a mode.
+        # Multi-turn requests depend on their history and are not cached.
+        if mode == "code":
+            # Plans without the large model get code answers from the fast one
+            model, temperature = self.model_code if allow_large else self.model_text, 0.4
+            upstream_prompt = f"Write clean and correct production-ready code:\n{prompt}"
+            key = (model, normalize_prompt(prompt, casefold=False), temperature)
+        else:
+            model, temperature = self._route(prompt, allow_large), 0.7
+            upstream_prompt = prompt
+            key = (model, normalize_prompt(prompt), temperature)
+        if history:
+            return model, build_context(history, upstream_prompt, context_budget(model)), temperature, None
+        return model, [{"role": "user", "content": upstream_prompt}], temperature, key
+
+    def _route(self, prompt: str, allow_large: bool = True) -> str:
+        # Same prompt, same model, so cached replies stay consistent.
+        # allow_large=False (plans without the large model) keeps chat on the fast one.
+        if self.prompt_router is None:
+            return self.model_text
+        route = self.prompt_router.classify(prompt)
+        if route.large and not allow_large:
+            LLM_ROUTED.inc(model=self.model_text, reason="plan")
+            return self.model_text
+        model = self.model_code if route.large else self.model_text
+        LLM_ROUTED.inc(model=model, reason=route.reason)
+        return model
+
+    def _complete(self, mode: str, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
+        model, messages, temperature, key = self._request(mode, prompt, history, allow_large)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if key is not None and self.flights is not None:
+            return self.flights.call(key, lambda: self._complete_upstream(model, messages, temperature, key))
+        return self._complete_upstream(model, messages, temperature, key)
+
+    @staticmethod
+    def _observe(model: str, kind: str, start: float, messages: List[dict], reply: Optional[str]):
+        # reply is None when the call failed; tokens are the same ~4 chars/token estimate as context_window
+        LLM_LATENCY.observe(time.perf_counter() - start, model=model, kind=kind,
+                            outcome="error" if reply is None else "ok")
+        prompt_tokens = sum(m.get("tokens") or count_tokens(m["content"]) for m in messages)
+        completion_tokens = count_tokens(reply) if reply else 0
+        LLM_TOKENS.inc(prompt_tokens, model=model, direction="prompt")
+        if reply:
+            LLM_TOKENS.inc(completion_tokens, model=model, direction="completion")
+        LLM_COST.inc(estimate_cost(model, prompt_tokens, completion_tokens), model=model)
+
+    def _complete_upstream(self, model: str, messages: List[dict], temperature: float, key: Optional[CacheKey]) -> str:
+        start, content = time.perf_counter(), None
+        try:
+            with LLM_IN_FLIGHT.track(model=model):
+                content = self.router.complete(model, messages, temperature)
+        finally:
+            self._observe(model, "complete", start, messages, content)
+        self.cache.set(key, content)
+        return content
+
+    def generate_text(self, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
+        return self._complete("text", prompt, history, allow_large)
+
+    def generate_code(self, prompt: str, history: Optional[List[dict]] = None) -> str:
+        return self._complete("code", prompt, history)
+
+    def _stream(self, mode: str, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> Iterator[str]:
+        # Yield content deltas as Groq produces them instead of waiting for the full completion
+        model, messages, temperature, key = self._request(mode, prompt, history, allow_large)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        if key is not None and self.flights is not None:
+            yield from self.flights.stream(key, lambda: self._stream_upstream(model, messages, temperature, key))
+        else:
+            yield from self._stream_upstream(model, messages, temperature, key)
+
+    def _stream_upstream(self, model: str, messages: List[dict], temperature: float, key: Optional[CacheKey]) -> Iterator[str]:
+        start, parts, reply = time.perf_counter(), [], None
+        try:
+            with LLM_IN_FLIGHT.track(model=model):
+                for delta in self.router.stream(model, messages, temperature):
+                    if not parts:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - start, model=model)
+                    parts.append(delta)
+                    yield delta
+            reply = "".join(parts)
+        finally:
+            self._observe(model, "stream", start, messages, reply)
+        self.cache.set(key, reply)
+
+    def stream_text(self, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> Iterator[str]:
+        return self._stream("text", prompt, history, allow_large)
+
+    def stream_code(self, prompt: str, history: Optional[List[dict]] = None) -> Iterator[str]:
+        return self._stream("code", prompt, history)
+
+    async def _acomplete(self, mode: str, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
+        model, messages, temperature, key = self._request(mode, prompt, history, allow_large)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return cached
+        if key is not None and self.async_flights is not None:
+            return await self.async_flights.call(key, lambda: self._acomplete_upstream(model, messages, temperature, key))
+        return await self._acomplete_upstream(model, messages, temperature, key)
+
+    async def _acomplete_upstream(self, model: str, messages: List[dict], temperature: float, key: Optional[CacheKey]) -> str:
+        start, content = time.perf_counter(), None
+        try:
+            with LLM_IN_FLIGHT.track(model=model):
+                content = await self.router.acomplete(model, messages, temperature)
+        finally:
+            self._observe(model, "complete", start, messages, content)
+        await self.cache.aset(key, content)
+        return content
+
+    async def _astream(self, mode: str, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> AsyncIterator[str]:
+        model, messages, temperature, key = self._request(mode, prompt, history, allow_large)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            yield cached
+            return
+        if key is not None and self.async_flights is not None:
+            tokens = self.async_flights.stream(key, lambda: self._astream_upstream(model, messages, temperature, key))
+        else:
+            tokens = self._astream_upstream(model, messages, temperature, key)
+        async for delta in tokens:
+            yield delta
 
-    def generate_text(self, prompt: str) -> str:
-        response = client.chat.completions.create(
-            model=self.model_text,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-        )
-        return response.choices[0].message["content"]
-
-    def generate_code(self, prompt: str) -> str:
-        code_prompt = f"Write clean and correct production-ready code:\n{prompt}"
-        response = client.chat.completions.create(
-            model=self.model_code,
-            messages=[{"role": "user", "content": code_prompt}],
-            temperature=0.4,
-        )
-        return response.choices[0].message["content"]
-
-    def process(self, mode: str, prompt: str) -> str:
+    async def _astream_upstream(self, model: str, messages: List[dict], temperature: float, key: Optional[CacheKey]) -> AsyncIterator[str]:
+        start, parts, reply = time.perf_counter(), [], None
+        try:
+            with LLM_IN_FLIGHT.track(model=model):
+                async for delta in self.router.astream(model, messages, temperature):
+                    if not parts:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - start, model=model)
+                    parts.append(delta)
+                    yield delta
+            reply = "".join(parts)
+        finally:
+            self._observe(model, "stream", start, messages, reply)
+        await self.cache.aset(key, reply)
+
+    async def agenerate_text(self, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
+        return await self._acomplete("text", prompt, history, allow_large)
+
+    async def agenerate_code(self, prompt: str, history: Optional[List[dict]] = None) -> str:
+        return await self._acomplete("code", prompt, history)
+
+    def process(self, mode: str, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
         if mode in ["chat", "text"]:
-            return self.generate_text(prompt)
+            return self.generate_text(prompt, history, allow_large)
         if mode == "code":
-            return self.generate_code(prompt)
+            return self.generate_code(prompt, history)
         return "Invalid mode. Use 'chat', 'text', or 'code'."
 
+    def process_stream(self, mode: str, prompt: str, history: Optional[List[dict]] = None,
+                       allow_large: bool = True) -> Iterator[str]:
+        if mode in ["chat", "text"]:
+            return self.stream_text(prompt, history, allow_large)
+        if mode == "code":
+            return self.stream_code(prompt, history)
+        return iter(["Invalid mode. Use 'chat', 'text', or 'code'."])
+
+    async def aprocess(self, mode: str, prompt: str, history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
+        if mode in ["chat", "text"]:
+            return await self.agenerate_text(prompt, history, allow_large)
+        if mode == "code":
+            return await self.agenerate_code(prompt, history)
+        return "Invalid mode. Use 'chat', 'text', or 'code'."
+
+    async def aprocess_stream(self, mode: str, prompt: str, history: Optional[List[dict]] = None,
+                              allow_large: bool = True) -> AsyncIterator[str]:
+        if mode in ["chat", "text"]:
+            agen = self._astream("text", prompt, history, allow_large)
+        elif mode == "code":
+            agen = self._astream("code", prompt, history)
+        else:
+            yield "Invalid mode. Use 'chat', 'text', or 'code'."
+            return
+        async for token in agen:
+            yield token
+
+    @staticmethod
+    def _batch_plan(items: List[Tuple[str, str]]) -> List[Tuple[str, str, List[int]]]:
+        # Identical items are answered once: (mode, prompt, indexes it answers) in first-seen order
+        groups: Dict[Tuple[str, str], Tuple[str, str, List[int]]] = {}
+        for i, (mode, prompt) in enumerate(items):
+            key = (mode, normalize_prompt(prompt, casefold=mode != "code"))
+            if key not in groups:
+                groups[key] = (mode, prompt, [])
+            groups[key][2].append(i)
+        return list(groups.values())
+
+    def iter_many(self, items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                  allow_large: bool = True) -> Iterator[BatchResult]:
+        """Answer (mode, prompt) items concurrently, yielding (index, reply, error) as each finishes.
+
+        At most `concurrency` prompts are in flight; closing the iterator early
+        cancels the prompts that have not started yet.
+        """
+        plan = self._batch_plan(items)
+        if not plan:
+            return
+        pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency or AI_BATCH_CONCURRENCY, len(plan))),
+                                  thread_name_prefix="ai-batch")
+        try:
+            pending = {pool.submit(self.process, mode, prompt, None, allow_large): indexes
+                       for mode, prompt, indexes in plan}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    reply = None if error is not None else future.result()
+                    for i in pending.pop(future):
+                        yield i, reply, error
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def process_many(self, items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                     return_exceptions: bool = False, allow_large: bool = True) -> list:
+        """Replies for (mode, prompt) items, in input order.
+
+        A failed item raises unless return_exceptions is set, in which case its
+        exception takes the reply's place (as with asyncio.gather).
+        """
+        results: list = [None] * len(items)
+        for i, reply, error in self.iter_many(items, concurrency, allow_large):
+            if error is not None and not return_exceptions:
+                raise error
+            results[i] = error if error is not None else reply
+        return results
+
+    async def aiter_many(self, items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                         allow_large: bool = True) -> AsyncIterator[BatchResult]:
+        plan = self._batch_plan(items)
+        limit = asyncio.Semaphore(max(1, concurrency or AI_BATCH_CONCURRENCY))
+
+        async def one(mode, prompt, indexes):
+            async with limit:
+                try:
+                    return indexes, await self.aprocess(mode, prompt, None, allow_large), None
+                except Exception as e:
+                    return indexes, None, e
+
+        tasks = [asyncio.ensure_future(one(*entry)) for entry in plan]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indexes, reply, error = await next_done
+                for i in indexes:
+                    yield i, reply, error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def aprocess_many(self, items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                            return_exceptions: bool = False, allow_large: bool = True) -> list:
+        results: list = [None] * len(items)
+        async for i, reply, error in self.aiter_many(items, concurrency, allow_large):
+            if error is not None and not return_exceptions:
+                raise error
+            results[i] = error if error is not None else reply
+        return results
+
+
+# Shared instance used by the Flask routes
+default_model = AIModel()
+
+
+def _coalesce_stats() -> dict:
+    # Thread (WSGI) and event-loop (ASGI) flights together
+    if default_model.flights is None:
+        return {}
+    sync, aio = default_model.flights.stats(), default_model.async_flights.stats()
+    return {k: sync[k] + aio[k] for k in sync}
+
+
+# Read at scrape time from the components' own counters
+REGISTRY.add_collector(stats_collector("ai_cache", response_cache.stats,
+                                       {"hits": "counter", "misses": "counter", "hit_rate": "gauge", "size": "gauge"}))
+REGISTRY.add_collector(stats_collector("ai_coalesce", _coalesce_stats,
+                                       {"upstream_calls": "counter", "coalesced": "counter", "in_flight": "gauge"}))
+REGISTRY.add_collector(router.collect_metrics)
+
+
+# allow_large=False keeps chat prompts on the fast model whatever the prompt router says
+def get_ai_reply(message: str, mode: str = "chat", history: Optional[List[dict]] = None, allow_large: bool = True) -> str:
+    return default_model.process(mode, message, history, allow_large)
+
+
+def stream_ai_reply(message: str, mode: str = "chat", history: Optional[List[dict]] = None,
+                    allow_large: bool = True) -> Iterator[str]:
+    return default_model.process_stream(mode, message, history, allow_large)
+
+
+async def aget_ai_reply(message: str, mode: str = "chat", history: Optional[List[dict]] = None,
+                        allow_large: bool = True) -> str:
+    return await default_model.aprocess(mode, message, history, allow_large)
+
+
+def astream_ai_reply(message: str, mode: str = "chat", history: Optional[List[dict]] = None,
+                     allow_large: bool = True) -> AsyncIterator[str]:
+    return default_model.aprocess_stream(mode, message, history, allow_large)
+
+
+def batch_calls(items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    # The (mode, prompt) pairs a batch sends upstream: identical items are answered once
+    return [(mode, prompt) for mode, prompt, _ in AIModel._batch_plan(items)]
+
+
+def iter_ai_replies(items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                    allow_large: bool = True) -> Iterator[BatchResult]:
+    return default_model.iter_many(items, concurrency, allow_large)
+
+
+def aiter_ai_replies(items: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                     allow_large: bool = True) -> AsyncIterator[BatchResult]:
+    return default_model.aiter_many(items, concurrency, allow_large)
+
 
 # Optional test
 if __name__ == "__main__":
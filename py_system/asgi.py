@@ -0,0 +1,257 @@
+"""ASGI entry point.
+
+The LLM routes (`/api/chat`, `/api/chat/stream`, `/api/chat/batch`) are
+served natively on the event loop through the async Groq client, so a
+single process can hold hundreds of in-flight completions without a thread
+per request. Every other
+route is delegated to the Flask app through asgiref's WSGI adapter, on a
+pool of WSGI_THREADS threads (not asgiref's default single "thread
+sensitive" thread, which would run one Flask request at a time per worker).
+
+The chat handlers still share main.py's helpers for history, rate limits
+and quota charging. With several workers those hit SQLite files (busy
+timeouts of several seconds), so they run via ``asyncio.to_thread``:
+a slow write delays one request, not every stream on the loop.
+
+    uvicorn asgi:app --app-dir py_system --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from ai_model import aget_ai_reply, aiter_ai_replies, astream_ai_reply
+from main import (app as flask_app, _batch_concurrency, _batch_cost, _batch_items, _batch_line, _chat_history,
+                  _charge_chat, _check_chat_limits, _client_ip, _large_model_allowed, _quota_after,
+                  _rate_limited_payload, _record_chat_turn, _session_user, _sse)
+from metrics import HTTP_IN_FLIGHT, HTTP_LATENCY
+
+# Flask requests in flight at once per worker; like gthread's --threads
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '32'))
+_wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    async def run_wsgi_app(self, body):
+        # The base class runs this thread_sensitive, i.e. every request on one shared thread
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+        await sync_to_async(lambda: run(self, body), thread_sensitive=False, executor=_wsgi_executor)()
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+_wsgi = PooledWsgiToAsgi(flask_app)
+
+
+async def _read_json(receive) -> dict:
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _header_list(headers) -> list:
+    return [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in (headers or {}).items()]
+
+
+async def _send_json(send, payload: dict, status: int = 200, headers: dict = None):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode('ascii')),
+                    (b'access-control-allow-origin', b'*')] + _header_list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_stream(send, user_message: str, conv=None, history=None, identity=None, limit=None,
+                       allow_large: bool = True):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                    (b'access-control-allow-origin', b'*')] + _header_list(limit.headers() if limit else None),
+    })
+    parts = []
+    try:
+        async for token in astream_ai_reply(user_message, history=history, allow_large=allow_large):
+            parts.append(token)
+            await send({'type': 'http.response.body', 'body': _sse({"token": token}).encode('utf-8'), 'more_body': True})
+        done = {"done": True}
+        quota = await asyncio.to_thread(_finish_turn, conv, identity, user_message, "".join(parts))
+        if quota is not None:
+            done["quota"] = quota
+        frame = _sse(done)
+    except Exception as e:
+        flask_app.logger.exception('Streaming chat failed')
+        await asyncio.to_thread(_charge_chat, identity, user_message, "".join(parts))
+        frame = _sse({"error": str(e)})
+    await send({'type': 'http.response.body', 'body': frame.encode('utf-8')})
+
+
+def _finish_turn(conv, identity, user_message: str, reply: str):
+    # Blocking (conversation store, limiter counters): called through asyncio.to_thread
+    _record_chat_turn(conv, user_message, reply)
+    _charge_chat(identity, user_message, reply)
+    return _quota_after(identity)
+
+
+def _identify(authorization: Optional[str], ip: Optional[str], cost: int = 1, tokens: int = 0):
+    # Blocking (revoked-token lookup, user store sync, limiter counters): called through asyncio.to_thread
+    identity = (_session_user(authorization), ip)
+    return identity, _check_chat_limits(*identity, cost, tokens), _large_model_allowed(identity)
+
+
+async def _admit(scope, send, cost: int = 1, tokens: int = 0):
+    """Apply chat rate limits; returns (identity, limit, allow_large), or None once a 429 has been sent."""
+    headers = dict(scope.get('headers') or [])
+    forwarded = headers.get(b'x-forwarded-for')
+    authorization = headers.get(b'authorization')
+    client = scope.get('client')
+    ip = _client_ip(client[0] if client else None, forwarded.decode('latin-1') if forwarded else None)
+    identity, limit, allow_large = await asyncio.to_thread(
+        _identify, authorization.decode('latin-1') if authorization else None, ip, cost, tokens)
+    if limit is not None and not limit.allowed:
+        await _send_json(send, _rate_limited_payload(limit), 429, limit.headers())
+        return None
+    return identity, limit, allow_large
+
+
+async def chat(scope, receive, send):
+    data = await _read_json(receive)
+    user_message = data.get("message", "")
+    admitted = await _admit(scope, send)
+    if admitted is None:
+        return
+    identity, limit, allow_large = admitted
+    try:
+        conv, history = await asyncio.to_thread(_chat_history, data, identity[0])
+    except LookupError:
+        await _send_json(send, {'success': False, 'error': 'Conversation not found'}, 404)
+        return
+    if data.get("stream"):
+        await _send_stream(send, user_message, conv, history, identity, limit, allow_large)
+        return
+    reply = await aget_ai_reply(user_message, history=history, allow_large=allow_large)
+    body = {"response": reply}
+    headers = None
+    quota = await asyncio.to_thread(_finish_turn, conv, identity, user_message, reply)
+    if quota is not None:
+        body["quota"] = quota
+        headers = dict(limit.headers(), **{'X-Quota-Remaining': str(quota['remaining_tokens'])})
+    await _send_json(send, body, headers=headers)
+
+
+async def chat_stream(scope, receive, send):
+    data = await _read_json(receive)
+    admitted = await _admit(scope, send)
+    if admitted is None:
+        return
+    try:
+        conv, history = await asyncio.to_thread(_chat_history, data, admitted[0][0])
+    except LookupError:
+        await _send_json(send, {'success': False, 'error': 'Conversation not found'}, 404)
+        return
+    await _send_stream(send, data.get("message", ""), conv, history, *admitted)
+
+
+async def chat_batch(scope, receive, send):
+    data = await _read_json(receive)
+    try:
+        items = _batch_items(data)
+    except ValueError as e:
+        await _send_json(send, {'success': False, 'error': str(e)}, 400)
+        return
+    admitted = await _admit(scope, send, *_batch_cost(items))
+    if admitted is None:
+        return
+    identity, limit, allow_large = admitted
+
+    async def finished(index, reply, error):
+        if error is None:
+            await asyncio.to_thread(_charge_chat, identity, items[index][1], reply)
+        return _batch_line(index, reply, error)
+
+    results = aiter_ai_replies(items, _batch_concurrency(data), allow_large)
+    if not data.get('stream'):
+        lines = [None] * len(items)
+        async for result in results:
+            lines[result[0]] = await finished(*result)
+        await _send_json(send, {'results': lines, 'quota': await asyncio.to_thread(_quota_after, identity)},
+                         headers=limit.headers() if limit else None)
+        return
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/x-ndjson'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                    (b'access-control-allow-origin', b'*')] + _header_list(limit.headers() if limit else None),
+    })
+    async for result in results:
+        line = json.dumps(await finished(*result)) + '\n'
+        await send({'type': 'http.response.body', 'body': line.encode('utf-8'), 'more_body': True})
+    quota = await asyncio.to_thread(_quota_after, identity)
+    done = json.dumps({'done': True, 'count': len(items), 'quota': quota}) + '\n'
+    await send({'type': 'http.response.body', 'body': done.encode('utf-8')})
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+    ('POST', '/api/chat/batch'): chat_batch,
+}
+
+
+async def _timed(handler, scope, receive, send):
+    # Same route metrics as the Flask hooks in main.py: time to response headers
+    method, route, start = scope['method'], scope['path'], time.perf_counter()
+
+    async def send_observed(message):
+        if message['type'] == 'http.response.start':
+            HTTP_LATENCY.observe(time.perf_counter() - start, method=method, route=route, status=message['status'])
+        await send(message)
+
+    with HTTP_IN_FLIGHT.track(method=method, route=route):
+        await handler(scope, receive, send_observed)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            await _timed(handler, scope, receive, send)
+            return
+    await _wsgi(scope, receive, send)
@@ -0,0 +1,225 @@
+"""Fingerprinted, precompressed static assets.
+
+Every file under ``static/`` and ``templates/`` is read once at startup,
+hashed and compressed (gzip, plus brotli when the ``brotli`` package is
+installed) into an in-memory manifest, so serving a page is a dict lookup
+and a write instead of a filesystem walk per hit.
+
+Static files also get a fingerprinted URL (``/static/script.3fa2c91d0b.js``)
+and the templates are rewritten to reference it, so those responses can be
+cached for a year as ``immutable``; a deploy changes the hash and therefore
+the URL. Pages keep their stable URLs and are revalidated with their strong
+ETag instead.
+
+    python py_system/assets.py --out build/assets
+
+writes the same manifest plus the fingerprinted and precompressed files to
+disk, for a CDN or a front proxy (nginx ``gzip_static``/``brotli_static``).
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+# Re-read files whose mtime changed on each lookup; for development only
+ASSET_RELOAD = os.getenv('ASSET_RELOAD', '0') == '1'
+
+ASSET_EXTENSIONS = ('.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.svg', '.ico', '.json')
+# Already-compressed formats gain nothing from another pass
+COMPRESSIBLE = ('.html', '.css', '.js', '.svg', '.json', '.ico')
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+_STATIC_REF = re.compile(r'(["\'])/static/([^"\'?#]+)\1')
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def fingerprinted_name(rel: str, digest: str) -> str:
+    root, ext = os.path.splitext(rel)
+    return f"{root}.{digest}{ext}"
+
+
+class Asset:
+    """One file's bytes in each stored encoding, with its ETag and cache policy."""
+
+    __slots__ = ('path', 'mimetype', 'digest', 'bodies', 'cache_control', 'mtime')
+
+    def __init__(self, path: str, data: bytes, cache_control: str = REVALIDATE, mtime: float = 0.0):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.mimetype.startswith('text/') or self.mimetype in ('application/javascript', 'application/json'):
+            self.mimetype += '; charset=utf-8'
+        self.digest = fingerprint(data)
+        self.bodies: Dict[str, bytes] = {'identity': data}
+        self.cache_control = cache_control
+        self.mtime = mtime
+        if path.endswith(COMPRESSIBLE) and len(data) >= MIN_COMPRESS_SIZE:
+            # mtime=0 keeps the gzip output (and so the build) reproducible
+            self._keep('gzip', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._keep('br', brotli.compress(data, quality=11))
+
+    def _keep(self, encoding: str, body: bytes):
+        if len(body) < len(self.bodies['identity']):
+            self.bodies[encoding] = body
+
+    def etag(self, encoding: str = 'identity') -> str:
+        # Strong ETags must differ between encodings of the same file
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+    def etags(self) -> Iterable[str]:
+        return (self.etag(e) for e in self.bodies)
+
+    def negotiate(self, accept_encoding: str) -> str:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return 'identity'
+
+    def manifest_entry(self) -> dict:
+        return {'etag': self.digest, 'type': self.mimetype, 'cache_control': self.cache_control,
+                'sizes': {e: len(b) for e, b in self.bodies.items()}}
+
+
+def accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _walk(root: str) -> Iterable[Tuple[str, str]]:
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.endswith(ASSET_EXTENSIONS):
+                full = os.path.join(dirpath, filename)
+                yield os.path.relpath(full, root).replace(os.sep, '/'), full
+
+
+def _read(path: str) -> Tuple[bytes, float]:
+    with open(path, 'rb') as f:
+        return f.read(), os.path.getmtime(path)
+
+
+class AssetManifest:
+    """Route table from URL path to Asset, built from the static and templates directories."""
+
+    def __init__(self, static_dir: str = STATIC_DIR, templates_dir: str = TEMPLATES_DIR,
+                 aliases: Optional[Dict[str, str]] = None, reload: bool = ASSET_RELOAD):
+        self.static_dir = static_dir
+        self.templates_dir = templates_dir
+        # Extra page routes, e.g. {'/subscription': 'subscription.html'}
+        self.aliases = dict(aliases or {})
+        self.reload = reload
+        self.routes: Dict[str, Asset] = {}
+        self.static_urls: Dict[str, str] = {}
+        self._sources: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.build()
+
+    def build(self):
+        routes: Dict[str, Asset] = {}
+        static_urls: Dict[str, str] = {}
+        sources: Dict[str, str] = {}
+        for rel, full in _walk(self.static_dir):
+            data, mtime = _read(full)
+            asset = Asset(rel, data, REVALIDATE, mtime)
+            hashed = Asset(rel, data, IMMUTABLE, mtime)
+            url = f"/static/{fingerprinted_name(rel, asset.digest)}"
+            routes[f"/static/{rel}"] = asset
+            routes[url] = hashed
+            static_urls[f"/static/{rel}"] = url
+            sources[f"/static/{rel}"] = sources[url] = full
+        for rel, full in _walk(self.templates_dir):
+            data, mtime = _read(full)
+            if rel.endswith('.html'):
+                data = self._rewrite(data, static_urls)
+            asset = Asset(rel, data, REVALIDATE, mtime)
+            # Same file under both the /templates/ prefix and the bare catch-all
+            routes[f"/templates/{rel}"] = routes[f"/{rel}"] = asset
+            sources[f"/templates/{rel}"] = sources[f"/{rel}"] = full
+        for route, rel in self.aliases.items():
+            if f"/{rel}" in routes:
+                routes[route] = routes[f"/{rel}"]
+                sources[route] = sources[f"/{rel}"]
+        with self._lock:
+            self.routes, self.static_urls, self._sources = routes, static_urls, sources
+
+    @staticmethod
+    def _rewrite(data: bytes, static_urls: Dict[str, str]) -> bytes:
+        def swap(match):
+            url = static_urls.get(f"/static/{match.group(2)}")
+            return f"{match.group(1)}{url}{match.group(1)}" if url else match.group(0)
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data
+        return _STATIC_REF.sub(swap, text).encode('utf-8')
+
+    def _stale(self, route: str, asset: Asset) -> bool:
+        source = self._sources.get(route)
+        try:
+            return source is not None and os.path.getmtime(source) != asset.mtime
+        except OSError:
+            return True
+
+    def get(self, route: str) -> Optional[Asset]:
+        asset = self.routes.get(route)
+        if asset is not None and self.reload and self._stale(route, asset):
+            # A static file change moves its fingerprint and every page that links it
+            self.build()
+            asset = self.routes.get(route)
+        return asset
+
+    def url_for(self, static_path: str) -> str:
+        return self.static_urls.get(static_path, static_path)
+
+    def manifest(self) -> dict:
+        return {'static': dict(self.static_urls),
+                'routes': {route: a.manifest_entry() for route, a in sorted(self.routes.items())}}
+
+    def write(self, out_dir: str) -> str:
+        """Write each file (and its .gz/.br siblings) under out_dir plus manifest.json; returns the manifest path."""
+        for route, asset in self.routes.items():
+            if not route.endswith(ASSET_EXTENSIONS):
+                continue  # page aliases share their target's file
+            target = os.path.join(out_dir, route.lstrip('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for encoding, body in asset.bodies.items():
+                suffix = {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+                with open(target + suffix, 'wb') as f:
+                    f.write(body)
+        path = os.path.join(out_dir, 'manifest.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest(), f, indent=2)
+        return path
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('--out', default=os.path.join(BASE_DIR, 'build', 'assets'))
+    args = parser.parse_args()
+    manifest = AssetManifest()
+    print(f"Wrote {len(manifest.routes)} routes to {manifest.write(args.out)}"
+          f" (brotli {'on' if brotli is not None else 'off: pip install brotli'})")
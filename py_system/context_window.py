@@ -0,0 +1,87 @@
+"""Token-budgeted context windows for multi-turn chats.
+
+Every stored message carries its token estimate, and each conversation a
+running total, so building the prompt for a new turn walks back from the
+newest message summing cached counts instead of re-tokenizing the whole
+history. Turns that no longer fit are folded into a short extractive
+summary so the model keeps the gist of the early conversation.
+"""
+import os
+from typing import List, Optional
+
+# Prompt budgets (tokens) per model, leaving room for the reply within the context window
+MODEL_CONTEXT_BUDGETS = {
+    'llama-3.1-8b-instant': int(os.getenv('CONTEXT_BUDGET_8B', '6000')),
+    'llama-3.1-70b-versatile': int(os.getenv('CONTEXT_BUDGET_70B', '12000')),
+}
+DEFAULT_CONTEXT_BUDGET = int(os.getenv('CONTEXT_BUDGET_DEFAULT', '4000'))
+# Share of the budget the summary of trimmed turns may use
+SUMMARY_SHARE = 0.15
+
+
+def count_tokens(text: str) -> int:
+    # ~4 characters per token for English text with Llama tokenizers; cheap and monotonic
+    return max(1, (len(text or '') + 3) // 4)
+
+
+def context_budget(model: str) -> int:
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def make_message(role: str, content: str) -> dict:
+    return {'role': role, 'content': content, 'tokens': count_tokens(content)}
+
+
+def append_message(conversation: dict, role: str, content: str) -> dict:
+    """Append a message to a conversation record and keep its running token count."""
+    message = make_message(role, content)
+    conversation.setdefault('messages', []).append(message)
+    conversation['token_count'] = conversation.get('token_count', 0) + message['tokens']
+    return message
+
+
+def _first_sentence(text: str, limit: int = 160) -> str:
+    text = ' '.join(text.split())
+    for sep in ('. ', '? ', '! ', '\n'):
+        i = text.find(sep)
+        if 0 < i < limit:
+            return text[:i + 1]
+    return text[:limit] + ('...' if len(text) > limit else '')
+
+
+def summarize_turns(messages: List[dict], budget: int) -> Optional[str]:
+    """Extractive summary of trimmed turns: the opening sentence of each, newest kept first."""
+    lines = []
+    used = 0
+    for m in reversed(messages):
+        line = f"{'User' if m['role'] == 'user' else 'Assistant'}: {_first_sentence(m['content'])}"
+        cost = count_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return None
+    return 'Summary of earlier conversation:\n' + '\n'.join(reversed(lines))
+
+
+def build_context(history: List[dict], prompt: str, budget: int) -> List[dict]:
+    """Chat messages for the model: as much recent history as fits the budget, then the prompt."""
+    remaining = budget - count_tokens(prompt)
+    summary_budget = int(budget * SUMMARY_SHARE)
+    kept = []
+    cut = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        tokens = history[i].get('tokens') or count_tokens(history[i]['content'])
+        if tokens > remaining - (summary_budget if i else 0):
+            break
+        kept.append({'role': history[i]['role'], 'content': history[i]['content']})
+        remaining -= tokens
+        cut = i
+    kept.reverse()
+    if cut > 0:
+        summary = summarize_turns(history[:cut], min(summary_budget, max(remaining, 0)))
+        if summary:
+            kept.insert(0, {'role': 'system', 'content': summary})
+    kept.append({'role': 'user', 'content': prompt})
+    return kept
@@ -0,0 +1,230 @@
+"""Conversation store partitioned by owner.
+
+Records live in an id -> record dict; each owner also has a list of
+(ts, id) keys kept sorted by timestamp. New conversations almost always
+carry the newest timestamp, so inserting is an append, lookups by id are
+O(1) and a page of ``limit`` items before a cursor is a bisect plus a
+slice. Writes go through to the storage backend; with a shared backend,
+reads first pick up conversations other workers saved.
+
+Once an owner has searched, every path that changes one of their records
+(save, appended chat turns, records picked up from other workers) also
+updates the full-text index in search_index.py, so search never scans
+message bodies.
+
+Every write stamps the record with ``updated``, and each owner's latest
+stamp is kept alongside their keys. Together with the record count that
+is the owner's version, which the API turns into ETags (see
+http_cache.py). The stamp is saved with the record, so workers that pick
+the change up agree on the version.
+"""
+import bisect
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from context_window import append_message
+from search_index import SearchIndex, snippet
+from storage import MemoryBackend, StorageBackend
+
+# Fields returned by listings; message bodies are only sent for a single conversation
+SUMMARY_FIELDS = ('id', 'title', 'ts')
+
+
+def encode_cursor(ts: float, conv_id: str) -> str:
+    return f"{ts!r}:{conv_id}"
+
+
+def modified_at(item: dict) -> float:
+    # Records saved before stamps existed fall back to their creation time
+    return item.get('updated') or item.get('ts', 0)
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[float, str]]:
+    ts, sep, conv_id = (cursor or '').partition(':')
+    try:
+        return (float(ts), conv_id) if sep else (float(ts), '')
+    except ValueError:
+        return None
+
+
+class ConversationStore:
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_owner = {}
+        self._modified = {}
+        self._index = SearchIndex()
+        self.backend = backend if backend is not None else MemoryBackend()
+        self._load_all()
+        self.backend.subscribe('conversation', self._refresh)
+
+    def _load_all(self):
+        self._by_id.clear()
+        self._by_owner.clear()
+        self._modified.clear()
+        self._index.clear()
+        for item in self.backend.load_conversations():
+            self._insert(item)
+
+    def _refresh(self, conv_ids: Optional[List[str]]):
+        # Called by backend.sync() with the conversations another worker saved; None means reload everything
+        with self._lock:
+            if conv_ids is None:
+                self._load_all()
+                return
+            for conv_id in conv_ids:
+                item = self.backend.load_conversation(conv_id)
+                if item is not None:
+                    self._insert(item)
+
+    def __len__(self) -> int:
+        self.backend.sync()
+        return len(self._by_id)
+
+    def __contains__(self, conv_id: str) -> bool:
+        self.backend.sync()
+        return conv_id in self._by_id
+
+    def _insert(self, item: dict):
+        previous = self._by_id.get(item['id'])
+        if previous is not None:
+            self._remove_key(previous)
+        self._by_id[item['id']] = item
+        self._index.add(item)
+        self._touch(item)
+        keys = self._by_owner.setdefault(item.get('owner'), [])
+        key = (item.get('ts', 0), item['id'])
+        if not keys or keys[-1] <= key:
+            keys.append(key)
+        else:
+            bisect.insort(keys, key)
+
+    def _remove_key(self, item: dict):
+        keys = self._by_owner.get(item.get('owner'), [])
+        key = (item.get('ts', 0), item['id'])
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def _touch(self, item: dict):
+        owner = item.get('owner')
+        self._modified[owner] = max(self._modified.get(owner, 0), modified_at(item))
+
+    def _stamp(self, item: dict):
+        # Never behind the owner's latest known change, so versions only move forward under clock skew
+        item['updated'] = round(max(time.time(), self._modified.get(item.get('owner'), 0) + 0.001), 3)
+
+    def save(self, item: dict):
+        # Insert or replace a conversation and persist it
+        with self._lock:
+            self._stamp(item)
+            self._insert(item)
+        self.backend.save_conversation(item)
+
+    def save_many(self, items: List[dict]):
+        # Bulk import: one backend commit for the whole batch
+        with self._lock:
+            for item in items:
+                self._stamp(item)
+                self._insert(item)
+        self.backend.save_conversations(items)
+
+    def append_messages(self, conv_id: str, messages: List[Tuple[str, str]]) -> Optional[dict]:
+        # Append (role, content) pairs, keeping each message's token count and the running total
+        self.backend.sync()
+        with self._lock:
+            item = self._by_id.get(conv_id)
+            if item is None:
+                return None
+            for role, content in messages:
+                append_message(item, role, content)
+            self._index.extend(item, [content for _, content in messages])
+            self._stamp(item)
+            self._touch(item)
+        self.backend.save_conversation(item)
+        return item
+
+    def get(self, conv_id: str, owner: Optional[str] = None) -> Optional[dict]:
+        self.backend.sync()
+        item = self._by_id.get(conv_id)
+        if item is None:
+            return None
+        # Strict: a conversation saved without an owner is not anyone's to read
+        if item.get('owner') != owner:
+            return None
+        return item
+
+    def owner_of(self, conv_id: str) -> Tuple[bool, Optional[str]]:
+        """(exists, owner) for a conversation id, without the owner check ``get`` applies."""
+        self.backend.sync()
+        item = self._by_id.get(conv_id)
+        return (True, item.get('owner')) if item is not None else (False, None)
+
+    def iter_owner(self, owner: Optional[str], chunk: int = 500) -> Iterator[dict]:
+        """Every conversation of one owner, oldest first.
+
+        Keys are read ``chunk`` at a time under the lock, so a long export
+        neither copies the owner's whole history nor holds up writers.
+        """
+        self.backend.sync()
+        after = None
+        while True:
+            with self._lock:
+                keys = self._by_owner.get(owner, [])
+                start = 0 if after is None else bisect.bisect_right(keys, after)
+                window = keys[start:start + chunk]
+                items = [self._by_id[cid] for _, cid in window]
+            if not window:
+                return
+            after = window[-1]
+            yield from items
+
+    def count(self, owner: Optional[str]) -> int:
+        self.backend.sync()
+        return len(self._by_owner.get(owner, ()))
+
+    def version(self, owner: Optional[str]) -> Tuple[int, float]:
+        """(record count, latest change) for one owner; changes whenever any of their records does."""
+        self.backend.sync()
+        with self._lock:
+            return len(self._by_owner.get(owner, ())), self._modified.get(owner, 0)
+
+    def page(self, owner: Optional[str], limit: int = 20, before: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Newest-first summaries for one owner, strictly older than the ``before`` cursor.
+
+        Returns (items, next_cursor); next_cursor is None on the last page.
+        """
+        self.backend.sync()
+        with self._lock:
+            keys = self._by_owner.get(owner, [])
+            end = len(keys)
+            if before:
+                decoded = decode_cursor(before)
+                if decoded is not None:
+                    end = bisect.bisect_left(keys, decoded)
+            start = max(0, end - limit)
+            window = keys[start:end]
+            items = [{f: self._by_id[cid].get(f) for f in SUMMARY_FIELDS} for _, cid in reversed(window)]
+        next_cursor = encode_cursor(*window[0]) if start > 0 and window else None
+        return items, next_cursor
+
+    def search(self, owner: Optional[str], query: str, limit: int = 20, offset: int = 0) -> Tuple[List[dict], int]:
+        """Ranked summaries of one owner's conversations matching ``query``, with a snippet each.
+
+        Returns (items, total_matches).
+        """
+        self.backend.sync()
+        with self._lock:
+            if not self._index.built(owner):
+                self._index.build(owner, [self._by_id[cid] for _, cid in self._by_owner.get(owner, ())])
+            ranked, total, terms = self._index.search(owner, query, limit, offset,
+                                                      recency=lambda cid: self._by_id[cid].get('ts', 0))
+            items = []
+            for conv_id, score in ranked:
+                item = self._by_id[conv_id]
+                summary = {f: item.get(f) for f in SUMMARY_FIELDS}
+                summary['score'] = score
+                summary['snippet'] = snippet(item, terms)
+                items.append(summary)
+        return items, total
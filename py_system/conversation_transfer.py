@@ -0,0 +1,270 @@
+"""Bulk export and import of conversations as newline-delimited JSON.
+
+Each line is one conversation record. Both directions are generator
+pipelines, so memory use does not grow with the history:
+
+* export: records -> ``ndjson_chunks`` (lines grouped into ~64 KB writes)
+  -> optionally ``gzip_chunks`` -> the response or the output file;
+* import: raw byte chunks -> ``ndjson_lines`` (gzip detected from the
+  magic bytes, lines capped at IMPORT_MAX_LINE_BYTES) -> ``validate``
+  -> ``import_lines``. That saves IMPORT_BATCH_SIZE records per commit,
+  so a big restore is a few hundred SQLite transactions, not one per
+  conversation.
+
+A bad line is counted and reported with its line number; it does not
+stop the import. Batches already committed stay committed.
+
+The HTTP routes in main.py go through the in-memory ConversationStore.
+The command line works on the storage backend directly (STORAGE_BACKEND,
+STORAGE_PATH), e.g. to back up or migrate while the app is down:
+
+    python py_system/conversation_transfer.py export --gzip -o backup.ndjson.gz
+    python py_system/conversation_transfer.py import backup.ndjson.gz --owner alice
+"""
+import itertools
+import json
+import math
+import os
+import sys
+import time
+import zlib
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from context_window import make_message
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_LINE_BYTES = int(os.getenv('IMPORT_MAX_LINE_BYTES', str(4 * 1024 * 1024)))
+# Only the first few bad lines are reported back; all of them are counted
+MAX_REPORTED_ERRORS = 20
+CHUNK_BYTES = 64 * 1024
+MAX_ID_LENGTH = 200
+ROLES = ('user', 'assistant', 'system')
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def ndjson_chunks(records: Iterable[dict], chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Serialise records one per line, yielding about ``chunk_bytes`` at a time."""
+    buffer, size = [], 0
+    for record in records:
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    # wbits=31 writes a gzip header and trailer, so the output is a regular .gz file
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def read_chunks(stream, size: int = CHUNK_BYTES) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson_lines(chunks: Iterable[bytes], max_line: int = IMPORT_MAX_LINE_BYTES) -> Iterator[Tuple[int, Optional[bytes]]]:
+    """(line number, line) for each non-blank line; the line is None when longer than ``max_line``.
+
+    Gzip input is recognised by its magic bytes and decompressed on the fly.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    decompressor = zlib.decompressobj(31) if first[:2] == GZIP_MAGIC else None
+
+    def raw() -> Iterator[bytes]:
+        for data in itertools.chain((first,), chunks):
+            if decompressor is None:
+                yield data
+                continue
+            # Bounded output per call, so a small gzip bomb cannot expand all at once
+            data = decompressor.decompress(data, CHUNK_BYTES)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_BYTES)
+
+    lineno, pending, skipping = 0, b'', False
+    for data in raw():
+        start = 0
+        while True:
+            end = data.find(b'\n', start)
+            if end < 0:
+                if not skipping:
+                    pending += data[start:]
+                    if len(pending) > max_line:
+                        pending, skipping = b'', True
+                break
+            lineno += 1
+            if skipping:
+                yield lineno, None
+            else:
+                line = pending + data[start:end]
+                if len(line) > max_line:
+                    yield lineno, None
+                elif line.strip():
+                    yield lineno, line
+            pending, skipping, start = b'', False, end + 1
+    if skipping:
+        yield lineno + 1, None
+    elif pending.strip():
+        yield lineno + 1, pending
+
+
+def validate(record, owner: Optional[str] = None, keep_owner: bool = False) -> dict:
+    """A clean conversation record from an imported one; raises ValueError.
+
+    The owner becomes ``owner``, unless ``keep_owner`` keeps the record's
+    own (offline migrations). Unknown fields are dropped, and message token
+    counts are recomputed.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Not a JSON object')
+    conv_id = record.get('id')
+    if not isinstance(conv_id, str) or not conv_id.strip() or len(conv_id) > MAX_ID_LENGTH:
+        raise ValueError('Missing or invalid id')
+    for field in ('title', 'user', 'ai'):
+        if not isinstance(record.get(field) or '', str):
+            raise ValueError(f'{field} must be a string')
+    ts = record.get('ts', time.time())
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)) or not math.isfinite(ts) or ts < 0:
+        raise ValueError('ts must be a non-negative number')
+    item = {
+        'id': conv_id,
+        'owner': (record.get('owner') or None) if keep_owner else owner,
+        'title': record.get('title') or (record.get('user') or '')[:40] or 'Imported chat',
+        'user': record.get('user') or '',
+        'ai': record.get('ai') or '',
+        'ts': ts,
+    }
+    if item['owner'] is not None and not isinstance(item['owner'], str):
+        raise ValueError('owner must be a string')
+    messages = record.get('messages')
+    if messages is not None:
+        if not isinstance(messages, list):
+            raise ValueError('messages must be a list')
+        item['messages'] = []
+        for message in messages:
+            if (not isinstance(message, dict) or message.get('role') not in ROLES
+                    or not isinstance(message.get('content'), str)):
+                raise ValueError('Each message needs a role (user, assistant, system) and string content')
+            item['messages'].append(make_message(message['role'], message['content']))
+        item['token_count'] = sum(m['tokens'] for m in item['messages'])
+    return item
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[dict] = []
+
+    def fail(self, lineno: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': lineno, 'error': error})
+
+    def as_dict(self) -> dict:
+        return {'imported': self.imported, 'failed': self.failed, 'batches': self.batches, 'errors': self.errors}
+
+
+def import_lines(lines: Iterable[Tuple[int, Optional[bytes]]], save_batch: Callable[[List[dict]], None],
+                 check: Callable[[dict], Optional[str]] = lambda item: None, owner: Optional[str] = None,
+                 keep_owner: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    """Validate ``ndjson_lines`` output and hand it to ``save_batch`` ``batch_size`` records at a time.
+
+    ``check`` may veto a valid record (e.g. an id owned by someone else) by
+    returning an error message. An id seen twice keeps its last line.
+    """
+    result, batch = ImportResult(), []
+    for lineno, line in lines:
+        if line is None:
+            result.fail(lineno, 'Line too long')
+            continue
+        try:
+            item = validate(json.loads(line), owner, keep_owner)
+        except ValueError as e:  # json.JSONDecodeError is a ValueError too
+            result.fail(lineno, str(e))
+            continue
+        error = check(item)
+        if error:
+            result.fail(lineno, error)
+            continue
+        batch.append(item)
+        result.imported += 1
+        if len(batch) >= batch_size:
+            save_batch(batch)
+            result.batches += 1
+            batch = []
+    if batch:
+        save_batch(batch)
+        result.batches += 1
+    return result
+
+
+def main(argv=None):
+    import argparse
+    from storage import open_backend
+
+    parser = argparse.ArgumentParser(description='Export or import conversations as NDJSON')
+    parser.add_argument('--backend', help='sqlite, jsonl or memory (default: STORAGE_BACKEND)')
+    parser.add_argument('--path', help='storage file (default: STORAGE_PATH)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write conversations to a file or stdout')
+    export.add_argument('-o', '--out', help='output file (default: stdout)')
+    export.add_argument('--owner', help='only this user\'s conversations')
+    export.add_argument('--gzip', action='store_true')
+    load = commands.add_parser('import', help='read conversations from a file or stdin (plain or gzip)')
+    load.add_argument('file', nargs='?', help='input file (default: stdin)')
+    load.add_argument('--owner', help='assign every record to this user instead of its own owner')
+    load.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    backend = open_backend(args.backend, args.path)
+    try:
+        if args.command == 'export':
+            records = (item for item in backend.load_conversations()
+                       if args.owner is None or item.get('owner') == args.owner)
+            chunks = gzip_chunks(ndjson_chunks(records)) if args.gzip else ndjson_chunks(records)
+            out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+            try:
+                for chunk in chunks:
+                    out.write(chunk)
+            finally:
+                if args.out:
+                    out.close()
+            return 0
+
+        def save_batch(items: List[dict]):
+            # Stamped so running workers see a new version of each owner's data (see http_cache.py)
+            now = round(time.time(), 3)
+            for item in items:
+                item['updated'] = now
+            backend.save_conversations(items)
+
+        source = open(args.file, 'rb') if args.file else sys.stdin.buffer
+        try:
+            result = import_lines(ndjson_lines(read_chunks(source)), save_batch, owner=args.owner,
+                                  keep_owner=args.owner is None, batch_size=args.batch_size)
+        finally:
+            if args.file:
+                source.close()
+        print(json.dumps(result.as_dict()), file=sys.stderr)
+        return 0 if not result.failed else 1
+    finally:
+        backend.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
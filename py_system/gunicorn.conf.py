@@ -0,0 +1,73 @@
+"""Production server: gunicorn pre-forking N workers of the ASGI app.
+
+    gunicorn -c py_system/gunicorn.conf.py
+
+Each worker is a uvicorn event loop serving ``asgi:app`` (chat routes run
+natively, everything else through Flask). The chat routes' SQLite work
+(history, rate-limit counters, the shared response cache) runs in threads
+off the loop, so a busy database does not stall other streams.
+GUNICORN_WORKER_CLASS=gthread serves the plain WSGI factory
+``main:create_app()`` on threads instead.
+
+Workers import the app themselves (no preload), so the background threads
+and SQLite connections every worker starts are never shared across a fork.
+State that must agree between workers lives in SQLite files under data/:
+users and conversations (STORAGE_BACKEND=sqlite, see storage.py), the job
+queue (JOBS_DB), rate-limit counters (RATE_LIMIT_DB), the response cache
+(AI_CACHE_DB), webhook-fed Stripe state (STRIPE_MIRROR_DB) and session
+revocations (SESSION_DB). Those last ones
+default to per-process when run on their own; this file points them at
+shared files unless they are set explicitly, and hands every worker the
+same SESSION_SECRET.
+"""
+import multiprocessing
+import os
+import secrets
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(2 * multiprocessing.cpu_count() + 1, 8))))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+if worker_class == 'gthread':
+    wsgi_app = 'main:create_app()'
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+else:
+    wsgi_app = 'asgi:app'
+preload_app = False
+# Streaming chat replies can run well past gunicorn's 30s default
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+# Recycle workers now and then; jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+# Stores that would silently split users and chats across processes
+PER_PROCESS_STORAGE = ('memory', 'jsonl')
+
+
+def on_starting(server):
+    # Tokens must verify in every worker, including ones recycled by max_requests
+    if not os.getenv('SESSION_SECRET'):
+        server.log.warning('SESSION_SECRET not set; sessions will not survive a server restart')
+        os.environ['SESSION_SECRET'] = secrets.token_hex(32)
+    os.environ.setdefault('SESSION_DB', os.path.join(DATA_DIR, 'sessions.db'))
+    if workers <= 1:
+        return
+    storage = os.getenv('STORAGE_BACKEND', 'sqlite').lower()
+    if storage in PER_PROCESS_STORAGE:
+        raise RuntimeError(f"STORAGE_BACKEND={storage} keeps state per process; "
+                           f"use sqlite with {workers} workers (or WEB_CONCURRENCY=1)")
+    if os.getenv('JOBS_DB') == ':memory:':
+        raise RuntimeError("JOBS_DB=:memory: gives each worker its own job queue; use a file with several workers")
+    # Inherited by the workers forked after this hook
+    os.environ.setdefault('RATE_LIMIT_DB', os.path.join(DATA_DIR, 'rate_limits.db'))
+    os.environ.setdefault('AI_CACHE_DB', os.path.join(DATA_DIR, 'ai_cache.db'))
+    os.environ.setdefault('STRIPE_MIRROR_DB', os.path.join(DATA_DIR, 'stripe_mirror.db'))
+    server.log.info('Shared state: storage=%s rate_limits=%s ai_cache=%s stripe_mirror=%s', storage,
+                    os.environ['RATE_LIMIT_DB'], os.environ['AI_CACHE_DB'], os.environ['STRIPE_MIRROR_DB'])
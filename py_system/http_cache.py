@@ -0,0 +1,92 @@
+"""Conditional and compressed JSON API responses.
+
+Conversation listings and single conversations carry a strong ETag taken
+from the store's version of what they show (ConversationStore.version /
+modified_at): the owner's record count and latest change for a listing,
+the record's own change time and message count for one conversation.
+The version is known before the body is built, so a matching
+``If-None-Match`` is answered 304 without serialising anything. Versions
+come from an ``updated`` stamp saved with each record, so every worker
+hands out the same ETag for the same data.
+
+JSON bodies of at least JSON_COMPRESS_MIN bytes are gzip (or brotli, when
+installed) compressed after the view has run, if the client accepts it.
+As for static assets, the ETag gets an encoding suffix so that each
+representation keeps its own strong validator.
+
+Responses that only change at deploy (Stripe and OAuth config, chat
+defaults) are built once as assets.Asset objects and served like static
+files; see ``json_asset``.
+"""
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from flask import Response
+from werkzeug.datastructures import ETags
+
+from assets import Asset, accepted_encodings, brotli
+
+JSON_COMPRESS_MIN = int(os.getenv('JSON_COMPRESS_MIN', '1024'))
+# Per response, so cheaper settings than the build-time asset compression
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Per-user data: browsers may keep it, shared caches may not, and it is revalidated every time
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+
+def json_asset(name: str, payload) -> Asset:
+    """A JSON response serialised (and compressed, if large enough) once."""
+    return Asset(f'{name}.json', json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+
+def version_etag(*parts) -> str:
+    return '"' + '.'.join(str(p) for p in parts) + '"'
+
+
+def etag_matches(if_none_match: ETags, etag: str) -> bool:
+    """Whether If-None-Match names ``etag`` in any encoding (weak comparison, as for GET)."""
+    if if_none_match.star_tag:
+        return True
+    value = etag.strip('"')
+    return any(if_none_match.contains_weak(v) for v in (value, f'{value}-br', f'{value}-gzip'))
+
+
+def with_validators(response: Response, etag: str, modified: Optional[float]) -> Response:
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = PRIVATE_REVALIDATE
+    response.vary.add('Accept-Encoding')
+    if modified:
+        response.last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    return response
+
+
+def not_modified(etag: str, modified: Optional[float]) -> Response:
+    return with_validators(Response(status=304), etag, modified)
+
+
+def compress_json(response: Response, accept_encoding: str, minimum: int = JSON_COMPRESS_MIN) -> Response:
+    """Compress a buffered JSON response in place when it is large and the client accepts it."""
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < minimum:
+        return response
+    response.vary.add('Accept-Encoding')
+    accepted = accepted_encodings(accept_encoding)
+    encoding = next((e for e in ENCODINGS if e in accepted), None)
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    etag = response.headers.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return response
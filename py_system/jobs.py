@@ -0,0 +1,292 @@
+"""Background job queue for slow side effects (emails, webhook processing, ...).
+
+Jobs are rows in a small SQLite table, so queued work survives a restart
+and several worker processes can share one queue file. A pool of daemon
+threads claims due jobs, runs the registered handler and deletes the row
+on success; failures are retried with exponential backoff and parked as
+``dead`` after ``max_attempts``. A handler that raises (or, batched, returns)
+a ``PermanentJobError`` marks its job ``dead`` at once: retrying it cannot help.
+
+Handlers registered with ``batch_size > 1`` receive up to that many
+payloads of the same kind at once and return one result per payload
+(``None`` for success or the exception that failed it).
+
+A queue only claims the kinds it has handlers for, so separate queues
+(e.g. one per subsystem, each with its own worker count) can share a file.
+Jobs enqueued with a ``dedup_key`` are accepted once per key; the key is
+marked done when its job succeeds. A job that goes ``dead`` releases its
+key, so a redelivery of the same event can be queued again, and done keys
+are forgotten after ``key_ttl`` seconds (longer than any sender retries for).
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+# Stripe retries a webhook for up to three days; keys are kept a while longer
+JOB_KEY_TTL = float(os.getenv('JOB_KEY_TTL', str(7 * 86400)))
+# How often workers drop expired keys
+KEY_PRUNE_INTERVAL = 3600.0
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind       TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    run_at     REAL NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'queued',
+    locked_at  REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+CREATE TABLE IF NOT EXISTS job_keys (
+    key        TEXT PRIMARY KEY,
+    job_id     INTEGER,
+    created_at REAL NOT NULL,
+    done_at    REAL
+);
+"""
+
+
+class PermanentJobError(Exception):
+    """A failure that will recur on every attempt; the job is parked without retries."""
+
+
+class _Handler:
+    __slots__ = ('fn', 'batch_size')
+
+    def __init__(self, fn: Callable, batch_size: int):
+        self.fn = fn
+        self.batch_size = batch_size
+
+
+class JobQueue:
+    def __init__(self, db_path: str = ':memory:', workers: int = 2, max_attempts: int = 5,
+                 backoff: float = 2.0, max_backoff: float = 300.0, lease: float = 300.0, poll_interval: float = 1.0,
+                 key_ttl: float = JOB_KEY_TTL):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.key_ttl = key_ttl
+        self._next_prune = 0.0
+        self._handlers: Dict[str, _Handler] = {}
+        # One connection guarded by a lock: job traffic is light and this works for ':memory:' too
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        if db_path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(JOBS_SCHEMA)
+        self._wake = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.completed = 0
+        self.failed = 0
+
+    def register(self, kind: str, fn: Callable, batch_size: int = 1):
+        self._handlers[kind] = _Handler(fn, batch_size)
+
+    def enqueue(self, kind: str, payload: dict, delay: float = 0.0, dedup_key: Optional[str] = None) -> Optional[int]:
+        """Queue a job; returns its id, or None if ``dedup_key`` was already seen."""
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if dedup_key is not None:
+                    cur = self._conn.execute("INSERT OR IGNORE INTO job_keys (key, created_at) VALUES (?, ?)",
+                                             (dedup_key, now))
+                    if cur.rowcount == 0:
+                        self._conn.execute('COMMIT')
+                        return None
+                cur = self._conn.execute("INSERT INTO jobs (kind, payload, run_at) VALUES (?, ?, ?)",
+                                         (kind, json.dumps(payload), now + delay))
+                job_id = cur.lastrowid
+                if dedup_key is not None:
+                    self._conn.execute("UPDATE job_keys SET job_id = ? WHERE key = ?", (job_id, dedup_key))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        with self._wake:
+            self._wake.notify()
+        return job_id
+
+    def is_done(self, dedup_key: str) -> bool:
+        with self._db_lock:
+            row = self._conn.execute("SELECT done_at FROM job_keys WHERE key = ?", (dedup_key,)).fetchone()
+        return bool(row and row[0])
+
+    def pending(self) -> int:
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status != 'dead'").fetchone()[0]
+
+    def dead(self) -> List[dict]:
+        with self._db_lock:
+            rows = self._conn.execute("SELECT id, kind, payload, attempts, last_error FROM jobs WHERE status = 'dead'")
+            return [{'id': r[0], 'kind': r[1], 'payload': json.loads(r[2]), 'attempts': r[3], 'error': r[4]}
+                    for r in rows]
+
+    # ---- worker side ----
+
+    def _claim(self) -> List[tuple]:
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Jobs left 'running' by a crashed worker become due again once their lease expires
+                kinds = list(self._handlers)
+                marks = ', '.join('?' * len(kinds))
+                row = self._conn.execute(
+                    f"SELECT kind FROM jobs WHERE kind IN ({marks}) AND ((status = 'queued' AND run_at <= ?) "
+                    "OR (status = 'running' AND locked_at < ?)) ORDER BY run_at LIMIT 1",
+                    kinds + [now, now - self.lease]).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return []
+                kind = row[0]
+                limit = self._handlers[kind].batch_size
+                rows = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE kind = ? AND ((status = 'queued' AND run_at <= ?) "
+                    "OR (status = 'running' AND locked_at < ?)) ORDER BY run_at LIMIT ?",
+                    (kind, now, now - self.lease, limit)).fetchall()
+                self._conn.executemany("UPDATE jobs SET status = 'running', locked_at = ? WHERE id = ?",
+                                       [(now, r[0]) for r in rows])
+                self._conn.execute('COMMIT')
+                return rows
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _finish(self, job_id: int, attempts: int, error: Optional[BaseException]):
+        with self._db_lock:
+            if error is None:
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                self._conn.execute("UPDATE job_keys SET done_at = ? WHERE job_id = ?", (time.time(), job_id))
+                self.completed += 1
+                return
+            attempts += 1
+            self.failed += 1
+            if attempts >= self.max_attempts or isinstance(error, PermanentJobError):
+                self._conn.execute("UPDATE jobs SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                                   (attempts, repr(error), job_id))
+                # Nothing will finish this key now; let a redelivery queue a fresh job
+                self._conn.execute("DELETE FROM job_keys WHERE job_id = ?", (job_id,))
+                return
+            delay = min(self.max_backoff, self.backoff * (2 ** (attempts - 1))) * random.uniform(0.8, 1.2)
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = ?, run_at = ?, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, repr(error), job_id))
+
+    def _run(self, rows: List[tuple]):
+        kind = rows[0][1]
+        handler = self._handlers[kind]
+        payloads = [json.loads(r[2]) for r in rows]
+        if handler.batch_size > 1:
+            try:
+                results = handler.fn(payloads)
+            except Exception as e:
+                results = [e] * len(rows)
+        else:
+            results = []
+            for payload in payloads:
+                try:
+                    handler.fn(payload)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+        for row, error in zip(rows, results):
+            self._finish(row[0], row[3], error)
+
+    def run_pending(self) -> int:
+        """Process due jobs on the calling thread until none are left; returns how many ran."""
+        done = 0
+        while True:
+            rows = self._claim()
+            if not rows:
+                return done
+            self._run(rows)
+            done += len(rows)
+
+    def _idle_wait(self) -> float:
+        # Sleep until the next retry is due, but never longer than the poll interval
+        with self._db_lock:
+            kinds = list(self._handlers)
+            row = self._conn.execute(
+                f"SELECT MIN(run_at) FROM jobs WHERE status = 'queued' AND kind IN ({', '.join('?' * len(kinds))})",
+                kinds).fetchone()
+        if row is None or row[0] is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, row[0] - time.time()))
+
+    def prune_keys(self, now: Optional[float] = None) -> int:
+        """Forget done dedup keys older than ``key_ttl``; returns how many were dropped."""
+        now = now if now is not None else time.time()
+        with self._db_lock:
+            cur = self._conn.execute("DELETE FROM job_keys WHERE done_at IS NOT NULL AND done_at < ?",
+                                     (now - self.key_ttl,))
+        return cur.rowcount
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                if time.time() >= self._next_prune:
+                    self._next_prune = time.time() + KEY_PRUNE_INTERVAL
+                    self.prune_keys()
+                rows = self._claim()
+            except sqlite3.Error:
+                rows = []
+            if rows:
+                self._run(rows)
+                continue
+            with self._wake:
+                self._wake.wait(self._idle_wait())
+
+    def start(self) -> 'JobQueue':
+        if self._threads:
+            return self
+        self._stopping.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        with self._wake:
+            self._wake.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        # Used by scripts and shutdown hooks to drain the queue
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            kinds = list(self._handlers)
+            with self._db_lock:
+                busy = self._conn.execute(
+                    f"SELECT COUNT(*) FROM jobs WHERE kind IN ({', '.join('?' * len(kinds))}) "
+                    "AND (status = 'running' OR (status = 'queued' AND run_at <= ?))",
+                    kinds + [time.time()]).fetchone()[0]
+            if not busy:
+                return True
+            time.sleep(0.01)
+        return False
+
+
+def open_job_queue(workers: Optional[int] = None) -> JobQueue:
+    # JOBS_DB: SQLite file for the queue (':memory:' keeps jobs only for this process)
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    default = ':memory:' if os.getenv('STORAGE_BACKEND', 'sqlite').lower() == 'memory' \
+        else os.path.join(base_dir, 'data', 'jobs.db')
+    return JobQueue(db_path=os.getenv('JOBS_DB', default),
+                    workers=workers if workers is not None else int(os.getenv('JOB_WORKERS', '2')),
+                    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '5')))
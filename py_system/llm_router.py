@@ -0,0 +1,704 @@
+"""Latency-aware routing of chat completions across LLM backends.
+
+A backend is one model on one provider. Every model name the app asks for
+(``llama-3.1-8b-instant``, ...) maps to an ordered list of backends that
+can serve it; by default that is just the same model on Groq. For each
+request the router:
+
+* skips backends whose circuit breaker is open (too many recent failures);
+  if every backend of a route is open it still tries the one that failed
+  longest ago, so breakers steer traffic rather than refuse it,
+* ranks the rest by their rolling median latency (time to first token for
+  streams) weighted by error rate, keeping the configured order until a
+  backend has enough samples,
+* for buffered completions, sends a hedged copy to the runner-up if the
+  first backend has not answered within its own p95, and returns whichever
+  finishes first,
+* fails over to the next backend on errors, as long as nothing has been
+  streamed to the client yet.
+
+Extra providers and fallbacks come from two JSON env settings::
+
+    LLM_PROVIDERS='{"together": {"kind": "openai", "base_url": "https://api.together.xyz/v1",
+                                 "api_key_env": "TOGETHER_API_KEY"}}'
+    LLM_ROUTES='{"llama-3.1-8b-instant": ["groq", "together:meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo"]}'
+
+A route entry is ``provider`` (same model name) or ``provider:model``.
+``kind`` is ``groq`` (the Groq SDK, optionally with another ``base_url``)
+or ``openai`` (any OpenAI-compatible ``/chat/completions`` endpoint).
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+# Rolling window per backend: last N calls, none older than LLM_STATS_MAX_AGE seconds
+LLM_STATS_WINDOW = int(os.getenv('LLM_STATS_WINDOW', '200'))
+LLM_STATS_MAX_AGE = float(os.getenv('LLM_STATS_MAX_AGE', '300'))
+LLM_MIN_SAMPLES = int(os.getenv('LLM_MIN_SAMPLES', '5'))
+# Hedge after the primary's p95 (never sooner than LLM_HEDGE_MIN_MS); LLM_HEDGE=0 disables
+LLM_HEDGE = os.getenv('LLM_HEDGE', '1') != '0'
+LLM_HEDGE_MIN_MS = float(os.getenv('LLM_HEDGE_MIN_MS', '250'))
+LLM_HEDGE_DEFAULT_MS = float(os.getenv('LLM_HEDGE_DEFAULT_MS', '3000'))
+# Threads for hedged buffered calls; routes with a single backend never use them
+LLM_HEDGE_THREADS = int(os.getenv('LLM_HEDGE_THREADS', '256'))
+# Breaker opens after N consecutive failures, or an error rate above the threshold once
+# the window has LLM_MIN_SAMPLES calls; it lets one probe through after the cooldown
+BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+BREAKER_ERROR_RATE = float(os.getenv('LLM_BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    # Client errors (bad request, auth, ...) would fail on every backend; only count
+    # timeouts, connection errors, rate limits and server errors against a backend
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None:
+        return True
+    return status in (408, 409, 429) or status >= 500
+
+
+class LatencyWindow:
+    def __init__(self, size: int = LLM_STATS_WINDOW, max_age: float = LLM_STATS_MAX_AGE):
+        self._samples = deque(maxlen=size)  # (timestamp, seconds)
+        self.max_age = max_age
+
+    def add(self, seconds: float):
+        self._samples.append((time.monotonic(), seconds))
+
+    def values(self) -> List[float]:
+        cutoff = time.monotonic() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return sorted(s for _, s in self._samples)
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, error_rate: float = BREAKER_ERROR_RATE,
+                 cooldown: float = BREAKER_COOLDOWN, window: int = LLM_STATS_WINDOW):
+        self.failures = failures
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self._outcomes = deque(maxlen=window)  # True for success
+        self._probing = False
+        self.trips = 0
+
+    def available(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self._probing
+
+    def acquire(self) -> bool:
+        """Claim the right to send a request; in half-open state only one probe is in flight."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        # The request ended without saying anything about the backend's health
+        self._probing = False
+
+    def success(self):
+        self._outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self._outcomes.clear()
+        self._probing = False
+
+    def failure(self):
+        self._outcomes.append(False)
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN:
+            self._trip()
+            return
+        if self.consecutive_failures >= self.failures:
+            self._trip()
+        elif len(self._outcomes) >= LLM_MIN_SAMPLES and self.error_rate_now() > self.error_rate:
+            self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+
+    def error_rate_now(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1.0 - sum(self._outcomes) / len(self._outcomes)
+
+
+class Backend:
+    def __init__(self, provider: 'Provider', model: str):
+        self.provider = provider
+        self.model = model
+        self.name = f"{provider.name}:{model}"
+        self.latency = LatencyWindow()
+        self.first_token = LatencyWindow()
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def expected(self, stream: bool) -> Optional[float]:
+        # Median over the window once there are enough samples (streams rank by time to first
+        # token), inflated by the error rate since a failed call costs a retry elsewhere
+        with self._lock:
+            values = (self.first_token if stream else self.latency).values()
+            error_rate = self.breaker.error_rate_now()
+        if len(values) < LLM_MIN_SAMPLES:
+            return None
+        return _percentile(values, 50) / max(0.05, 1.0 - error_rate)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            values = self.latency.values()
+        return _percentile(values, 95) if len(values) >= LLM_MIN_SAMPLES else None
+
+    def acquire(self) -> bool:
+        with self._lock:
+            return self.breaker.acquire()
+
+    def release(self):
+        # The call was cancelled or its client went away: free a half-open probe without judging the backend
+        with self._lock:
+            self.breaker.release()
+
+    def record(self, seconds: Optional[float], error: Optional[BaseException] = None, first_token: bool = False):
+        with self._lock:
+            # A stream reports its first token and then its end; count the request once
+            if error is not None or not first_token:
+                self.requests += 1
+            if error is not None:
+                if is_backend_failure(error):
+                    self.errors += 1
+                    self.breaker.failure()
+                else:
+                    # Not the backend's fault; just release a half-open probe
+                    self.breaker.release()
+                return
+            (self.first_token if first_token else self.latency).add(seconds)
+            self.breaker.success()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latency = self.latency.values()
+            ttft = self.first_token.values()
+            return {
+                'backend': self.name,
+                'state': self.breaker.state,
+                'requests': self.requests,
+                'errors': self.errors,
+                'error_rate': self.breaker.error_rate_now(),
+                'trips': self.breaker.trips,
+                'p50': _percentile(latency, 50),
+                'p95': _percentile(latency, 95),
+                'ttft_p50': _percentile(ttft, 50),
+                'ttft_p95': _percentile(ttft, 95),
+            }
+
+
+# ==================== PROVIDERS ====================
+class Provider:
+    """One API endpoint; implementations return plain text / text deltas."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def complete(self, model: str, messages: List[dict], temperature: float, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: List[dict], temperature: float, timeout: float) -> Iterator[str]:
+        raise NotImplementedError
+
+    async def acomplete(self, model: str, messages: List[dict], temperature: float, timeout: float) -> str:
+        raise NotImplementedError
+
+    def astream(self, model: str, messages: List[dict], temperature: float, timeout: float) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+
+class GroqProvider(Provider):
+    """Groq SDK; pass client factories to share clients, or base_url/api_key to build them here."""
+
+    def __init__(self, name: str, client_factory: Optional[Callable] = None, async_client_factory: Optional[Callable] = None,
+                 base_url: Optional[str] = None, api_key: Optional[str] = None, max_retries: int = 0):
+        super().__init__(name)
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self._client = None
+        self._async_client = None
+
+    def client(self):
+        if self._client_factory is not None:
+            return self._client_factory()
+        if self._client is None:
+            from groq import Groq
+            self._client = Groq(api_key=self.api_key, base_url=self.base_url, max_retries=self.max_retries)
+        return self._client
+
+    def async_client(self):
+        if self._async_client_factory is not None:
+            return self._async_client_factory()
+        if self._async_client is None:
+            from groq import AsyncGroq
+            self._async_client = AsyncGroq(api_key=self.api_key, base_url=self.base_url, max_retries=self.max_retries)
+        return self._async_client
+
+    def complete(self, model, messages, temperature, timeout):
+        response = self.client().chat.completions.create(
+            model=model, messages=messages, temperature=temperature, timeout=timeout)
+        return response.choices[0].message.content
+
+    def stream(self, model, messages, temperature, timeout):
+        stream = self.client().chat.completions.create(
+            model=model, messages=messages, temperature=temperature, timeout=timeout, stream=True)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    async def acomplete(self, model, messages, temperature, timeout):
+        response = await self.async_client().chat.completions.create(
+            model=model, messages=messages, temperature=temperature, timeout=timeout)
+        return response.choices[0].message.content
+
+    async def astream(self, model, messages, temperature, timeout):
+        stream = await self.async_client().chat.completions.create(
+            model=model, messages=messages, temperature=temperature, timeout=timeout, stream=True)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+class OpenAIProvider(Provider):
+    """Any OpenAI-compatible ``/chat/completions`` endpoint over pooled httpx clients."""
+
+    def __init__(self, name: str, base_url: str, api_key: Optional[str] = None, max_connections: int = 100):
+        super().__init__(name)
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self._client = None
+        self._async_client = None
+
+    def _headers(self) -> dict:
+        return {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.Client(base_url=self.base_url, headers=self._headers(), limits=self._limits())
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            import httpx
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, headers=self._headers(), limits=self._limits())
+        return self._async_client
+
+    @staticmethod
+    def _body(model, messages, temperature, stream=False) -> dict:
+        return {'model': model, 'messages': messages, 'temperature': temperature, 'stream': stream}
+
+    @staticmethod
+    def _delta(line: str) -> Optional[str]:
+        if not line.startswith('data:'):
+            return None
+        data = line[5:].strip()
+        if not data or data == '[DONE]':
+            return None
+        choices = json.loads(data).get('choices') or [{}]
+        return (choices[0].get('delta') or {}).get('content')
+
+    def complete(self, model, messages, temperature, timeout):
+        r = self.client().post('/chat/completions', json=self._body(model, messages, temperature), timeout=timeout)
+        r.raise_for_status()
+        return r.json()['choices'][0]['message']['content']
+
+    def stream(self, model, messages, temperature, timeout):
+        with self.client().stream('POST', '/chat/completions', timeout=timeout,
+                                  json=self._body(model, messages, temperature, stream=True)) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                delta = self._delta(line)
+                if delta:
+                    yield delta
+
+    async def acomplete(self, model, messages, temperature, timeout):
+        r = await self.async_client().post('/chat/completions', json=self._body(model, messages, temperature),
+                                           timeout=timeout)
+        r.raise_for_status()
+        return r.json()['choices'][0]['message']['content']
+
+    async def astream(self, model, messages, temperature, timeout):
+        async with self.async_client().stream('POST', '/chat/completions', timeout=timeout,
+                                              json=self._body(model, messages, temperature, stream=True)) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                delta = self._delta(line)
+                if delta:
+                    yield delta
+
+
+# ==================== ROUTER ====================
+class LLMRouter:
+    def __init__(self, default_provider: Provider, timeout: float = LLM_TIMEOUT, hedge: bool = LLM_HEDGE,
+                 hedge_threads: int = LLM_HEDGE_THREADS):
+        self.providers: Dict[str, Provider] = {default_provider.name: default_provider}
+        self.default_provider = default_provider
+        self.timeout = timeout
+        self.hedge = hedge
+        self._routes: Dict[str, List[Backend]] = {}
+        self._lock = threading.Lock()
+        # Buffered calls that may be hedged run here so the caller can wait on the first result
+        self._pool = ThreadPoolExecutor(max_workers=hedge_threads, thread_name_prefix='llm')
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def add_provider(self, provider: Provider):
+        self.providers[provider.name] = provider
+
+    def set_route(self, model: str, entries: List[str]):
+        backends = []
+        for entry in entries:
+            provider_name, _, backend_model = entry.partition(':')
+            backends.append(Backend(self.providers[provider_name], backend_model or model))
+        with self._lock:
+            self._routes[model] = backends
+
+    def backends(self, model: str) -> List[Backend]:
+        with self._lock:
+            backends = self._routes.get(model)
+            if backends is None:
+                backends = self._routes[model] = [Backend(self.default_provider, model)]
+            return backends
+
+    def candidates(self, model: str, stream: bool = False) -> List[Backend]:
+        """Backends to try, best first: healthy ones by expected latency, unknown ones in configured order."""
+        backends = self.backends(model)
+        healthy = [b for b in backends if b.breaker.available()]
+        if not healthy:
+            return []
+        scores = {b: b.expected(stream) for b in healthy}
+        # Stable sort keeps the configured order among backends without enough samples
+        return sorted(healthy, key=lambda b: scores[b] if scores[b] is not None else float('inf'))
+
+    def last_resort(self, model: str) -> Backend:
+        # Every breaker is open: use the backend that failed longest ago rather than refusing
+        return min(self.backends(model), key=lambda b: b.breaker.opened_at)
+
+    def _acquire_first(self, model: str, queue: List[Backend]) -> Backend:
+        while queue:
+            backend = queue.pop(0)
+            if backend.acquire():
+                return backend
+        return self.last_resort(model)
+
+    def _stream_order(self, model: str) -> Iterator[Backend]:
+        # Streams fail over sequentially, so backends are claimed one at a time
+        tried = False
+        for backend in self.candidates(model, stream=True):
+            if backend.acquire():
+                tried = True
+                yield backend
+        if not tried:
+            yield self.last_resort(model)
+
+    def _hedge_delay(self, backend: Backend) -> float:
+        p95 = backend.p95()
+        if p95 is None:
+            return LLM_HEDGE_DEFAULT_MS / 1000.0
+        return max(LLM_HEDGE_MIN_MS / 1000.0, p95)
+
+    def _call(self, backend: Backend, messages: List[dict], temperature: float,
+              started: Optional[threading.Event] = None) -> str:
+        start = time.perf_counter()
+        if started is not None:
+            started.set()
+        try:
+            result = backend.provider.complete(backend.model, messages, temperature, self.timeout)
+        except Exception as e:
+            backend.record(None, e)
+            raise
+        backend.record(time.perf_counter() - start)
+        return result
+
+    def _complete_inline(self, backend: Backend, queue: List[Backend], messages: List[dict],
+                         temperature: float) -> str:
+        # Nothing to hedge with: call on this thread and fail over in turn
+        while True:
+            try:
+                return self._call(backend, messages, temperature)
+            except Exception as e:
+                if not is_backend_failure(e):
+                    raise
+                backend = None
+                while queue and backend is None:
+                    candidate = queue.pop(0)
+                    backend = candidate if candidate.acquire() else None
+                if backend is None:
+                    raise
+                self.failovers += 1
+
+    def complete(self, model: str, messages: List[dict], temperature: float) -> str:
+        queue = self.candidates(model)
+        primary = self._acquire_first(model, queue)
+        if not (self.hedge and queue):
+            return self._complete_inline(primary, queue, messages, temperature)
+        pending = {}
+        errors = []
+        hedged = False
+        hedge_at = None
+        started = threading.Event()
+
+        def launch() -> bool:
+            while queue:
+                backend = queue.pop(0)
+                if backend.acquire():
+                    pending[self._pool.submit(self._call, backend, messages, temperature)] = backend
+                    return True
+            return False
+
+        pending[self._pool.submit(self._call, primary, messages, temperature, started)] = primary
+        while pending:
+            can_hedge = not hedged and queue and len(pending) == 1
+            timeout = None
+            if can_hedge:
+                if hedge_at is None:
+                    # The clock starts when the primary is sent, not while it waits for a pool thread
+                    started.wait()
+                    hedge_at = time.perf_counter() + self._hedge_delay(primary)
+                timeout = max(0.0, hedge_at - time.perf_counter())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = launch()
+                self.hedges += hedged
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    if not is_backend_failure(e):
+                        raise
+                    continue
+                if backend is not primary:
+                    self.hedge_wins += hedged
+                # A slower hedge still finishes in the background and feeds its stats
+                return result
+            if not pending and launch():
+                self.failovers += 1
+        raise errors[-1]
+
+    def stream(self, model: str, messages: List[dict], temperature: float) -> Iterator[str]:
+        """Stream from the best backend, failing over until the first token has been produced."""
+        last_error = None
+        for backend in self._stream_order(model):
+            if last_error is not None:
+                self.failovers += 1
+            start = time.perf_counter()
+            tokens = backend.provider.stream(backend.model, messages, temperature, self.timeout)
+            try:
+                first = next(tokens, None)
+            except Exception as e:
+                backend.record(None, e, first_token=True)
+                if not is_backend_failure(e):
+                    raise
+                last_error = e
+                continue
+            backend.record(time.perf_counter() - start, first_token=True)
+            try:
+                if first is not None:
+                    yield first
+                yield from tokens
+            except Exception as e:
+                # Tokens already reached the client, so this one cannot fail over
+                backend.record(None, e)
+                raise
+            except GeneratorExit:
+                backend.release()
+                raise
+            backend.record(time.perf_counter() - start)
+            return
+        raise last_error
+
+    async def _acall(self, backend: Backend, messages: List[dict], temperature: float) -> str:
+        start = time.perf_counter()
+        try:
+            result = await backend.provider.acomplete(backend.model, messages, temperature, self.timeout)
+        except Exception as e:
+            backend.record(None, e)
+            raise
+        backend.record(time.perf_counter() - start)
+        return result
+
+    async def acomplete(self, model: str, messages: List[dict], temperature: float) -> str:
+        queue = self.candidates(model)
+        pending = {}
+        errors = []
+        hedged = False
+
+        def launch() -> bool:
+            while queue:
+                backend = queue.pop(0)
+                if backend.acquire():
+                    pending[asyncio.ensure_future(self._acall(backend, messages, temperature))] = backend
+                    return True
+            return False
+
+        primary = self._acquire_first(model, queue)
+        pending[asyncio.ensure_future(self._acall(primary, messages, temperature))] = primary
+        try:
+            while pending:
+                can_hedge = self.hedge and not hedged and queue and len(pending) == 1
+                done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(primary) if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = launch()
+                    self.hedges += hedged
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors.append(e)
+                        if not is_backend_failure(e):
+                            raise
+                        continue
+                    if backend is not primary:
+                        self.hedge_wins += hedged
+                    return result
+                if not pending and launch():
+                    self.failovers += 1
+        finally:
+            # Unlike threads, the losing request can be cancelled outright. A cancelled call records
+            # nothing, so free any half-open probe it held (even if the task never got to run)
+            for task, backend in pending.items():
+                task.cancel()
+                task.add_done_callback(lambda t, b=backend: t.cancelled() and b.release())
+        raise errors[-1]
+
+    async def astream(self, model: str, messages: List[dict], temperature: float) -> AsyncIterator[str]:
+        last_error = None
+        for backend in self._stream_order(model):
+            if last_error is not None:
+                self.failovers += 1
+            start = time.perf_counter()
+            tokens = backend.provider.astream(backend.model, messages, temperature, self.timeout)
+            try:
+                first = await tokens.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                backend.record(None, e, first_token=True)
+                if not is_backend_failure(e):
+                    raise
+                last_error = e
+                continue
+            except asyncio.CancelledError:
+                # Client went away before the first token
+                backend.release()
+                await tokens.aclose()
+                raise
+            backend.record(time.perf_counter() - start, first_token=True)
+            try:
+                if first is not None:
+                    yield first
+                    async for token in tokens:
+                        yield token
+            except Exception as e:
+                backend.record(None, e)
+                raise
+            except (GeneratorExit, asyncio.CancelledError):
+                backend.release()
+                raise
+            finally:
+                await tokens.aclose()
+            backend.record(time.perf_counter() - start)
+            return
+        raise last_error
+
+    def stats(self) -> dict:
+        with self._lock:
+            routes = {model: list(backends) for model, backends in self._routes.items()}
+        return {
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+            'routes': {model: [b.snapshot() for b in backends] for model, backends in routes.items()},
+        }
+
+    def collect_metrics(self) -> list:
+        """Per-backend counters and breaker state as metric families (see metrics.Registry.add_collector)."""
+        stats = self.stats()
+        backends = [(model, b) for model, snapshots in stats['routes'].items() for b in snapshots]
+        families = [
+            (f'llm_router_{name}_total', 'counter', f'LLM router {name}', [({}, stats[name])])
+            for name in ('hedges', 'hedge_wins', 'failovers')
+        ]
+        for field, kind, help in (('requests', 'counter', 'Calls sent to each backend'),
+                                  ('errors', 'counter', 'Failed calls per backend'),
+                                  ('trips', 'counter', 'Times each backend circuit breaker opened')):
+            families.append((f'llm_backend_{field}_total', kind, help,
+                             [({'route': model, 'backend': b['backend']}, b[field]) for model, b in backends]))
+        families.append(('llm_backend_breaker_open', 'gauge', '1 while the backend circuit breaker is not closed',
+                         [({'route': model, 'backend': b['backend']}, float(b['state'] != CLOSED))
+                          for model, b in backends]))
+        return families
+
+
+def router_from_env(default_provider: Provider) -> LLMRouter:
+    router = LLMRouter(default_provider)
+    for name, cfg in json.loads(os.getenv('LLM_PROVIDERS') or '{}').items():
+        api_key = os.getenv(cfg['api_key_env']) if cfg.get('api_key_env') else cfg.get('api_key')
+        if cfg.get('kind', 'openai') == 'groq':
+            router.add_provider(GroqProvider(name, base_url=cfg.get('base_url'), api_key=api_key))
+        else:
+            router.add_provider(OpenAIProvider(name, cfg['base_url'], api_key))
+    for model, entries in json.loads(os.getenv('LLM_ROUTES') or '{}').items():
+        router.set_route(model, entries)
+    return router
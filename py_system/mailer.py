@@ -0,0 +1,164 @@
+"""Outgoing email over a pooled SMTP connection.
+
+Opening a connection (TCP + STARTTLS + AUTH) costs far more than sending a
+message, so the pool keeps authenticated connections open between jobs,
+checks idle ones with NOOP before reuse and sends queued messages in
+batches over a single connection.
+
+Failures are sorted for the job queue: 5xx replies, refused recipients and
+rejected credentials are permanent (``is_permanent``), while 4xx replies and
+connection errors are worth retrying.
+
+Configuration comes from SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS,
+SMTP_FROM and SMTP_STARTTLS (default on). Mail is only sent when the host
+and both credentials are set.
+"""
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import List, Optional
+
+
+def smtp_settings() -> dict:
+    smtp_user = os.environ.get('SMTP_USER')
+    return {
+        'host': os.environ.get('SMTP_HOST'),
+        'port': int(os.environ.get('SMTP_PORT', '587')),
+        'user': smtp_user,
+        'password': os.environ.get('SMTP_PASS'),
+        'sender': os.environ.get('SMTP_FROM') or (smtp_user or 'no-reply@example.com'),
+        'starttls': os.environ.get('SMTP_STARTTLS', '1') != '0',
+    }
+
+
+def is_permanent(error: BaseException) -> bool:
+    """True for SMTP failures that a retry would only repeat."""
+    # SMTPException subclasses OSError, so connection errors are told apart by their type
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)) \
+            or not isinstance(error, smtplib.SMTPException):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # Permanent unless the server only deferred the recipients (4xx greylisting, full mailbox)
+        return any(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def welcome_email(sender: str, to_email: str, to_name: str, to_username: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg['Subject'] = 'Welcome to Aizeeno!'
+    msg['From'] = sender
+    msg['To'] = to_email
+    body = f"Hello {to_name or to_username},\n\n"
+    body += "Thanks for signing up to Aizeeno. Here are your account details:\n\n"
+    body += f"Username: {to_username}\n"
+    body += f"Email: {to_email}\n\n"
+    body += "For your security we do not send your password by email. If you need to reset your password, use the app's account settings.\n\n"
+    body += "Thanks and welcome!\nAizeeno team\n"
+    msg.set_content(body)
+    return msg
+
+
+class SMTPPool:
+    def __init__(self, settings: Optional[dict] = None, size: int = 2, idle_timeout: float = 60.0, timeout: float = 10.0):
+        self._settings = settings
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = []  # [(connection, last_used)]
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    @property
+    def settings(self) -> dict:
+        return self._settings if self._settings is not None else smtp_settings()
+
+    def configured(self) -> bool:
+        cfg = self.settings
+        return bool(cfg['host'] and cfg['user'] and cfg['password'])
+
+    def _connect(self) -> smtplib.SMTP:
+        cfg = self.settings
+        conn = smtplib.SMTP(cfg['host'], cfg['port'], timeout=self.timeout)
+        try:
+            if cfg['starttls']:
+                conn.starttls()
+            if cfg['user'] and cfg['password']:
+                conn.login(cfg['user'], cfg['password'])
+        except BaseException:
+            self._close(conn)
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            if time.monotonic() - last_used > self.idle_timeout:
+                self._close(conn)
+                continue
+            try:
+                # The server may have dropped a connection that sat idle
+                if conn.noop()[0] == 250:
+                    return conn
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close(conn)
+        return self._connect()
+
+    def _release(self, conn: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def send_many(self, messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        """Send messages over one pooled connection; returns None or the error for each."""
+        results: List[Optional[Exception]] = []
+        conn = None
+        for msg in messages:
+            try:
+                if conn is None:
+                    conn = self._acquire()
+                conn.send_message(msg)
+                results.append(None)
+                with self._lock:
+                    self.messages_sent += 1
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                # Connection-level failure: drop it and let the job queue retry this message
+                if conn is not None:
+                    self._close(conn)
+                conn = None
+                results.append(e)
+            except smtplib.SMTPException as e:
+                results.append(e)
+        if conn is not None:
+            self._release(conn)
+        return results
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
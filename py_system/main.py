@@ -1,19 +1,37 @@
 import os
 import json
+import logging
+import time
 import hashlib
+import hmac
 import secrets
+from functools import wraps
 from typing import Optional, Tuple
 from datetime import datetime
-import smtplib
-from email.message import EmailMessage
 from dotenv import load_dotenv
 import stripe
-from google.auth.transport import requests
-from google.oauth2 import id_token
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, g, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
-from ai_model import get_ai_reply
+from werkzeug.utils import secure_filename
+from assets import Asset, AssetManifest
+from ai_model import AI_BATCH_CONCURRENCY, batch_calls, get_ai_reply, iter_ai_replies, stream_ai_reply
+from password_hashing import HashingBusy, PasswordHasher
+from rate_limits import ANONYMOUS_PLAN, RateLimiter, open_counter_store
+from sessions import InvalidToken, open_session_tokens
+from context_window import count_tokens, make_message
+from conversation_store import ConversationStore, modified_at
+from conversation_transfer import gzip_chunks, import_lines, ndjson_chunks, ndjson_lines, read_chunks
+from http_cache import compress_json, etag_matches, json_asset, not_modified, version_etag, with_validators
+from jobs import PermanentJobError, open_job_queue
+from logs import setup_logging
+from mailer import SMTPPool, is_permanent, welcome_email
+from metrics import CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_LATENCY, REGISTRY, stats_collector, time_stripe, timed_stripe
+from startup import PriceCache, StartupChecks, key_mode, validate_price_ids as _fetch_price_metadata
+from storage import MemoryBackend, open_backend
+from subscriptions import open_subscription_mirror
+from user_store import PROFILE_FIELDS, UserRecord, UserRepository
+from webhooks import StripeEventProcessor, event_dedup_key
 
 # ==================== CONFIG & PATHS ====================
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -40,8 +58,12 @@ if not loaded_env:
     # Try load default (no path) — may still work if env already set in environment
     load_dotenv()
 
-print(f"Attempted .env locations: {env_candidates}")
-print(f"Loaded .env from: {loaded_from or 'default environment/none'}")
+# Records go through a bounded queue to a writer thread, so logging never blocks a request (see logs.py)
+setup_logging()
+log = logging.getLogger('aizenno')
+
+log.debug('Attempted .env locations', extra={'candidates': env_candidates})
+log.info('Loaded .env from %s', loaded_from or 'default environment/none')
 
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
@@ -54,18 +76,24 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 if APP_DOMAIN.endswith('/'):
     APP_DOMAIN = APP_DOMAIN[:-1]
 
-print(f"STRIPE_PUBLISHABLE_KEY: {STRIPE_PUBLISHABLE_KEY[:20] + '...' if STRIPE_PUBLISHABLE_KEY else 'NOT SET'}")
-print(f"STRIPE_SECRET_KEY: {'SET' if STRIPE_SECRET_KEY else 'NOT SET'}")
-print(f"APP_DOMAIN: {APP_DOMAIN}")
-print(f"STRIPE_WEBHOOK_SECRET: {'SET' if STRIPE_WEBHOOK_SECRET else 'NOT SET'}")
-print(f"GOOGLE_CLIENT_ID: {GOOGLE_CLIENT_ID[:20] + '...' if GOOGLE_CLIENT_ID else 'NOT SET'}")
-print(f"GOOGLE_CLIENT_SECRET: {'SET' if GOOGLE_CLIENT_SECRET else 'NOT SET'}")
+log.info('Configuration loaded', extra={
+    'stripe_publishable_key': STRIPE_PUBLISHABLE_KEY[:20] + '...' if STRIPE_PUBLISHABLE_KEY else 'NOT SET',
+    'stripe_secret_key': 'SET' if STRIPE_SECRET_KEY else 'NOT SET',
+    'app_domain': APP_DOMAIN,
+    'stripe_webhook_secret': 'SET' if STRIPE_WEBHOOK_SECRET else 'NOT SET',
+    'google_client_id': GOOGLE_CLIENT_ID[:20] + '...' if GOOGLE_CLIENT_ID else 'NOT SET',
+    'google_client_secret': 'SET' if GOOGLE_CLIENT_SECRET else 'NOT SET',
+})
 
 if STRIPE_SECRET_KEY:
     stripe.api_key = STRIPE_SECRET_KEY
-    print("✓ Stripe secret key loaded.")
+    log.info('Stripe secret key loaded')
 else:
-    print("✗ ERROR: Stripe secret key missing in .env!")
+    log.error('Stripe secret key missing in .env')
+
+# Optional API base override (e.g. a local fake Stripe for benchmarks)
+if os.getenv("STRIPE_API_BASE"):
+    stripe.api_base = os.getenv("STRIPE_API_BASE")
 
 SUBSCRIPTION_PRICES = {
     'starter': 'price_1SXuv80LyafCNcpSqb2bzkuV',   # $5/month
@@ -74,153 +102,136 @@ SUBSCRIPTION_PRICES = {
 }
 
 
-# Validate price IDs with Stripe at startup (best-effort)
+# Validate price IDs with Stripe (best-effort); runs as a background startup check, see below
 def validate_price_ids():
     if not STRIPE_SECRET_KEY:
-        print('⚠️ Skipping Stripe price validation (secret key missing).')
-        return
-    print('🔎 Validating subscription price IDs with Stripe...')
-    for name, pid in SUBSCRIPTION_PRICES.items():
-        try:
-            price = stripe.Price.retrieve(pid)
-            active = getattr(price, 'active', None)
-            product = getattr(price, 'product', None)
-            print(f"  - {name}: {pid} -> active={active}, product={product}")
-        except Exception as e:
-            print(f"  - {name}: {pid} -> ERROR retrieving price: {e}")
-
+        log.warning('Skipping Stripe price validation (secret key missing)')
+        return {}
+    cache = PriceCache(mode=key_mode(STRIPE_SECRET_KEY))
+    prices = _fetch_price_metadata(SUBSCRIPTION_PRICES, timed_stripe('Price.retrieve', stripe.Price.retrieve), cache)
+    for name, info in prices.items():
+        if 'error' in info:
+            log.error('Could not retrieve Stripe price', extra={'plan': name, 'price_id': info['price_id'],
+                                                                'error': info['error']})
+        else:
+            source = 'cached' if info['cached'] else 'Stripe'
+            log.info('Stripe price validated', extra={'plan': name, 'price_id': info['price_id'], 'active': info['active'],
+                                                      'product': info['product'], 'source': source})
+    return prices
 
-validate_price_ids()
 
 # ==================== FLASK APP SETUP ====================
-app = Flask(__name__, static_folder=os.path.join(BASE_DIR, 'static'), static_url_path='/static')
+# /static is served from the asset manifest below rather than Flask's static folder
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
-@app.route('/webhook', methods=['POST'])
-def stripe_webhook():
-        # Verify webhook signature if secret available
-        payload = request.data
-        sig_header = request.headers.get('Stripe-Signature')
-        event = None
-
-        if STRIPE_WEBHOOK_SECRET:
-            try:
-                event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
-                print('🔔 Webhook verified with signature')
-            except Exception as e:
-                print(f'❌ Webhook signature verification failed: {e}')
-                return jsonify({'error': 'Webhook signature verification failed'}), 400
-        else:
-            # No webhook secret configured; attempt to parse event without verification (not recommended)
-            try:
-                event = json.loads(payload)
-                print('⚠️ Webhook secret not configured; processing without signature verification')
-            except Exception as e:
-                print(f'❌ Failed to parse webhook payload: {e}')
-                return jsonify({'error': 'Invalid payload'}), 400
-
-        # Handle the event
-        etype = event.get('type') if isinstance(event, dict) else getattr(event, 'type', None)
-        print(f'🔔 Received event: {etype}')
-
-        if etype == 'checkout.session.completed':
-            session = event['data']['object'] if isinstance(event, dict) else event['data']['object']
-            # session should contain customer and subscription (for subscription mode)
-            session_id = session.get('id') if isinstance(session, dict) else getattr(session, 'id', None)
-            username = None
-            # Try metadata first
-            if isinstance(session, dict):
-                username = session.get('metadata', {}).get('username') or session.get('client_reference_id')
-            else:
-                username = getattr(session, 'metadata', {}).get('username') if getattr(session, 'metadata', None) else None
-
-            print(f" checkout.session.completed for session {session_id}, username={username}")
-
-            # Retrieve expanded session from Stripe to get subscription id reliably
-            try:
-                full = stripe.checkout.Session.retrieve(session_id, expand=['subscription'])
-                subs_id = getattr(full, 'subscription', None)
-                cust_id = getattr(full, 'customer', None)
-                print(f"    expanded session: customer={cust_id}, subscription={subs_id}")
-            except Exception as e:
-                print(f"    failed to retrieve full session: {e}")
-                subs_id = None
-                cust_id = None
-
-            # Update user only if username is provided
-            if username:
-                try:
-                    ok, err = update_user(username, {
-                        'payment': True,
-                        'subscription': session.get('metadata', {}).get('plan') if isinstance(session, dict) else None,
-                        'stripe_customer_id': cust_id,
-                        'stripe_subscription_id': subs_id
-                    })
-                    if ok:
-                        print(f" Updated user {username} as paid (subscription={subs_id})")
-                    else:
-                        print(f" Failed to update user {username}: {err}")
-                except Exception as e:
-                    print(f" Exception updating user {username}: {e}")
-            else:
-                print(' No username in session metadata; cannot update user record')
 
-        # Return 200 to acknowledge receipt
-        return jsonify({'received': True})
+# ==================== METRICS ====================
+# Route latency and in-flight gauges; scraped from /metrics (see metrics.py)
+@app.before_request
+def _start_request_timer():
+    # The matched rule (e.g. /api/conversations/<conv_id>) keeps the label set small
+    g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(method=request.method, route=g.metrics_route)
 
 
-# ==================== USER MANAGEMENT (IN-MEMORY) ====================
-# Use an in-memory store to avoid filesystem permission/path issues during testing.
-# This keeps existing API and helper functions working but removes persistence.
-IN_MEMORY_DATA = {"users": []}
+@app.after_request
+def _observe_request(response):
+    # Streamed bodies (SSE, NDJSON) are timed to their headers; the LLM metrics cover the rest
+    if 'metrics_start' in g:
+        HTTP_LATENCY.observe(time.perf_counter() - g.metrics_start, method=request.method,
+                             route=g.metrics_route, status=response.status_code)
+    return response
 
 
-def _load():
-    # Return the in-memory data structure
-    return IN_MEMORY_DATA
+@app.teardown_request
+def _end_request(exc):
+    if 'metrics_route' in g:
+        HTTP_IN_FLIGHT.dec(method=request.method, route=g.metrics_route)
 
 
-def _save(data):
-    # Replace the entire in-memory data structure
-    global IN_MEMORY_DATA
-    IN_MEMORY_DATA = data
-    return
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 
-def _hash_password(password: str, salt: str = None) -> Tuple[str, str]:
-    # Use PBKDF2-HMAC-SHA256 with per-user random salt
-    if salt is None:
-        salt = secrets.token_hex(16)
-    dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100_000)
-    return dk.hex(), salt
+# ==================== RESPONSES ====================
+# Large JSON bodies are compressed on the way out; ETags and 304s are per route (see http_cache.py)
+@app.after_request
+def _compress_json(response):
+    return compress_json(response, request.headers.get('Accept-Encoding', ''))
 
 
-def find_user(username: str) -> Optional[dict]:
-    data = _load()
-    for u in data.get('users', []):
-        if u.get('username') == username:
-            return u
-    return None
+def _send_asset(asset: Asset):
+    """Serve a prebuilt body in the encoding the client accepts, or 304 if it already has it."""
+    encoding = asset.negotiate(request.headers.get('Accept-Encoding', ''))
+    headers = {'ETag': asset.etag(encoding), 'Cache-Control': asset.cache_control, 'Vary': 'Accept-Encoding'}
+    # Only GET/HEAD are conditional; a POST with If-None-Match still gets the body
+    if request.method in ('GET', 'HEAD') and any(request.if_none_match.contains_weak(etag.strip('"'))
+                                                 for etag in asset.etags()):
+        return Response(status=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(asset.bodies[encoding], content_type=asset.mimetype, headers=headers)
+
+
+# ==================== STORAGE ====================
+# STORAGE_BACKEND=sqlite (default) | jsonl | memory; see storage.py
+try:
+    STORAGE = open_backend()
+except Exception as e:
+    log.error('Could not open storage backend (%s); falling back to in-memory storage', e)
+    STORAGE = MemoryBackend()
+log.info('Storage backend: %s', STORAGE.name)
+
+
+# ==================== USER MANAGEMENT ====================
+# Users are indexed by username, email and Stripe customer id so every lookup is O(1).
+USERS = UserRepository(STORAGE)
+
+# PBKDF2 runs on a bounded process pool; see password_hashing.py for the cost settings
+HASHER = PasswordHasher()
+
+
+def _import_legacy_users():
+    # One-time seed from the old JSON user file when the store is empty
+    if len(USERS) or not os.path.exists(DATA_FILE):
+        return
+    try:
+        with open(DATA_FILE, encoding='utf-8') as f:
+            legacy = json.load(f)
+    except Exception as e:
+        log.error('Could not read legacy user file %s: %s', DATA_FILE, e)
+        return
+    for u in legacy.get('users', []):
+        if u.get('username') and u.get('password'):
+            USERS.add(UserRecord.from_dict(u))
+
+
+_import_legacy_users()
+
+
+def find_user(username: str) -> Optional[UserRecord]:
+    return USERS.get(username)
+
+
+def find_user_by_email(email: str) -> Optional[UserRecord]:
+    return USERS.get_by_email(email)
+
+
+def find_user_by_customer(customer_id: str) -> Optional[UserRecord]:
+    return USERS.get_by_customer(customer_id)
 
 
 def create_user(username: str, password: str, name: str, email: str = '') -> Tuple[bool, str]:
-    data = _load()
     if find_user(username):
         return False, 'Username already exists'
-    pwd_hash, salt = _hash_password(password)
-    user = {
-        "username": username,
-        "password": pwd_hash,
-        "salt": salt,
-        "name": name,
-        "email": email,
-        "subscription": "free",
-        "payment": False,
-        "stripe_customer_id": None,
-        "stripe_subscription_id": None
-    }
-    data.setdefault('users', []).append(user)
-    _save(data)
+    pwd_hash, salt, iterations = HASHER.hash(password)
+    user = UserRecord(username=username, password=pwd_hash, salt=salt, iterations=iterations, name=name, email=email)
+    if not USERS.add(user):
+        # Lost a race with a concurrent signup for the same username
+        return False, 'Username already exists'
     return True, ''
 
 
@@ -228,94 +239,480 @@ def verify_user(username: str, password: str) -> Optional[dict]:
     u = find_user(username)
     if not u:
         return None
-    salt = u.get('salt')
-    if not salt:
+    if not u.salt:
         # legacy fallback: stored password may be plain sha1 hex
         legacy = hashlib.sha1(password.encode('utf-8')).hexdigest()
-        if u.get('password') == legacy:
-            return {"username": u.get('username'), "name": u.get('name'), "email": u.get('email', '')}
+        if not hmac.compare_digest(u.password or '', legacy):
+            return None
+    elif not HASHER.verify(password, u.password, u.salt, u.iterations):
         return None
-    pwd_hash, _ = _hash_password(password, salt)
-    if u.get('password') == pwd_hash:
-        return {"username": u.get('username'), "name": u.get('name'), "email": u.get('email', '')}
-    return None
+    if HASHER.needs_rehash(u.salt, u.iterations):
+        # Transparently upgrade SHA-1 and low-iteration records while we hold the plaintext
+        try:
+            pwd_hash, salt, iterations = HASHER.hash(password)
+            USERS.set_password(username, pwd_hash, salt, iterations)
+        except HashingBusy:
+            pass
+    return u.public()
 
 
 def update_user(username: str, updates: dict) -> Tuple[bool, str]:
-    data = _load()
-    users = data.setdefault('users', [])
-    for u in users:
-        if u.get('username') == username:
-            # allowed updates: name, email, subscription, payment, stripe ids
-            if 'name' in updates:
-                u['name'] = updates['name']
-            if 'email' in updates:
-                u['email'] = updates['email']
-            if 'subscription' in updates:
-                u['subscription'] = updates['subscription']
-            if 'payment' in updates:
-                u['payment'] = updates['payment']
-            if 'stripe_customer_id' in updates:
-                u['stripe_customer_id'] = updates['stripe_customer_id']
-            if 'stripe_subscription_id' in updates:
-                u['stripe_subscription_id'] = updates['stripe_subscription_id']
-            _save(data)
-            return True, ''
-    return False, 'User not found'
+    # allowed updates: name, email, subscription, payment, stripe ids
+    if USERS.update(username, updates) is None:
+        return False, 'User not found'
+    return True, ''
 
 
 def change_password(username: str, current_password: str, new_password: str) -> Tuple[bool, str]:
     u = find_user(username)
     if not u:
         return False, 'User not found'
-    salt = u.get('salt')
-    if not salt:
+    if not u.salt:
         return False, 'Invalid user record'
-    current_hash, _ = _hash_password(current_password, salt)
-    if current_hash != u.get('password'):
+    if not HASHER.verify(current_password, u.password, u.salt, u.iterations):
         return False, 'Current password incorrect'
-    new_hash, new_salt = _hash_password(new_password)
-    u['password'] = new_hash
-    u['salt'] = new_salt
-    data = _load()
-    _save(data)
+    new_hash, new_salt, iterations = HASHER.hash(new_password)
+    USERS.set_password(username, new_hash, new_salt, iterations)
     return True, ''
 
-# ==================== CONVERSATION MANAGEMENT ====================
-# Conversations in-memory store
-IN_MEMORY_CONVERSATIONS = []
 
+# ==================== SESSIONS ====================
+# Signed access/refresh tokens; verifying one never touches the password hash (see sessions.py)
+SESSIONS = open_session_tokens()
+REGISTRY.add_collector(stats_collector('session_tokens', SESSIONS.stats, {
+    'cache_hits': 'counter', 'cache_misses': 'counter', 'rejected': 'counter', 'cached': 'gauge', 'revoked': 'gauge'}))
 
-def _load_conversations():
-    return IN_MEMORY_CONVERSATIONS
 
+def _parse_bearer(authorization: Optional[str]) -> Optional[str]:
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip() or None
 
-def _save_conversations(items):
-    global IN_MEMORY_CONVERSATIONS
-    IN_MEMORY_CONVERSATIONS = items
 
+def _bearer_token() -> Optional[str]:
+    return _parse_bearer(request.headers.get('Authorization'))
 
-def _find_conversation(conv_id):
-    for it in IN_MEMORY_CONVERSATIONS:
-        if it.get('id') == conv_id:
-            return it
-    return None
+
+def _session_user(authorization: Optional[str]) -> Optional[str]:
+    """The username of a valid Bearer token in ``authorization``, else None (treated as anonymous)."""
+    token = _parse_bearer(authorization)
+    if not token:
+        return None
+    try:
+        return SESSIONS.verify(token).username
+    except InvalidToken:
+        return None
+
+
+def require_auth(view):
+    """Route decorator: the caller must send a valid access token; its username is put in g.username."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _bearer_token()
+        if not token:
+            return jsonify({'success': False, 'error': 'Authentication required'}), 401, {'WWW-Authenticate': 'Bearer'}
+        try:
+            g.username = SESSIONS.verify(token).username
+        except InvalidToken as e:
+            return (jsonify({'success': False, 'error': str(e)}), 401,
+                    {'WWW-Authenticate': 'Bearer error="invalid_token"'})
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _other_user(username: Optional[str]) -> bool:
+    # Older clients still send their username; it must name the token's owner
+    return bool(username) and username != g.username
+
+
+# ==================== BACKGROUND JOBS ====================
+JOBS = open_job_queue()
+MAILER = SMTPPool()
+
+
+def _send_welcome_emails(payloads):
+    # Batched handler: every queued welcome email due now goes out over one SMTP connection
+    if not MAILER.configured():
+        app.logger.info('SMTP not configured, skipping welcome email')
+        return [None] * len(payloads)
+    sender = MAILER.settings['sender']
+    messages = [welcome_email(sender, p['email'], p.get('name'), p.get('username')) for p in payloads]
+    results = MAILER.send_many(messages)
+    for i, (p, err) in enumerate(zip(payloads, results)):
+        if err is None:
+            app.logger.info('Sent welcome email to %s', p['email'])
+        elif is_permanent(err):
+            # A bounced address or rejected login fails the same way every time
+            app.logger.warning('Welcome email to %s failed permanently: %s', p['email'], err)
+            results[i] = PermanentJobError(repr(err))
+        else:
+            app.logger.warning('Failed to send welcome email to %s: %s', p['email'], err)
+    return results
+
+
+JOBS.register('welcome_email', _send_welcome_emails, batch_size=20)
+JOBS.start()
+
+# Stripe events get their own workers so a burst of webhooks can't delay emails (and vice versa)
+WEBHOOK_JOBS = open_job_queue(workers=int(os.getenv('WEBHOOK_WORKERS', '4')))
+# Webhooks keep this mirror current so payment polls rarely need to ask Stripe
+SUBSCRIPTIONS = open_subscription_mirror(stripe)
+STRIPE_EVENTS = StripeEventProcessor(USERS, SUBSCRIPTION_PRICES, stripe, mirror=SUBSCRIPTIONS)
+
+
+def _process_stripe_event(event):
+    key = event_dedup_key(event)
+    if key and WEBHOOK_JOBS.is_done(key):
+        return
+    outcome = STRIPE_EVENTS.process(event)
+    app.logger.info('Stripe event %s (%s): %s', event.get('id'), event.get('type'), outcome)
+
+
+WEBHOOK_JOBS.register('stripe_event', _process_stripe_event)
+WEBHOOK_JOBS.start()
+
+REGISTRY.add_collector(stats_collector('stripe_mirror', SUBSCRIPTIONS.stats,
+                                       {'stripe_calls': 'counter', 'local_hits': 'counter', 'cached': 'gauge'}))
+for _queue_name, _queue in (('jobs', JOBS), ('webhook_jobs', WEBHOOK_JOBS)):
+    REGISTRY.add_collector(stats_collector(_queue_name, lambda q=_queue: {'completed': q.completed, 'failed': q.failed},
+                                           {'completed': 'counter', 'failed': 'counter'}))
+
+
+@app.route('/webhook', methods=['POST'])
+def stripe_webhook():
+    # Verify, de-duplicate and queue; the event is applied by a WEBHOOK_JOBS worker so
+    # Stripe gets its 2xx right away and retried deliveries are not applied twice.
+    payload = request.data
+    if STRIPE_WEBHOOK_SECRET:
+        try:
+            stripe.WebhookSignature.verify_header(payload.decode('utf-8'), request.headers.get('Stripe-Signature'),
+                                                  STRIPE_WEBHOOK_SECRET, stripe.Webhook.DEFAULT_TOLERANCE)
+        except Exception as e:
+            log.warning('Webhook signature verification failed: %s', e)
+            return jsonify({'error': 'Webhook signature verification failed'}), 400
+    try:
+        event = json.loads(payload)
+    except Exception as e:
+        log.warning('Failed to parse webhook payload: %s', e)
+        return jsonify({'error': 'Invalid payload'}), 400
+    if not isinstance(event, dict):
+        return jsonify({'error': 'Invalid payload'}), 400
+
+    etype = event.get('type')
+    if not STRIPE_EVENTS.handles(etype):
+        return jsonify({'received': True, 'queued': False})
+    job_id = WEBHOOK_JOBS.enqueue('stripe_event', event, dedup_key=event_dedup_key(event))
+    return jsonify({'received': True, 'queued': job_id is not None, 'duplicate': job_id is None})
+
+# ==================== CONVERSATION MANAGEMENT ====================
+# Conversations are partitioned by owner (username) and kept in timestamp order,
+# rebuilt from the storage backend at startup.
+CONVERSATIONS = ConversationStore(STORAGE)
+CONVERSATION_PAGE_MAX = 100
 
 # Note: static/template routes are registered after API routes to avoid
 # accidental catch-all conflicts that can cause `/api/*` routes to return 404.
 
 # ==================== FLASK ROUTES: API ====================
+def _sse(payload: dict) -> str:
+    # One Server-Sent Events frame carrying a JSON payload
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _chat_history(data: dict, username: Optional[str]):
+    """Resolve the conversation a chat turn belongs to.
+
+    Returns (conversation, history); both are None for one-off messages.
+    Raises LookupError unless the conversation belongs to ``username``, the
+    caller's verified session user (anonymous callers only send one-offs).
+    """
+    conv_id = data.get('conversation_id')
+    if not conv_id:
+        return None, None
+    conv = CONVERSATIONS.get(conv_id, username) if username else None
+    if conv is None:
+        raise LookupError(conv_id)
+    history = conv.get('messages')
+    if history is None:
+        history = _legacy_messages(conv)
+    return conv, list(history)
+
+
+def _legacy_messages(conv: dict) -> list:
+    # Conversations saved before multi-turn support only hold the last exchange
+    return [make_message(role, conv[field]) for role, field in (('user', 'user'), ('assistant', 'ai'))
+            if conv.get(field)]
+
+
+def _record_chat_turn(conv: Optional[dict], user_message: str, reply: str):
+    if conv is None or not reply:
+        return
+    if 'messages' not in conv:
+        conv['messages'] = _legacy_messages(conv)
+        conv['token_count'] = sum(m['tokens'] for m in conv['messages'])
+    conv['user'] = user_message
+    conv['ai'] = reply
+    if conv.get('title') == 'New chat':
+        conv['title'] = user_message[:40] + ('...' if len(user_message) > 40 else '')
+    CONVERSATIONS.append_messages(conv['id'], [('user', user_message), ('assistant', reply)])
+
+
+# Token buckets per user and per IP plus a daily token quota per plan; counters are shared
+# across workers when RATE_LIMIT_DB is set (see rate_limits.py)
+RATE_LIMITS_ENABLED = os.getenv('RATE_LIMITS', '1') != '0'
+TRUST_PROXY = os.getenv('TRUST_PROXY', '0') == '1'
+LIMITER = RateLimiter(open_counter_store())
+
+
+def _client_ip(remote_addr: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+    if TRUST_PROXY and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr
+
+
+def _plan_for(username: Optional[str]) -> str:
+    # username comes from a verified session (_session_user), never from the request body
+    if not username:
+        return ANONYMOUS_PLAN
+    user = find_user(username)
+    if user is None or not user.payment:
+        return 'free'
+    return user.subscription or 'free'
+
+
+# Plans whose hard chat prompts may go to the large model (see prompt_routing.py); the rest,
+# and anonymous callers, stay on the fast one at a tenth of the cost
+LARGE_MODEL_PLANS = frozenset(p.strip() for p in os.getenv('LARGE_MODEL_PLANS', 'starter,pro,elite').split(',')
+                              if p.strip())
+
+
+def _large_model_allowed(identity) -> bool:
+    return identity is not None and _plan_for(identity[0]) in LARGE_MODEL_PLANS
+
+
+def _check_chat_limits(username: Optional[str], ip: Optional[str], cost: int = 1, tokens: int = 0):
+    """Admit a chat request; returns None when limits are off, else a LimitResult."""
+    if not RATE_LIMITS_ENABLED:
+        return None
+    return LIMITER.check(username or None, ip, _plan_for(username), cost, tokens)
+
+
+def _rate_limited_payload(result) -> dict:
+    if result.reason == 'daily_quota':
+        message = 'Daily token quota used up, it resets at midnight UTC'
+    elif result.reason == 'batch_size':
+        message = 'Batch has more distinct items than your plan allows at once'
+    else:
+        message = 'Too many requests, please slow down'
+    return {'success': False, 'error': message, 'reason': result.reason, 'quota': result.quota,
+            'retry_after': int(result.headers()['Retry-After'])}
+
+
+def _charge_chat(identity: Optional[Tuple[Optional[str], Optional[str]]], user_message: str, reply: str):
+    # Charged after the reply so failed calls cost nothing; prompt + reply tokens
+    if identity is None or not RATE_LIMITS_ENABLED or not reply:
+        return
+    username, ip = identity
+    LIMITER.charge(username or None, ip, count_tokens(user_message) + count_tokens(reply))
+
+
+def _quota_after(identity) -> Optional[dict]:
+    if identity is None or not RATE_LIMITS_ENABLED:
+        return None
+    username, ip = identity
+    return LIMITER.status(username or None, ip, _plan_for(username))
+
+
+def _request_limits(cost: int = 1, tokens: int = 0):
+    """Returns (identity, result, error_response) for a Flask chat request."""
+    identity = (_session_user(request.headers.get('Authorization')),
+                _client_ip(request.remote_addr, request.headers.get('X-Forwarded-For')))
+    result = _check_chat_limits(*identity, cost, tokens)
+    if result is not None and not result.allowed:
+        resp = jsonify(_rate_limited_payload(result))
+        resp.headers.update(result.headers())
+        return identity, result, (resp, 429)
+    return identity, result, None
+
+
+def _stream_chat_response(user_message: str, conv: Optional[dict] = None, history: Optional[list] = None,
+                          identity=None, limit=None):
+    def events():
+        parts = []
+        try:
+            for token in stream_ai_reply(user_message, history=history, allow_large=_large_model_allowed(identity)):
+                parts.append(token)
+                yield _sse({"token": token})
+            reply = "".join(parts)
+            _record_chat_turn(conv, user_message, reply)
+            _charge_chat(identity, user_message, reply)
+            done = {"done": True}
+            quota = _quota_after(identity)
+            if quota is not None:
+                done["quota"] = quota
+            yield _sse(done)
+        except Exception as e:
+            app.logger.exception('Streaming chat failed')
+            _charge_chat(identity, user_message, "".join(parts))
+            yield _sse({"error": str(e)})
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if limit is not None:
+        headers.update(limit.headers())
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+
 @app.route("/api/chat", methods=["POST"])
 def chat():
     data = request.get_json() or {}
     user_message = data.get("message", "")
-    reply = get_ai_reply(user_message)
-    return jsonify({"response": reply})
+    identity, limit, limited = _request_limits()
+    if limited:
+        return limited
+    try:
+        conv, history = _chat_history(data, identity[0])
+    except LookupError:
+        return jsonify({'success': False, 'error': 'Conversation not found'}), 404
+    if data.get("stream"):
+        return _stream_chat_response(user_message, conv, history, identity, limit)
+    reply = get_ai_reply(user_message, history=history, allow_large=_large_model_allowed(identity))
+    _record_chat_turn(conv, user_message, reply)
+    _charge_chat(identity, user_message, reply)
+    body = {"response": reply}
+    quota = _quota_after(identity)
+    if quota is not None:
+        body["quota"] = quota
+    resp = jsonify(body)
+    if limit is not None:
+        resp.headers.update(limit.headers())
+        resp.headers['X-Quota-Remaining'] = str(quota['remaining_tokens'])
+    return resp
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    data = request.get_json() or {}
+    identity, limit, limited = _request_limits()
+    if limited:
+        return limited
+    try:
+        conv, history = _chat_history(data, identity[0])
+    except LookupError:
+        return jsonify({'success': False, 'error': 'Conversation not found'}), 404
+    return _stream_chat_response(data.get("message", ""), conv, history, identity, limit)
+
+
+# One request carries up to CHAT_BATCH_MAX_ITEMS prompts, answered concurrently (see AIModel.iter_many)
+CHAT_BATCH_MAX_ITEMS = int(os.getenv('CHAT_BATCH_MAX_ITEMS', '50'))
+
+
+def _batch_items(data: dict) -> list:
+    """(mode, prompt) pairs from a batch body; items are strings or {"mode", "message"} objects."""
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('items must be a non-empty list')
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        raise ValueError(f'At most {CHAT_BATCH_MAX_ITEMS} items per batch')
+    pairs = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'message': item}
+        if not isinstance(item, dict) or not isinstance(item.get('message'), str):
+            raise ValueError('Each item needs a message')
+        mode = item.get('mode') or data.get('mode') or 'chat'
+        if mode not in ('chat', 'text', 'code'):
+            raise ValueError(f'Invalid mode: {mode}')
+        pairs.append((mode, item['message']))
+    return pairs
+
+
+def _batch_cost(items: list) -> Tuple[int, int]:
+    # (upstream calls, prompt tokens): a batch takes a bucket token per distinct prompt and
+    # needs at least its prompt tokens left in the daily quota before anything is sent
+    calls = batch_calls(items)
+    return len(calls), sum(count_tokens(prompt) for _, prompt in calls)
+
+
+def _batch_concurrency(data: dict) -> int:
+    try:
+        requested = int(data.get('concurrency') or AI_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        requested = AI_BATCH_CONCURRENCY
+    return max(1, min(requested, AI_BATCH_CONCURRENCY))
+
+
+def _batch_line(index: int, reply: Optional[str], error: Optional[BaseException]) -> dict:
+    if error is not None:
+        return {'index': index, 'error': str(error)}
+    return {'index': index, 'response': reply}
+
+
+@app.route("/api/chat/batch", methods=["POST"])
+def chat_batch():
+    """Answer several prompts in one request.
+
+    Results come back in input order, or with "stream": true as NDJSON lines
+    in completion order followed by a final {"done": true} line.
+    """
+    data = request.get_json() or {}
+    try:
+        items = _batch_items(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    identity, limit, limited = _request_limits(*_batch_cost(items))
+    if limited:
+        return limited
+    concurrency = _batch_concurrency(data)
+    allow_large = _large_model_allowed(identity)
+
+    def finished(index, reply, error):
+        if error is None:
+            _charge_chat(identity, items[index][1], reply)
+        else:
+            app.logger.warning('Batch item %d failed: %s', index, error)
+        return _batch_line(index, reply, error)
+
+    headers = limit.headers() if limit is not None else {}
+    if data.get('stream'):
+        def lines():
+            for result in iter_ai_replies(items, concurrency, allow_large):
+                yield json.dumps(finished(*result)) + '\n'
+            yield json.dumps({'done': True, 'count': len(items), 'quota': _quota_after(identity)}) + '\n'
+
+        headers.update({'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson', headers=headers)
+
+    results = [None] * len(items)
+    for result in iter_ai_replies(items, concurrency, allow_large):
+        results[result[0]] = finished(*result)
+    resp = jsonify({'results': results, 'quota': _quota_after(identity)})
+    resp.headers.update(headers)
+    return resp
+
+
+@app.route("/api/quota", methods=["GET"])
+def chat_quota():
+    """Remaining requests and daily tokens for the signed-in user (or this client, if anonymous)"""
+    username = _session_user(request.headers.get('Authorization'))
+    ip = _client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'))
+    if not RATE_LIMITS_ENABLED:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **LIMITER.status(username, ip, _plan_for(username))})
+
+
+CHAT_DEFAULTS = json_asset('chat-init', {"defaultPersonality": "friendly"})
 
 
 @app.route("/api/chat/init", methods=["POST"])
 def init_chat():
-    return jsonify({"defaultPersonality": "friendly"})
+    return _send_asset(CHAT_DEFAULTS)
+
+
+def _hashing_busy_response(error: HashingBusy):
+    resp = jsonify({'success': False, 'error': 'Server busy, please retry shortly'})
+    resp.headers['Retry-After'] = '1'
+    return resp, error.status
 
 
 @app.route('/api/auth/signup', methods=['POST'])
@@ -327,48 +724,22 @@ def api_signup():
     email = data.get('email', '')
     if not username or not password:
         return jsonify({'success': False, 'error': 'Missing username or password'}), 400
-    ok, err = create_user(username, password, name, email)
+    try:
+        ok, err = create_user(username, password, name, email)
+    except HashingBusy as e:
+        return _hashing_busy_response(e)
     if not ok:
         return jsonify({'success': False, 'error': err}), 400
     
-    def send_welcome_email(to_email, to_name, to_username):
-        smtp_host = os.environ.get('SMTP_HOST')
-        smtp_port = int(os.environ.get('SMTP_PORT', '587')) if os.environ.get('SMTP_PORT') else None
-        smtp_user = os.environ.get('SMTP_USER')
-        smtp_pass = os.environ.get('SMTP_PASS')
-        smtp_from = os.environ.get('SMTP_FROM') or (smtp_user or 'no-reply@example.com')
-        if not smtp_host or not smtp_port or not smtp_user or not smtp_pass:
-            app.logger.info('SMTP not configured, skipping welcome email')
-            return False
-        try:
-            msg = EmailMessage()
-            msg['Subject'] = 'Welcome to Aizeeno!'
-            msg['From'] = smtp_from
-            msg['To'] = to_email
-            body = f"Hello {to_name or to_username},\n\n"
-            body += "Thanks for signing up to Aizeeno. Here are your account details:\n\n"
-            body += f"Username: {to_username}\n"
-            body += f"Email: {to_email}\n\n"
-            body += "For your security we do not send your password by email. If you need to reset your password, use the app's account settings.\n\n"
-            body += "Thanks and welcome!\nAizeeno team\n"
-            msg.set_content(body)
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as s:
-                s.starttls()
-                s.login(smtp_user, smtp_pass)
-                s.send_message(msg)
-            app.logger.info('Sent welcome email to %s', to_email)
-            return True
-        except Exception as e:
-            app.logger.exception('Failed to send welcome email: %s', e)
-            return False
-
     if email:
+        # Sent by the background job queue so signup does not wait on SMTP
         try:
-            send_welcome_email(email, name, username)
+            JOBS.enqueue('welcome_email', {'email': email, 'name': name, 'username': username})
         except Exception:
-            app.logger.warning('Error while trying to send welcome email')
+            app.logger.warning('Could not queue welcome email')
 
-    return jsonify({'success': True}) 
+    # Signed in straight away, like a login
+    return jsonify({'success': True, **SESSIONS.issue(username)})
  
 
 
@@ -379,10 +750,33 @@ def api_login():
     password = data.get('password', '')
     if not username or not password:
         return jsonify({'success': False, 'error': 'Missing username or password'}), 400
-    user = verify_user(username, password)
+    try:
+        user = verify_user(username, password)
+    except HashingBusy as e:
+        return _hashing_busy_response(e)
     if not user:
         return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
-    return jsonify({'success': True, 'user': user})
+    return jsonify({'success': True, 'user': user, **SESSIONS.issue(user['username'])})
+
+
+@app.route('/api/auth/refresh', methods=['POST'])
+def api_refresh():
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get('refresh_token')
+    if not refresh_token:
+        return jsonify({'success': False, 'error': 'Missing refresh_token'}), 400
+    try:
+        _, tokens = SESSIONS.rotate(refresh_token)
+    except InvalidToken as e:
+        return jsonify({'success': False, 'error': str(e)}), 401
+    return jsonify({'success': True, **tokens})
+
+
+@app.route('/api/auth/logout', methods=['POST'])
+def api_logout():
+    data = request.get_json(silent=True) or {}
+    SESSIONS.revoke(access_token=_bearer_token(), refresh_token=data.get('refresh_token'))
+    return jsonify({'success': True})
 
 
 @app.route('/api/auth/google', methods=['POST'])
@@ -397,154 +791,243 @@ def api_google_login():
         return jsonify({'success': False, 'error': 'Google not configured'}), 500
     
     try:
-        # Verify the Google JWT token
+        # Verify the Google JWT token (google-auth is imported on first use; it is slow to import)
+        from google.auth.transport import requests
+        from google.oauth2 import id_token
         idinfo = id_token.verify_oauth2_token(token, requests.Request(), GOOGLE_CLIENT_ID)
         email = idinfo.get('email')
         name = idinfo.get('name', email)
         
-        print(f"✓ Google token verified for {email}")
+        log.info('Google token verified', extra={'email': email})
         
         # Check if user exists; if not, create one with username derived from email
-        existing_user = find_user(email)
+        existing_user = find_user_by_email(email)
         if existing_user:
-            print(f"  User {email} already exists, logging in")
-            return jsonify({'success': True, 'user': {
-                'username': existing_user.get('username'),
-                'name': existing_user.get('name'),
-                'email': existing_user.get('email')
-            }})
+            log.debug('Google user already exists, logging in', extra={'email': email})
+            return jsonify({'success': True, 'user': existing_user.public(), **SESSIONS.issue(existing_user.username)})
         
         # Create new user with email as username
         username = email.split('@')[0] + '_' + secrets.token_hex(4)  # Avoid username conflicts
         ok, err = create_user(username, secrets.token_urlsafe(32), name, email)
         if not ok:
-            print(f"  Failed to create user: {err}")
+            log.warning('Failed to create Google user: %s', err, extra={'email': email})
             return jsonify({'success': False, 'error': err}), 400
         
-        print(f"  Created new user {username} from Google sign-in")
+        log.info('Created new user from Google sign-in', extra={'username': username})
         return jsonify({'success': True, 'user': {
             'username': username,
             'name': name,
             'email': email
-        }})
+        }, **SESSIONS.issue(username)})
+    except HashingBusy as e:
+        return _hashing_busy_response(e)
     except ValueError as e:
-        print(f"✗ Google token verification failed: {e}")
+        log.warning('Google token verification failed: %s', e)
         return jsonify({'success': False, 'error': 'Invalid Google token'}), 401
     except Exception as e:
-        print(f"✗ Google auth error: {e}")
+        log.exception('Google auth error')
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/auth/update', methods=['POST'])
+@require_auth
 def api_update_user():
     data = request.get_json() or {}
-    username = data.get('username')
     updates = data.get('updates', {})
-    if not username:
-        return jsonify({'success': False, 'error': 'Missing username'}), 400
-    ok, err = update_user(username, updates)
+    if _other_user(data.get('username')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    if not isinstance(updates, dict):
+        return jsonify({'success': False, 'error': 'updates must be an object'}), 400
+    # Plan, payment flag and Stripe ids only change through payment-status and webhooks
+    blocked = sorted(set(updates) - set(PROFILE_FIELDS))
+    if blocked:
+        return jsonify({'success': False, 'error': f"Cannot update: {', '.join(blocked)}"}), 403
+    ok, err = update_user(g.username, updates)
     if not ok:
         return jsonify({'success': False, 'error': err}), 400
     return jsonify({'success': True})
 
 
 @app.route('/api/auth/change_password', methods=['POST'])
+@require_auth
 def api_change_password():
     data = request.get_json() or {}
-    username = data.get('username')
     current = data.get('current')
     new = data.get('new')
-    if not username or not current or not new:
+    if not current or not new:
         return jsonify({'success': False, 'error': 'Missing fields'}), 400
-    ok, err = change_password(username, current, new)
+    if _other_user(data.get('username')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    try:
+        ok, err = change_password(g.username, current, new)
+    except HashingBusy as e:
+        return _hashing_busy_response(e)
     if not ok:
         return jsonify({'success': False, 'error': err}), 400
-    return jsonify({'success': True})
+    # Sign out every other session; this one continues with a fresh pair
+    SESSIONS.revoke_all(g.username)
+    return jsonify({'success': True, **SESSIONS.issue(g.username)})
 
 
 @app.route('/api/conversations', methods=['GET'])
+@require_auth
 def list_conversations():
-    items = _load_conversations()
-    return jsonify({'conversations': items})
+    # Cursor pagination: ?limit=&before=<next_before from the previous page>; the signed-in user's only
+    if _other_user(request.args.get('username')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    owner = g.username
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, CONVERSATION_PAGE_MAX))
+    # Version first: a write landing before the page is read can only make the ETag older than the body
+    count, modified = CONVERSATIONS.version(owner)
+    etag = version_etag(count, int(modified * 1000))
+    if etag_matches(request.if_none_match, etag):
+        return not_modified(etag, modified)
+    items, next_before = CONVERSATIONS.page(owner, limit, request.args.get('before'))
+    return with_validators(jsonify({'conversations': items, 'next_before': next_before}), etag, modified)
+
+
+@app.route('/api/conversations/search', methods=['GET'])
+@require_auth
+def search_conversations():
+    # ?q=&limit=&offset=; ranked matches from the signed-in user's conversations only (see search_index.py)
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'Missing q'}), 400
+    if _other_user(request.args.get('username')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    owner = g.username
+    try:
+        limit = int(request.args.get('limit', 20))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit or offset'}), 400
+    limit = max(1, min(limit, CONVERSATION_PAGE_MAX))
+    items, total = CONVERSATIONS.search(owner, query, limit, max(0, offset))
+    return jsonify({'conversations': items, 'total': total})
+
+
+@app.route('/api/conversations/export', methods=['GET'])
+@require_auth
+def export_conversations():
+    """Stream the signed-in user's conversations as NDJSON, oldest first; ?compress=gzip for a .ndjson.gz."""
+    chunks = ndjson_chunks(CONVERSATIONS.iter_owner(g.username))
+    filename = f"conversations-{secure_filename(g.username) or 'export'}.ndjson"
+    if request.args.get('compress') == 'gzip':
+        chunks, filename, mimetype = gzip_chunks(chunks), filename + '.gz', 'application/gzip'
+    else:
+        mimetype = 'application/x-ndjson'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'})
+
+
+@app.route('/api/conversations/import', methods=['POST'])
+@require_auth
+def import_conversations():
+    """Read NDJSON (plain or gzip) from the request body into the signed-in user's history.
+
+    Records are validated line by line and saved in batches of
+    IMPORT_BATCH_SIZE; the reply counts imported and failed lines.
+    """
+    def check(item):
+        exists, owner = CONVERSATIONS.owner_of(item['id'])
+        return 'Conversation id belongs to another user' if exists and owner != g.username else None
+
+    result = import_lines(ndjson_lines(read_chunks(request.stream)), CONVERSATIONS.save_many, check, g.username)
+    if result.imported:
+        app.logger.info('Imported %d conversations for %s (%d failed)', result.imported, g.username, result.failed)
+    return jsonify({'success': result.imported > 0 or not result.failed, **result.as_dict()})
 
 
 @app.route('/api/conversations', methods=['POST'])
+@require_auth
 def add_conversation():
     data = request.get_json() or {}
+    if _other_user(data.get('username')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    owner = g.username
     user_msg = data.get('user', '')
     ai_msg = data.get('ai', '')
     provided_id = data.get('id')
     title = data.get('title') or (user_msg[:40] + ('...' if len(user_msg) > 40 else ''))
     if not user_msg and not ai_msg:
         return jsonify({'success': False, 'error': 'Empty conversation'}), 400
+    if provided_id and provided_id in CONVERSATIONS and not CONVERSATIONS.get(provided_id, owner):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
 
-    items = _load_conversations()
     conv_id = provided_id or (datetime.utcnow().isoformat() + 'Z')
     item = {
         'id': conv_id,
+        'owner': owner,
         'title': title,
         'user': user_msg,
         'ai': ai_msg,
         'ts': datetime.utcnow().timestamp()
     }
-    items.insert(0, item)
-    _save_conversations(items)
+    CONVERSATIONS.save(item)
     return jsonify({'success': True, 'item': item})
 
 
 @app.route('/api/conversations/new', methods=['POST'])
+@require_auth
 def new_conversation():
+    data = request.get_json(silent=True) or {}
+    if _other_user(data.get('username')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
     conv_id = secrets.token_urlsafe(12)
     title = 'New chat'
     item = {
         'id': conv_id,
+        'owner': g.username,
         'title': title,
         'user': '',
         'ai': '',
         'ts': datetime.utcnow().timestamp()
     }
-    items = _load_conversations()
-    items.insert(0, item)
-    _save_conversations(items)
+    CONVERSATIONS.save(item)
     return jsonify({'success': True, 'item': item})
 
 
 @app.route('/api/conversations/<conv_id>', methods=['GET'])
+@require_auth
 def get_conversation(conv_id):
-    item = _find_conversation(conv_id)
+    # Someone else's conversation reads as missing, so ids can't be probed
+    item = CONVERSATIONS.get(conv_id, g.username)
     if not item:
         return jsonify({'success': False, 'error': 'Not found'}), 404
-    return jsonify({'success': True, 'item': item})
+    modified = modified_at(item)
+    etag = version_etag(len(item.get('messages') or ()), int(modified * 1000))
+    if etag_matches(request.if_none_match, etag):
+        return not_modified(etag, modified)
+    return with_validators(jsonify({'success': True, 'item': item}), etag, modified)
 
 # ==================== FLASK ROUTES: OAUTH & AUTH CONFIG ====================
+# Config comes from the environment, so these bodies are built once per process
+OAUTH_CONFIG = json_asset('oauth-config', {'google': {'clientId': GOOGLE_CLIENT_ID}} if GOOGLE_CLIENT_ID else {})
+
+
 @app.route('/api/oauth-config', methods=['GET'])
 def oauth_config():
     """Return OAuth configuration (Google, etc.) to frontend"""
-    print(f"📡 /api/oauth-config called")
-    response = {}
-    if GOOGLE_CLIENT_ID:
-        response['google'] = {'clientId': GOOGLE_CLIENT_ID}
-        print(f"   Google Client ID: {GOOGLE_CLIENT_ID[:20]}...")
-    return jsonify(response)
+    return _send_asset(OAUTH_CONFIG)
 
 
 # ==================== FLASK ROUTES: STRIPE ====================
+STRIPE_CONFIG = json_asset('stripe-config', {
+    'publishableKey': STRIPE_PUBLISHABLE_KEY,
+    'prices': SUBSCRIPTION_PRICES
+}) if STRIPE_PUBLISHABLE_KEY else None
+
+
 @app.route('/api/stripe-config', methods=['GET'])
 def stripe_config():
-    print(f"📡 /api/stripe-config called")
-    print(f"   STRIPE_PUBLISHABLE_KEY: {STRIPE_PUBLISHABLE_KEY[:20] if STRIPE_PUBLISHABLE_KEY else 'MISSING'}...")
-    print(f"   SUBSCRIPTION_PRICES: {SUBSCRIPTION_PRICES}")
-    
-    if not STRIPE_PUBLISHABLE_KEY:
-        print("❌ ERROR: STRIPE_PUBLISHABLE_KEY is missing!")
+    if STRIPE_CONFIG is None:
+        log.error('STRIPE_PUBLISHABLE_KEY is missing')
         return jsonify({'error': 'Stripe publishable key not configured'}), 500
-    
-    response = {
-        'publishableKey': STRIPE_PUBLISHABLE_KEY,
-        'prices': SUBSCRIPTION_PRICES
-    }
-    print(f"✓ Returning config response")
-    return jsonify(response)
+    return _send_asset(STRIPE_CONFIG)
 
 
 def check_key_mode_mismatch():
@@ -556,10 +1039,18 @@ def check_key_mode_mismatch():
     pk_test = STRIPE_PUBLISHABLE_KEY.startswith('pk_test')
     sk_test = STRIPE_SECRET_KEY.startswith('sk_test')
     if (pk_live and sk_test) or (pk_test and sk_live):
-        print('⚠️ Stripe key mode mismatch: publishable and secret keys appear to be for different modes (test vs live).')
+        log.warning('Stripe key mode mismatch: publishable and secret keys appear to be for different modes (test vs live)')
+        return 'mismatch'
+    return None
 
 
-check_key_mode_mismatch()
+# Checks run concurrently on a background thread so importing the app never waits on Stripe.
+# STARTUP_CHECKS=0 skips them (scripts, benchmarks).
+STARTUP = StartupChecks()
+STARTUP.add('stripe_prices', validate_price_ids)
+STARTUP.add('stripe_key_mode', check_key_mode_mismatch)
+if os.getenv('STARTUP_CHECKS', '1') != '0':
+    STARTUP.start()
 
 
 @app.route('/api/create-checkout-session', methods=['POST'])
@@ -567,87 +1058,86 @@ def create_checkout_session():
     data = request.get_json() or {}
     plan = data.get('plan')
 
-    print(f"📝 Checkout request received for plan: {plan}")
+    log.debug('Checkout request received', extra={'plan': plan})
 
     if not plan:
-        print("❌ ERROR: No plan specified")
         return jsonify({'error': 'Plan is required'}), 400
 
     if plan not in SUBSCRIPTION_PRICES:
-        print(f"❌ ERROR: Invalid plan '{plan}'. Available: {list(SUBSCRIPTION_PRICES.keys())}")
         return jsonify({'error': f'Invalid subscription plan. Available: {list(SUBSCRIPTION_PRICES.keys())}'}), 400
 
     if not STRIPE_SECRET_KEY:
-        print("❌ ERROR: Stripe secret key not configured")
+        log.error('Checkout requested but the Stripe secret key is not configured')
         return jsonify({'error': 'Stripe secret key not configured'}), 500
 
     price_id = SUBSCRIPTION_PRICES[plan]
-    print(f"✓ Plan '{plan}' -> Price ID: {price_id}")
+    # Only a verified session names the buyer; payment-status checks it against the caller
+    username = _session_user(request.headers.get('Authorization'))
 
     try:
-        print(f"🔄 Creating Stripe checkout session...")
         # Use public-facing routes (not templates path) for return URLs
         success_url = f"{APP_DOMAIN}/subscription/success?session_id={{CHECKOUT_SESSION_ID}}&plan={plan}"
         cancel_url = f"{APP_DOMAIN}/subscription/canceled?plan={plan}"
 
-        session = stripe.checkout.Session.create(
-            success_url=success_url,
-            cancel_url=cancel_url,
-            mode='subscription',
-            payment_method_types=["card"],
-            line_items=[{
-                'price': price_id,
-                'quantity': 1
-            }],
-            metadata={'plan': plan, 'username': data.get('username')} if data.get('username') else {'plan': plan},
-        )
-
-        print(f"✅ Checkout session created: {session.id}")
+        with time_stripe('checkout.Session.create'):
+            session = stripe.checkout.Session.create(
+                success_url=success_url,
+                cancel_url=cancel_url,
+                mode='subscription',
+                payment_method_types=["card"],
+                line_items=[{
+                    'price': price_id,
+                    'quantity': 1
+                }],
+                metadata={'plan': plan, 'username': username} if username else {'plan': plan},
+                **({'client_reference_id': username} if username else {}),
+            )
+
+        log.info('Checkout session created', extra={'plan': plan, 'price_id': price_id, 'session_id': session.id})
         return jsonify({'sessionId': session.id})
 
     except Exception as e:
-        print(f"❌ Stripe error creating session: {str(e)}")
-        app.logger.exception("Stripe checkout error")
+        log.exception('Stripe error creating checkout session', extra={'plan': plan})
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/payment-status', methods=['POST'])
+@require_auth
 def payment_status():
     """Check and update payment status from Stripe session"""
     data = request.get_json() or {}
-    username = data.get('username')
+    username = g.username
     session_id = data.get('session_id')
-    plan = data.get('plan')
     
-    if not username or not session_id or not plan:
-        return jsonify({'error': 'Missing username, session_id, or plan'}), 400
+    if not session_id:
+        return jsonify({'error': 'Missing session_id'}), 400
+    if _other_user(data.get('username')):
+        return jsonify({'error': 'Forbidden'}), 403
     
     try:
-        # Retrieve the session from Stripe
-        session = stripe.checkout.Session.retrieve(session_id, expand=['subscription'])
-
-        print(f"📋 Payment status check for {username}: payment_status={getattr(session, 'payment_status', None)}")
-        print(f"    session.customer={getattr(session, 'customer', None)}, subscription={getattr(session, 'subscription', None)}")
-
-        # If there is a subscription object expand further and log
-        sub_id = getattr(session, 'subscription', None)
-        if sub_id:
-            try:
-                sub = stripe.Subscription.retrieve(sub_id)
-                print(f"    subscription.id={sub.id}, status={sub.status}, current_period_end={getattr(sub, 'current_period_end', None)}")
-            except Exception as e:
-                print(f"    could not retrieve subscription {sub_id}: {e}")
+        # Answered from the webhook-fed mirror when possible; otherwise one expanded retrieve, cached briefly
+        session = SUBSCRIPTIONS.session(session_id)
+        user = find_user(username)
+        # The session must be this user's checkout, or paid by the Stripe customer already on their account
+        owner = session.get('username')
+        if user is None or not (owner == username or (owner is None and session['customer']
+                                                      and session['customer'] == user.stripe_customer_id)):
+            return jsonify({'error': 'Forbidden'}), 403
 
         # Check if payment was successful
-        if getattr(session, 'payment_status', None) == 'paid':
-            print(f"✅ Payment confirmed for {username} - Plan: {plan}")
-
-            # Update user with subscription info
+        if session['payment_status'] == 'paid':
+            # The plan is whatever the subscription's price buys, not what the client asks for
+            subscription = SUBSCRIPTIONS.subscription(session['subscription'])
+            plan = STRIPE_EVENTS.plan_for_price(subscription.get('price') if subscription else None)
+            if plan is None:
+                log.error('Paid session without a known price', extra={'session_id': session_id})
+                return jsonify({'error': 'Unknown subscription price'}), 502
+            # Update user with subscription info (a no-op on repeat polls)
             updates = {
                 'payment': True,
                 'subscription': plan,
-                'stripe_customer_id': session.customer,
-                'stripe_subscription_id': session.subscription
+                'stripe_customer_id': session['customer'],
+                'stripe_subscription_id': session['subscription']
             }
 
             ok, err = update_user(username, updates)
@@ -656,83 +1146,123 @@ def payment_status():
                     'success': True,
                     'payment': True,
                     'subscription': plan,
+                    'subscription_status': subscription['status'] if subscription else None,
                     'message': f'Payment successful! Welcome to {plan.upper()} plan'
                 })
             else:
                 return jsonify({'error': 'Failed to update user subscription'}), 500
         else:
-            print(f"⏳ Payment pending for {username}")
             return jsonify({
                 'success': True,
                 'payment': False,
-                'payment_status': getattr(session, 'payment_status', None),
+                'payment_status': session['payment_status'],
                 'message': 'Payment is pending'
             })
     
     except Exception as e:
-        print(f"❌ Error checking payment status: {str(e)}")
+        log.exception('Error checking payment status', extra={'session_id': session_id})
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/user-subscription/<username>', methods=['GET'])
+@require_auth
 def user_subscription(username):
     """Get user's subscription and payment status"""
+    if _other_user(username):
+        return jsonify({'error': 'Forbidden'}), 403
     user = find_user(username)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
+    # Local only: the mirror holds whatever webhooks or recent polls reported for this subscription
+    subscription = SUBSCRIPTIONS.subscription(user.stripe_subscription_id, fetch=False) or {}
     return jsonify({
-        'username': user.get('username'),
-        'subscription': user.get('subscription', 'free'),
-        'payment': user.get('payment', False),
-        'stripe_customer_id': user.get('stripe_customer_id'),
-        'stripe_subscription_id': user.get('stripe_subscription_id')
+        'username': user.username,
+        'subscription': user.subscription or 'free',
+        'payment': user.payment,
+        'stripe_customer_id': user.stripe_customer_id,
+        'stripe_subscription_id': user.stripe_subscription_id,
+        'subscription_status': subscription.get('status'),
+        'current_period_end': subscription.get('current_period_end'),
+        'cancel_at_period_end': subscription.get('cancel_at_period_end')
     })
 
 
+# ==================== FLASK ROUTES: STATIC & TEMPLATES ====================
+# Pages and static files are hashed and precompressed once at startup; see assets.py
+ASSETS = AssetManifest(os.path.join(BASE_DIR, 'static'), TEMPLATES_DIR, aliases={
+    '/': 'index.html',
+    '/subscription': 'subscription.html',
+    '/subscription/success': 'subscription.html',
+    '/subscription/canceled': 'subscription.html',
+})
+ALLOWED_PAGE_EXT = ('.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.svg', '.ico', '.json')
+
+
+def _asset_response(route: str, fallback_dir: Optional[str] = None, fallback_file: Optional[str] = None):
+    """Serve a manifest asset with its ETag and cache policy, or fall back to the file on disk."""
+    asset = ASSETS.get(route)
+    if asset is None:
+        return send_from_directory(fallback_dir, fallback_file)
+    return _send_asset(asset)
+
+
 @app.route('/c/<conv_id>/<path:slug>')
 def serve_chat_with_id(conv_id, slug):
     """Serve chat page for conversation URLs"""
-    return send_from_directory(TEMPLATES_DIR, 'chat.html')
+    return _asset_response('/chat.html', TEMPLATES_DIR, 'chat.html')
+
+
+@app.route('/static/<path:filename>')
+def serve_static(filename):
+    return _asset_response(f"/static/{filename}", os.path.join(BASE_DIR, 'static'), filename)
+
 
-# ==================== FLASK ROUTES: STATIC & TEMPLATES ====================
 @app.route('/')
 def index_page():
-    return send_from_directory(TEMPLATES_DIR, 'index.html')
+    return _asset_response('/', TEMPLATES_DIR, 'index.html')
 
 
 @app.route('/<path:page>')
 def serve_template_page(page):
-    allowed_ext = ('.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.svg', '.ico', '.json')
-    if any(page.endswith(ext) for ext in allowed_ext):
-        safe_page = page.replace('..', '')
-        return send_from_directory(TEMPLATES_DIR, safe_page)
-    return send_from_directory(TEMPLATES_DIR, 'index.html')
+    if page.endswith(ALLOWED_PAGE_EXT):
+        return _asset_response(f"/{page}", TEMPLATES_DIR, page.replace('..', ''))
+    return _asset_response('/', TEMPLATES_DIR, 'index.html')
 
 
 @app.route('/templates/<path:page>')
 def serve_templates_dir(page):
-    safe_page = page.replace('..', '')
-    return send_from_directory(TEMPLATES_DIR, safe_page)
+    return _asset_response(f"/templates/{page}", TEMPLATES_DIR, page.replace('..', ''))
 
 
 # Serve subscription page at a friendly route
 @app.route('/subscription')
 def subscription_page():
-    return send_from_directory(TEMPLATES_DIR, 'subscription.html')
+    return _asset_response('/subscription', TEMPLATES_DIR, 'subscription.html')
 
 
 # Friendly success/cancel routes used by Stripe
 @app.route('/subscription/success')
 def subscription_success():
     # The frontend reads session_id and plan from the querystring and verifies
-    return send_from_directory(TEMPLATES_DIR, 'subscription.html')
+    return _asset_response('/subscription/success', TEMPLATES_DIR, 'subscription.html')
 
 
 @app.route('/subscription/canceled')
 def subscription_canceled():
-    return send_from_directory(TEMPLATES_DIR, 'subscription.html')
+    return _asset_response('/subscription/canceled', TEMPLATES_DIR, 'subscription.html')
+
+
+def create_app() -> Flask:
+    """WSGI factory for process-per-worker servers (``gunicorn 'main:create_app()'``).
+
+    Module state (stores, job queues, the log listener) is built at import,
+    once per worker; see gunicorn.conf.py for what is shared between them.
+    """
+    return app
 
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host="127.0.0.1", port=int(os.getenv('PORT', '5000')),
+            debug=os.getenv('FLASK_DEBUG', '0').lower() in ('1', 'true', 'yes'))
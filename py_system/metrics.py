@@ -0,0 +1,257 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are kept per label set behind one lock
+per metric; updating one is a dict lookup and an add, cheap enough for
+every request. ``REGISTRY.render()`` produces the ``/metrics`` body.
+
+Components that already keep their own counters (the response cache, the
+LLM router, the subscription mirror, ...) are not double-counted: they
+are read at scrape time by collectors registered with
+``REGISTRY.add_collector``.
+
+Values are per process; with several workers, scrape each one (or let
+the scraper sum them).
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cache hit through a slow 70B completion
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+# (name, type, help, [(labels, value)]) produced by a collector at scrape time
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield f'{self.name}_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Modules may be re-imported (reloader, tests); keep the first instance
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], Iterable[Family]]):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            try:
+                families = list(collect())
+            except Exception:
+                # A broken collector must not take the whole scrape down
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(f'{name}{_format_labels(labels)} {_format_value(value)}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HTTP_LATENCY = REGISTRY.histogram('http_request_duration_seconds',
+                                  'Time to produce response headers, by route', ('method', 'route', 'status'))
+HTTP_IN_FLIGHT = REGISTRY.gauge('http_requests_in_flight', 'Requests currently being handled', ('method', 'route'))
+LLM_LATENCY = REGISTRY.histogram('llm_request_duration_seconds',
+                                 'Upstream completion time per model', ('model', 'kind', 'outcome'))
+LLM_FIRST_TOKEN = REGISTRY.histogram('llm_time_to_first_token_seconds', 'Time to the first streamed token per model',
+                                     ('model',))
+LLM_TOKENS = REGISTRY.counter('llm_tokens_total', 'Estimated prompt and completion tokens per model',
+                              ('model', 'direction'))
+LLM_IN_FLIGHT = REGISTRY.gauge('llm_requests_in_flight', 'Upstream completions in progress', ('model',))
+LLM_ROUTED = REGISTRY.counter('llm_routed_total', 'Chat prompts per model chosen by the prompt router, and why',
+                              ('model', 'reason'))
+LLM_COST = REGISTRY.counter('llm_cost_usd_total', 'Estimated upstream spend per model (MODEL_PRICES)', ('model',))
+STRIPE_LATENCY = REGISTRY.histogram('stripe_request_duration_seconds', 'Stripe API call time by operation',
+                                    ('operation', 'outcome'))
+
+
+@contextmanager
+def time_stripe(operation: str):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        STRIPE_LATENCY.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+
+
+def timed_stripe(operation: str, fn: Callable) -> Callable:
+    """Wrap a Stripe SDK call (e.g. stripe.Price.retrieve) so each call is timed."""
+    def call(*args, **kwargs):
+        with time_stripe(operation):
+            return fn(*args, **kwargs)
+    return call
+
+
+def stats_collector(prefix: str, stats: Callable[[], dict], kinds: Dict[str, str],
+                    labels: Optional[Dict[str, str]] = None) -> Callable[[], List[Family]]:
+    """Collector exporting chosen numeric keys of a component's stats() dict.
+
+    ``kinds`` maps stats keys to 'counter' or 'gauge'; counters get a
+    ``_total`` suffix. Values are read at scrape time.
+    """
+    def collect() -> List[Family]:
+        snapshot = stats()
+        families = []
+        for key, kind in kinds.items():
+            value = snapshot.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'{prefix}_{key}' + ('_total' if kind == 'counter' else '')
+            families.append((name, kind, f'{prefix} {key.replace("_", " ")}', [(dict(labels or {}), value)]))
+        return families
+    return collect
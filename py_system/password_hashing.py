@@ -0,0 +1,114 @@
+"""PBKDF2 password hashing off the request thread.
+
+Hashes run on a small process pool so a burst of logins cannot starve the
+chat endpoints of CPU/GIL time. The number of pending hashes is bounded;
+when the queue is full ``HashingBusy`` is raised and the route answers 429
+instead of piling up work.
+
+Pool workers are started by a forkserver (spawn where that is missing),
+never forked from the app process, whose SQLite connections, locks and
+background threads a forked child would inherit mid-use. A worker that
+dies breaks the pool: the hash is done inline and the next call starts a
+new pool. A hash that takes longer than HASH_TIMEOUT raises
+``HashingUnavailable`` (answered 503).
+
+Cost parameters come from the environment:
+
+* ``PBKDF2_ITERATIONS`` - iterations for new and upgraded hashes
+* ``HASH_WORKERS``      - pool size (0 hashes inline on the calling thread)
+* ``HASH_MAX_PENDING``  - queued + running hashes before rejecting
+"""
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+# Iteration count used for records written before the count was stored per user
+LEGACY_ITERATIONS = 100_000
+
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', str(LEGACY_ITERATIONS)))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv('HASH_MAX_PENDING', str(max(HASH_WORKERS, 1) * 8)))
+HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', '10'))
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer ``status`` (429)."""
+    status = 429
+
+
+class HashingUnavailable(HashingBusy):
+    """Raised when the pool did not produce a hash in time."""
+    status = 503
+
+
+def _pbkdf2(password: str, salt: str, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations).hex()
+
+
+class PasswordHasher:
+    def __init__(self, iterations: int = PBKDF2_ITERATIONS, workers: int = HASH_WORKERS,
+                 max_pending: int = HASH_MAX_PENDING, timeout: float = HASH_TIMEOUT):
+        self.iterations = iterations
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Started on first use so importing the app does not fork
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(method))
+        return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, password: str, salt: str, iterations: int) -> str:
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password operations in progress')
+        try:
+            if self.workers <= 0:
+                return _pbkdf2(password, salt, iterations)
+            pool = self._executor()
+            try:
+                return pool.submit(_pbkdf2, password, salt, iterations).result(timeout=self.timeout)
+            except BrokenProcessPool:
+                # A worker died (OOM kill, ...); answer from this thread and start afresh next time
+                self._discard(pool)
+                return _pbkdf2(password, salt, iterations)
+            except TimeoutError:
+                raise HashingUnavailable('Password hashing timed out')
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str, salt: Optional[str] = None) -> Tuple[str, str, int]:
+        # Returns (hash, salt, iterations) at the current cost
+        if salt is None:
+            salt = secrets.token_hex(16)
+        return self._run(password, salt, self.iterations), salt, self.iterations
+
+    def verify(self, password: str, stored_hash: str, salt: str, iterations: Optional[int]) -> bool:
+        candidate = self._run(password, salt, iterations or LEGACY_ITERATIONS)
+        return hmac.compare_digest(candidate, stored_hash or '')
+
+    def needs_rehash(self, salt: Optional[str], iterations: Optional[int]) -> bool:
+        return not salt or (iterations or LEGACY_ITERATIONS) < self.iterations
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,140 @@
+"""Pick the model for a chat prompt: the fast 8B model unless it looks hard.
+
+Chat used to go to ``llama-3.1-8b-instant`` every time, and only the
+explicit "code" mode reached the 70B model. Most chat traffic is
+greetings, lookups and one-line rewrites that the small model answers
+well and several times faster. Some prompts need the large model,
+though: multi-step reasoning, debugging, design questions and long-form
+writing.
+
+``PromptRouter.classify`` decides locally, in tens of microseconds, with no
+network call. It works in two steps:
+
+* clear cases are settled by rules: chit-chat and very short prompts go
+  to the fast model; pasted code, tracebacks and very long prompts go to
+  the large one;
+* everything else is scored by a logistic model over cheap text features
+  (length, reasoning and design cues, math, multi-part asks, requested
+  length). ``WEIGHTS`` were fitted offline on
+  benchmarks/data/routing_prompts.jsonl with
+  ``benchmarks/eval_routing.py --fit``.
+
+ROUTE_THRESHOLD moves the cut-off: raise it to keep more traffic on the
+fast model, lower it to favor quality. PROMPT_ROUTING=0 turns routing
+off, so chat stays on the fast model as before. Only paying plans
+(LARGE_MODEL_PLANS in main.py) are sent to the large model; free and
+anonymous chat stays on the fast one, counted with reason "plan".
+
+Each call's estimated spend is exported per model from MODEL_PRICES
+(USD per million prompt/completion tokens, overridable as JSON). Latency
+per model is already in llm_request_duration_seconds.
+"""
+import json
+import math
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+PROMPT_ROUTING = os.getenv('PROMPT_ROUTING', '1') != '0'
+ROUTE_THRESHOLD = float(os.getenv('ROUTE_THRESHOLD', '0.5'))
+# Longer prompts go to the large model without scoring (tokens, ~4 chars each)
+LONG_PROMPT_TOKENS = int(os.getenv('ROUTE_LONG_PROMPT_TOKENS', '1500'))
+# Only this much of a prompt is scanned for features; length is still counted in full
+SCAN_CHARS = 4000
+
+# USD per million (prompt, completion) tokens
+MODEL_PRICES: Dict[str, tuple] = {
+    'llama-3.1-8b-instant': (0.05, 0.08),
+    'llama-3.1-70b-versatile': (0.59, 0.79),
+}
+MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv('MODEL_PRICES') or '{}').items()})
+
+_CHIT_CHAT = re.compile(r"^(hi|hey|hello|yo|thanks|thank you|thx|ok|okay|cool|nice|lol|yes|no|sure|great|"
+                        r"good (morning|night|evening|afternoon)|bye)\b[\s\w,!.']{0,30}$")
+_CODE = re.compile(r"```|^\s*(def|class|import|from|#include|public|fn|func|const|let|var)\s|[;{}]\s*$|=>|"
+                   r"\w+\(.*\)\.\w+\(|traceback \(most recent call last\)|^\s*at [\w.$]+\(", re.MULTILINE)
+_ERROR = re.compile(r"\b\w*(error|exception)\b[:\s]|\b(segfault|stack trace|oomkilled|panic)\b")
+_REASONING = re.compile(r"\b(why|prove|proof|derive|step by step|analy[sz]e|compare|evaluate|trade-?offs?|"
+                        r"implications?|design|architect\w*|optimi[sz]e|justify|reasoning|pros and cons|"
+                        r"root cause|walk me through|debug\w*|refactor\w*|review)\b")
+_MATH = re.compile(r"\b(integral|derivative|equation|theorem|probability|complexity|o\(n|matrix|"
+                   r"regularization|irrational)\b|\d\s*[-+*/^]\s*\d")
+_CONSTRAINTS = re.compile(r"\b(must|without|given|constraints?|at least|handle[sd]?|including|include|"
+                          r"edge cases|safe for|tailored|budget)\b")
+_LONG_OUTPUT = re.compile(r"\b(essay|detailed|in depth|comprehensive|outline|plan|report|program|"
+                          r"projections?|\d{3,} words|cover letter|unit tests)\b")
+_SIMPLE_ASK = re.compile(r"^(what('s| is| are| does)|who|when|where|how (many|much|long|tall|do you say)|"
+                         r"define|translate|convert|spell|give me (a|an|one|three|five)|list|recommend|suggest|"
+                         r"is an? |tell me a)\b")
+
+
+class Route(NamedTuple):
+    large: bool
+    score: float   # probability the prompt needs the large model (1.0/0.0 for rule decisions)
+    reason: str    # rule name, or "scored"
+
+
+def prompt_features(prompt: str) -> Dict[str, float]:
+    """Feature vector of a prompt for the logistic model (see WEIGHTS)."""
+    text = prompt[:SCAN_CHARS].lower()
+    words = len(text.split())
+    return {
+        'log_words': math.log1p(words),
+        'sentences': min(3, text.count('. ') + text.count('? ') + text.count(', ')) / 3,
+        'code': 1.0 if _CODE.search(text) else 0.0,
+        'error': 1.0 if _ERROR.search(text) else 0.0,
+        'reasoning': min(2, len(_REASONING.findall(text))) / 2,
+        'math': 1.0 if _MATH.search(text) else 0.0,
+        'multi_part': min(3, text.count(' and ') + max(0, text.count('?') - 1)) / 3,
+        'constraints': min(2, len(_CONSTRAINTS.findall(text))) / 2,
+        'long_output': 1.0 if _LONG_OUTPUT.search(text) else 0.0,
+        'simple_ask': 1.0 if _SIMPLE_ASK.match(text) else 0.0,
+    }
+
+
+# Fitted by benchmarks/eval_routing.py --fit; re-run it and paste the output after changing the features
+BIAS = -7.813
+WEIGHTS: Dict[str, float] = {
+    'log_words': 2.702,
+    'sentences': 1.345,
+    'code': 0.112,
+    'error': 0.241,
+    'reasoning': 1.299,
+    'math': 1.018,
+    'multi_part': 1.183,
+    'constraints': 0.395,
+    'long_output': 0.124,
+    'simple_ask': -0.973,
+}
+
+
+class PromptRouter:
+    def __init__(self, weights: Optional[Dict[str, float]] = None, bias: float = BIAS,
+                 threshold: float = ROUTE_THRESHOLD, long_prompt_tokens: int = LONG_PROMPT_TOKENS):
+        self.weights = weights if weights is not None else WEIGHTS
+        self.bias = bias
+        self.threshold = threshold
+        self.long_prompt_chars = long_prompt_tokens * 4
+
+    def score(self, prompt: str) -> float:
+        z = self.bias + sum(self.weights.get(name, 0.0) * value for name, value in prompt_features(prompt).items())
+        return 1 / (1 + math.exp(-z))
+
+    def classify(self, prompt: str) -> Route:
+        stripped = prompt.strip()
+        if len(stripped) > self.long_prompt_chars:
+            return Route(True, 1.0, 'long')
+        head = stripped[:SCAN_CHARS]
+        if '```' in head or 'Traceback (most recent call last)' in head:
+            return Route(True, 1.0, 'code')
+        lowered = head.lower()
+        if len(lowered.split()) <= 3 or _CHIT_CHAT.match(lowered):
+            return Route(False, 0.0, 'short')
+        score = self.score(head)
+        return Route(score >= self.threshold, round(score, 4), 'scored')
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD for one call; 0 for models without a price."""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
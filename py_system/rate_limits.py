@@ -0,0 +1,290 @@
+"""Per-plan rate limits and daily token quotas for the chat endpoints.
+
+Every chat request passes two checks before it reaches the model:
+
+* a token bucket per user (sized by plan; anonymous callers get one per
+  IP sized by ANONYMOUS_PLAN) and one per client IP shared by everyone
+  behind it, which bound the request rate while allowing short bursts;
+* a daily token quota per user, or per IP for anonymous callers, charged
+  with the prompt and reply tokens once a reply has been produced.
+
+The user is the one named by the request's verified access token, never a
+username in the body, and callers without one get ANONYMOUS_PLAN (the
+strictest plan).
+
+Counters live in a counter store. The in-memory store keeps one small list
+per bucket, so a check is a dict lookup and a little arithmetic, and drops
+buckets that have refilled (they read the same as new ones); the SQLite
+store keeps the same counters in a file (RATE_LIMIT_DB) so several worker
+processes enforce one shared limit, and deletes refilled buckets and past
+days' usage the same way. Plans can be tuned with PLAN_LIMITS
+(JSON, merged over the defaults below).
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# per_minute: sustained request rate, burst: bucket size, daily_tokens: prompt + reply tokens per UTC day
+PLAN_LIMITS: Dict[str, dict] = {
+    'free': {'per_minute': 10, 'burst': 5, 'daily_tokens': 20_000},
+    'starter': {'per_minute': 20, 'burst': 10, 'daily_tokens': 100_000},
+    'pro': {'per_minute': 60, 'burst': 20, 'daily_tokens': 500_000},
+    'elite': {'per_minute': 120, 'burst': 40, 'daily_tokens': 2_000_000},
+}
+for _plan, _overrides in json.loads(os.getenv('PLAN_LIMITS') or '{}').items():
+    PLAN_LIMITS.setdefault(_plan, dict(PLAN_LIMITS['free'])).update(_overrides)
+
+# Fewest daily tokens, then the lowest rate: what callers without a session get
+ANONYMOUS_PLAN = min(PLAN_LIMITS, key=lambda name: (PLAN_LIMITS[name]['daily_tokens'], PLAN_LIMITS[name]['per_minute']))
+
+# Applies to every client address regardless of account, so rotating usernames doesn't help
+IP_LIMIT = {'per_minute': int(os.getenv('IP_RATE_PER_MINUTE', '120')), 'burst': int(os.getenv('IP_RATE_BURST', '40'))}
+
+
+def utc_day(now: Optional[float] = None) -> str:
+    return datetime.fromtimestamp(now if now is not None else time.time(), timezone.utc).strftime('%Y-%m-%d')
+
+
+def seconds_until_reset(now: Optional[float] = None) -> int:
+    now = now if now is not None else time.time()
+    return int(86400 - now % 86400) + 1
+
+
+# How often a store sweeps out buckets that have refilled (and, in SQLite, past days' usage)
+PRUNE_INTERVAL = 60.0
+
+
+class MemoryCounterStore:
+    def __init__(self, prune_interval: float = PRUNE_INTERVAL):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, list] = {}  # key -> [tokens, updated, full_at]
+        self._usage: Dict[str, int] = {}
+        self._day = utc_day()
+        self.prune_interval = prune_interval
+        self._next_prune = time.time() + prune_interval
+
+    def take(self, key: str, capacity: float, rate: float, now: float, cost: int = 1) -> Tuple[bool, float, float]:
+        """Take ``cost`` tokens from a bucket; returns (allowed, tokens_left, retry_after)."""
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [capacity, now, now]
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            bucket[0], bucket[1], bucket[2] = tokens, now, now + (capacity - tokens) / rate
+            return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+    def _prune(self, now: float):
+        # A full bucket is the same as a missing one, so every client seen once doesn't stay forever
+        for key in [k for k, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+        self._next_prune = now + self.prune_interval
+
+    def peek(self, key: str, capacity: float, rate: float, now: float) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+    def _roll(self, day: str):
+        # Yesterday's usage is never read again
+        if day != self._day:
+            self._usage.clear()
+            self._day = day
+
+    def usage(self, key: str, day: str) -> int:
+        with self._lock:
+            self._roll(day)
+            return self._usage.get(key, 0)
+
+    def add_usage(self, key: str, day: str, amount: int) -> int:
+        with self._lock:
+            self._roll(day)
+            used = self._usage[key] = self._usage.get(key, 0) + amount
+            return used
+
+
+class SQLiteCounterStore:
+    """Same counters in a SQLite file shared by all workers; updates run in IMMEDIATE transactions."""
+
+    def __init__(self, path: str, prune_interval: float = PRUNE_INTERVAL):
+        self.path = path
+        self._local = threading.local()
+        self.prune_interval = prune_interval
+        self._next_prune = time.time() + prune_interval
+        self._prune_lock = threading.Lock()
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                   "full_at REAL NOT NULL DEFAULT 0)")
+        if 'full_at' not in [row[1] for row in db.execute("PRAGMA table_info(rate_buckets)")]:
+            # Files from before pruning; their rows read as refilled and go at the first sweep
+            db.execute("ALTER TABLE rate_buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+        db.execute("CREATE INDEX IF NOT EXISTS rate_buckets_full ON rate_buckets (full_at)")
+        db.execute("CREATE TABLE IF NOT EXISTS token_usage (key TEXT NOT NULL, day TEXT NOT NULL, used INTEGER NOT NULL, "
+                   "PRIMARY KEY (key, day))")
+        db.execute("CREATE INDEX IF NOT EXISTS token_usage_day ON token_usage (day)")
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float, now: float, cost: int = 1) -> Tuple[bool, float, float]:
+        if now >= self._next_prune:
+            self._prune(now)
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            db.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                       (key, tokens, now, now + (capacity - tokens) / rate))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+    def _prune(self, now: float):
+        # As in the memory store: a refilled bucket reads the same as a missing one, and only
+        # today's usage is ever read. One thread per process sweeps; the others carry on.
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_prune = now + self.prune_interval
+            db = self._db()
+            db.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+            db.execute("DELETE FROM token_usage WHERE day < ?", (utc_day(now),))
+        except sqlite3.Error:
+            pass  # busy with other workers; the next sweep catches up
+        finally:
+            self._prune_lock.release()
+
+    def peek(self, key: str, capacity: float, rate: float, now: float) -> float:
+        row = self._db().execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        return capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+
+    def usage(self, key: str, day: str) -> int:
+        row = self._db().execute("SELECT used FROM token_usage WHERE key = ? AND day = ?", (key, day)).fetchone()
+        return row[0] if row else 0
+
+    def add_usage(self, key: str, day: str, amount: int) -> int:
+        db = self._db()
+        db.execute("INSERT INTO token_usage (key, day, used) VALUES (?, ?, ?) "
+                   "ON CONFLICT (key, day) DO UPDATE SET used = used + excluded.used", (key, day, amount))
+        return self.usage(key, day)
+
+
+class LimitResult:
+    __slots__ = ('allowed', 'reason', 'retry_after', 'quota')
+
+    def __init__(self, allowed: bool, quota: dict, reason: Optional[str] = None, retry_after: float = 0.0):
+        self.allowed = allowed
+        self.reason = reason
+        self.retry_after = retry_after
+        self.quota = quota
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            'X-RateLimit-Limit': str(self.quota['per_minute']),
+            'X-RateLimit-Remaining': str(self.quota['requests_remaining']),
+            'X-Quota-Remaining': str(self.quota['remaining_tokens']),
+        }
+        if not self.allowed:
+            h['Retry-After'] = str(max(1, math.ceil(self.retry_after)))
+        return h
+
+
+class RateLimiter:
+    def __init__(self, store=None, plans: Dict[str, dict] = None, ip_limit: dict = None):
+        self.store = store if store is not None else MemoryCounterStore()
+        self.plans = plans if plans is not None else PLAN_LIMITS
+        self.ip_limit = ip_limit if ip_limit is not None else IP_LIMIT
+        self.denied = 0
+
+    def limits(self, plan: Optional[str]) -> dict:
+        return self.plans.get(plan or 'free') or self.plans['free']
+
+    @staticmethod
+    def _quota_key(username: Optional[str], ip: Optional[str]) -> str:
+        return f"u:{username}" if username else f"ip:{ip}"
+
+    @staticmethod
+    def _bucket_key(username: Optional[str], ip: Optional[str]) -> str:
+        # Anonymous callers are held to their plan's rate too, not just the looser IP_LIMIT
+        return f"u:{username}" if username else f"anon:{ip}"
+
+    def status(self, username: Optional[str], ip: Optional[str], plan: Optional[str],
+               bucket_left: Optional[float] = None, now: Optional[float] = None) -> dict:
+        now = now if now is not None else time.time()
+        limits = self.limits(plan)
+        if bucket_left is None:
+            bucket_left = self.store.peek(self._bucket_key(username, ip), limits['burst'],
+                                          limits['per_minute'] / 60.0, now)
+        used = self.store.usage(self._quota_key(username, ip), utc_day(now))
+        return {
+            'plan': plan or 'free',
+            'per_minute': limits['per_minute'],
+            'requests_remaining': int(bucket_left),
+            'daily_tokens': limits['daily_tokens'],
+            'used_tokens': used,
+            'remaining_tokens': max(0, limits['daily_tokens'] - used),
+            'resets_in': seconds_until_reset(now),
+        }
+
+    def check(self, username: Optional[str], ip: Optional[str], plan: Optional[str], cost: int = 1,
+              tokens: int = 0) -> LimitResult:
+        """Admit a chat request or say why not.
+
+        Admitted requests consume ``cost`` bucket tokens (one per upstream call, so a
+        batch pays for each distinct prompt) and need at least ``tokens`` of the daily
+        quota left (the prompt tokens they are about to send).
+        """
+        now = time.time()
+        limits = self.limits(plan)
+        quota = self.status(username, ip, plan, bucket_left=0, now=now)
+        if quota['remaining_tokens'] < max(1, tokens):
+            self.denied += 1
+            return LimitResult(False, quota, 'daily_quota', quota['resets_in'])
+        if cost > min(limits['burst'], self.ip_limit['burst']):
+            # Would never fit in the bucket, however long the caller waits
+            self.denied += 1
+            return LimitResult(False, quota, 'batch_size', 0.0)
+        if ip:
+            ok, _, retry = self.store.take(f"ip:{ip}", self.ip_limit['burst'], self.ip_limit['per_minute'] / 60.0,
+                                           now, cost)
+            if not ok:
+                self.denied += 1
+                return LimitResult(False, quota, 'ip_rate', retry)
+        if username or ip:
+            ok, left, retry = self.store.take(self._bucket_key(username, ip), limits['burst'],
+                                              limits['per_minute'] / 60.0, now, cost)
+            quota['requests_remaining'] = int(left)
+            if not ok:
+                self.denied += 1
+                return LimitResult(False, quota, 'rate', retry)
+        return LimitResult(True, quota)
+
+    def charge(self, username: Optional[str], ip: Optional[str], tokens: int) -> int:
+        return self.store.add_usage(self._quota_key(username, ip), utc_day(), tokens)
+
+
+def open_counter_store():
+    # RATE_LIMIT_DB: SQLite file shared by workers; unset keeps counters in this process
+    path = os.getenv('RATE_LIMIT_DB')
+    return SQLiteCounterStore(path) if path else MemoryCounterStore()
@@ -0,0 +1,250 @@
+"""Inverted index for searching conversation history.
+
+Each owner gets a separate partition, so a search only ever reads that
+user's postings however many conversations other users have. A partition
+maps terms to posting dicts (conversation id -> term frequency) and keeps
+its vocabulary sorted, so a prefix ("recur" -> recursion, recursive) is a
+bisect plus a short scan.
+
+Every query word must match. The last one may also match as a prefix of
+an indexed term ("recur" -> recursion, recursive), scoring a little lower
+than an exact hit, so results follow the query as it is typed.
+
+Results are ranked with BM25 over the owner's partition. The rarest word
+is scored first and the others only for conversations still matching,
+so a common word in a long history costs little once a rarer word has
+narrowed the set.
+
+A partition is built the first time its owner searches, so startup and
+memory only pay for users who use search. From then on it is updated
+incrementally: saving a conversation re-indexes that one record, and
+appending chat turns only adds the new messages' terms.
+"""
+import bisect
+import heapq
+import math
+import re
+from collections import Counter
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 40
+MAX_QUERY_TERMS = 8
+# Prefix expansion stops after this many vocabulary terms per query term
+MAX_EXPANSIONS = 64
+PREFIX_WEIGHT = 0.7
+SNIPPET_CHARS = 160
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) <= MAX_TERM_LENGTH]
+
+
+def conversation_texts(item: dict) -> Iterable[str]:
+    """The searchable text of a conversation record: title, first exchange and every message."""
+    for field in ('title', 'user', 'ai'):
+        if item.get(field):
+            yield item[field]
+    for message in item.get('messages') or ():
+        if message.get('content'):
+            yield message['content']
+
+
+def snippet(item: dict, terms: Iterable[str], width: int = SNIPPET_CHARS) -> str:
+    """A window of text around the first place any of ``terms`` occurs."""
+    texts = list(conversation_texts(item))
+    for text in texts:
+        lowered = text.lower()
+        hits = [i for i in (lowered.find(t) for t in terms) if i >= 0]
+        if hits:
+            start = max(0, min(hits) - width // 4)
+            window = ' '.join(text[start:start + width].split())
+            return ('...' if start else '') + window + ('...' if start + width < len(text) else '')
+    return ' '.join(texts[0].split())[:width] if texts else ''
+
+
+class _Partition:
+    __slots__ = ('postings', 'vocabulary', 'doc_terms', 'doc_length', 'total_length')
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.vocabulary: List[str] = []
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_length: Dict[str, int] = {}
+        self.total_length = 0
+
+    def add_terms(self, doc_id: str, terms: Counter):
+        doc = self.doc_terms.setdefault(doc_id, Counter())
+        for term, n in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                bisect.insort(self.vocabulary, term)
+            posting[doc_id] = posting.get(doc_id, 0) + n
+            doc[term] += n
+        added = sum(terms.values())
+        self.doc_length[doc_id] = self.doc_length.get(doc_id, 0) + added
+        self.total_length += added
+
+    def remove(self, doc_id: str):
+        doc = self.doc_terms.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc:
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+                i = bisect.bisect_left(self.vocabulary, term)
+                if i < len(self.vocabulary) and self.vocabulary[i] == term:
+                    del self.vocabulary[i]
+        self.total_length -= self.doc_length.pop(doc_id, 0)
+
+    def expand(self, prefix: str) -> List[str]:
+        i = bisect.bisect_left(self.vocabulary, prefix)
+        terms = []
+        while i < len(self.vocabulary) and len(terms) < MAX_EXPANSIONS and self.vocabulary[i].startswith(prefix):
+            terms.append(self.vocabulary[i])
+            i += 1
+        return terms
+
+    def _weights(self, token: str, terms: List[str]) -> List[Tuple[Dict[str, int], float]]:
+        # (posting, idf * prefix weight * (k1 + 1)) per matched term
+        n_docs = len(self.doc_terms)
+        weights = []
+        for term in terms:
+            posting = self.postings[term]
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            weights.append((posting, (1.0 if term == token else PREFIX_WEIGHT) * idf * (BM25_K1 + 1)))
+        return weights
+
+    def score(self, token: str, terms: List[str], candidates: Optional[Dict[str, float]] = None,
+              probe: bool = True) -> Dict[str, float]:
+        """BM25 score per document for one query token over its matched terms (best term wins).
+
+        With ``candidates`` only those documents are scored, and the result
+        is their running totals plus this token's score (an AND). ``probe``
+        looks each candidate up in the postings; otherwise the postings are
+        walked and filtered, which is cheaper for a prefix with many terms.
+        """
+        n_docs = len(self.doc_terms)
+        base = BM25_K1 * (1 - BM25_B)
+        per_length = BM25_K1 * BM25_B * n_docs / (self.total_length or 1)
+        lengths = self.doc_length
+        if candidates is not None and probe:
+            totals = {}
+            weights = self._weights(token, terms)
+            for doc_id, total in candidates.items():
+                best = 0.0
+                for posting, scale in weights:
+                    tf = posting.get(doc_id)
+                    if tf:
+                        s = scale * tf / (tf + base + per_length * lengths[doc_id])
+                        if s > best:
+                            best = s
+                if best:
+                    totals[doc_id] = total + best
+            return totals
+        scores: Dict[str, float] = {}
+        for posting, scale in self._weights(token, terms):
+            keep = posting if candidates is None else candidates
+            if not scores:
+                scores = {d: scale * tf / (tf + base + per_length * lengths[d])
+                          for d, tf in posting.items() if d in keep}
+                continue
+            get = scores.get
+            for d, tf in posting.items():
+                if d in keep:
+                    s = scale * tf / (tf + base + per_length * lengths[d])
+                    if s > get(d, 0.0):
+                        scores[d] = s
+        if candidates is None:
+            return scores
+        return {d: total + scores[d] for d, total in candidates.items() if d in scores}
+
+
+_NOT_INDEXED = object()
+
+
+class SearchIndex:
+    """Not thread-safe on its own; ConversationStore calls it under its lock."""
+
+    def __init__(self):
+        self._partitions: Dict[Optional[str], _Partition] = {}
+        self._owner_of: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._owner_of)
+
+    def built(self, owner: Optional[str]) -> bool:
+        return owner in self._partitions
+
+    def build(self, owner: Optional[str], items: Iterable[dict]):
+        """Index all of one owner's conversations, unless already done."""
+        if owner in self._partitions:
+            return
+        self._partitions[owner] = _Partition()
+        for item in items:
+            self.add(item)
+
+    def add(self, item: dict):
+        """Index (or re-index) a conversation; a no-op until its owner's partition is built."""
+        self.remove(item['id'])
+        owner = item.get('owner')
+        partition = self._partitions.get(owner)
+        if partition is None:
+            return
+        partition.add_terms(item['id'], Counter(t for text in conversation_texts(item) for t in tokenize(text)))
+        self._owner_of[item['id']] = owner
+
+    def extend(self, item: dict, texts: Iterable[str]):
+        """Index text appended to an already indexed conversation (new chat turns)."""
+        if item['id'] not in self._owner_of:
+            self.add(item)
+            return
+        terms = Counter(t for text in texts for t in tokenize(text))
+        self._partitions[self._owner_of[item['id']]].add_terms(item['id'], terms)
+
+    def remove(self, doc_id: str):
+        # Owners may be None (anonymous chats), hence the sentinel
+        owner = self._owner_of.pop(doc_id, _NOT_INDEXED)
+        if owner is not _NOT_INDEXED:
+            self._partitions[owner].remove(doc_id)
+
+    def clear(self):
+        self._partitions.clear()
+        self._owner_of.clear()
+
+    def search(self, owner: Optional[str], query: str, limit: int, offset: int = 0,
+               recency: Optional[Callable[[str], float]] = None) -> Tuple[List[Tuple[str, float]], int, List[str]]:
+        """Rank one owner's conversations against ``query``.
+
+        Returns ([(conv_id, score)], total_matches, matched_terms); ``recency``
+        (conv id -> timestamp) orders equal scores on the page newest first.
+        """
+        partition = self._partitions.get(owner)
+        tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if partition is None or not tokens:
+            return [], 0, []
+        expanded = []
+        for i, token in enumerate(tokens):
+            # Only the last word is still being typed; earlier ones must match whole
+            terms = partition.expand(token) if i == len(tokens) - 1 else [token] if token in partition.postings else []
+            expanded.append((sum(len(partition.postings[t]) for t in terms), token, terms))
+        # Rarest token first: it is scored in full, the others only for documents still in the running
+        expanded.sort(key=itemgetter(0))
+        totals = partition.score(expanded[0][1], expanded[0][2])
+        for postings, token, terms in expanded[1:]:
+            if not totals:
+                break
+            totals = partition.score(token, terms, totals, probe=len(totals) * len(terms) <= postings)
+        if not totals:
+            return [], 0, []
+        top = heapq.nlargest(offset + limit, totals.items(), key=itemgetter(1))[offset:]
+        if recency is not None:
+            top.sort(key=lambda kv: (-kv[1], -recency(kv[0])))
+        matched = [term for _, _, terms in expanded for term in terms]
+        return [(doc_id, round(score, 4)) for doc_id, score in top], len(totals), matched
@@ -0,0 +1,336 @@
+"""Signed session tokens.
+
+Login, signup and Google sign-in hand out a pair of itsdangerous tokens:
+
+* an access token (ACCESS_TOKEN_TTL, default 15 minutes), sent as
+  ``Authorization: Bearer <token>`` to the routes that act on an account;
+* a refresh token (REFRESH_TOKEN_TTL, default 30 days), exchanged at
+  /api/auth/refresh for a new pair. Each refresh token works once.
+
+Checking an access token never touches the password hash or the user
+store. The claims (username, token id, issue and expiry time) are signed
+with HMAC-SHA256 under SESSION_SECRET, and tokens that verified once are
+kept in a bounded cache, so a repeat request costs a dict lookup plus the
+expiry and revocation checks.
+
+Revocation works per refresh family: every login starts one, and each
+token carries its family id and generation. A refresh moves the family to
+the next generation, which retires the old refresh token and the access
+token issued with it; a refresh token used a second time (replayed after
+rotation) is treated as stolen and cuts off the whole account. Logout
+ends the family, and a password change records a per-user cutoff that
+rejects every token issued before it. Only families that have rotated or
+ended have a row, kept until the family's tokens would have expired
+anyway. With SESSION_DB set the rows live in a SQLite file shared by all
+workers; when ``PRAGMA data_version`` shows another connection wrote to
+it, each process reads just the rows changed since it last looked.
+"""
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from itsdangerous import BadData, URLSafeSerializer
+
+log = logging.getLogger(__name__)
+
+ACCESS_TOKEN_TTL = int(os.getenv('ACCESS_TOKEN_TTL', '900'))
+REFRESH_TOKEN_TTL = int(os.getenv('REFRESH_TOKEN_TTL', str(30 * 86400)))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+
+
+class InvalidToken(Exception):
+    """The token is malformed, forged, expired or revoked; callers answer 401."""
+
+
+# Generation of a family that was logged out
+ENDED = -1
+
+
+class Session:
+    __slots__ = ('username', 'jti', 'issued', 'expires', 'family', 'generation')
+
+    def __init__(self, username: str, jti: str, issued: int, expires: int, family: str, generation: int = 0):
+        self.username = username
+        self.jti = jti
+        self.issued = issued          # milliseconds, compared against password-change cutoffs
+        self.expires = expires        # seconds
+        self.family = family          # shared by every pair issued from one login
+        self.generation = generation  # refreshes so far; only the family's current one is valid
+
+
+class MemoryRevocations:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[int, float]] = {}  # family -> (generation, when its tokens expire anyway)
+        self._cutoffs: Dict[str, int] = {}                 # username -> reject tokens issued before (ms)
+        self._writes = 0
+
+    def refresh(self):
+        pass
+
+    def is_revoked(self, session: Session) -> bool:
+        return self.generation(session.family) != session.generation or self.cut_off_before(session)
+
+    def generation(self, family: str) -> int:
+        # Families without a row have never been refreshed
+        entry = self._families.get(family)
+        return entry[0] if entry is not None else 0
+
+    def cut_off_before(self, session: Session) -> bool:
+        return session.issued < self._cutoffs.get(session.username, 0)
+
+    def advance(self, family: str, generation: int, expires: float) -> bool:
+        """Move a family from ``generation`` to the next; False if it was not there (a replayed refresh token)."""
+        with self._lock:
+            if self.generation(family) != generation:
+                return False
+            self._set(family, generation + 1, expires)
+            return True
+
+    def end(self, family: str, expires: float):
+        with self._lock:
+            self._set(family, ENDED, expires)
+
+    def _set(self, family: str, generation: int, expires: float):
+        self._families[family] = (generation, expires)
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self._prune(time.time())
+
+    def cut_off(self, username: str, at_ms: int):
+        with self._lock:
+            self._cutoffs[username] = max(at_ms, self._cutoffs.get(username, 0))
+
+    def _prune(self, now: float):
+        self._families = {f: entry for f, entry in self._families.items() if entry[1] > now}
+        horizon = (now - REFRESH_TOKEN_TTL) * 1000
+        self._cutoffs = {u: at for u, at in self._cutoffs.items() if at > horizon}
+
+    def __len__(self) -> int:
+        return len(self._families) + len(self._cutoffs)
+
+
+class SQLiteRevocations(MemoryRevocations):
+    """Same state in a SQLite file shared by all workers; each process mirrors it in memory.
+
+    Every write gets a new row id (INSERT OR REPLACE), so a process catches up
+    on other workers' writes with ``WHERE id > last_seen`` instead of a reload.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._seen = {'session_families': 0, 'session_cutoffs': 0}
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS session_families (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "family TEXT NOT NULL UNIQUE, generation INTEGER NOT NULL, expires REAL NOT NULL)")
+        if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'revoked_tokens'").fetchone():
+            # Files from before refresh families: per-token rows go, cutoffs gain a row id
+            db.execute("DROP TABLE revoked_tokens")
+            db.execute("ALTER TABLE session_cutoffs RENAME TO session_cutoffs_old")
+        db.execute("CREATE TABLE IF NOT EXISTS session_cutoffs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                   "username TEXT NOT NULL UNIQUE, not_before INTEGER NOT NULL)")
+        if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'session_cutoffs_old'").fetchone():
+            db.execute("INSERT OR IGNORE INTO session_cutoffs (username, not_before) "
+                       "SELECT username, not_before FROM session_cutoffs_old")
+            db.execute("DROP TABLE session_cutoffs_old")
+        self.refresh()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.version = None
+        return conn
+
+    def refresh(self):
+        # data_version only moves when another connection commits, so this is one cheap pragma per request
+        db = self._db()
+        version = db.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._local.version:
+            return
+        with self._lock:
+            rows = db.execute("SELECT id, family, generation, expires FROM session_families WHERE id > ? ORDER BY id",
+                              (self._seen['session_families'],)).fetchall()
+            for row_id, family, generation, expires in rows:
+                self._families[family] = (generation, expires)
+                self._seen['session_families'] = row_id
+            rows = db.execute("SELECT id, username, not_before FROM session_cutoffs WHERE id > ? ORDER BY id",
+                              (self._seen['session_cutoffs'],)).fetchall()
+            for row_id, username, not_before in rows:
+                self._cutoffs[username] = max(not_before, self._cutoffs.get(username, 0))
+                self._seen['session_cutoffs'] = row_id
+        self._local.version = version
+
+    def advance(self, family: str, generation: int, expires: float) -> bool:
+        db = self._db()
+        # The transaction decides which of two concurrent refreshes (in any worker) wins
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute("SELECT generation FROM session_families WHERE family = ?", (family,)).fetchone()
+            if (row[0] if row else 0) != generation:
+                db.execute('COMMIT')
+                return False
+            db.execute("INSERT OR REPLACE INTO session_families (family, generation, expires) VALUES (?, ?, ?)",
+                       (family, generation + 1, expires))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self._set(family, generation + 1, expires)
+        return True
+
+    def end(self, family: str, expires: float):
+        self._db().execute("INSERT OR REPLACE INTO session_families (family, generation, expires) VALUES (?, ?, ?)",
+                           (family, ENDED, expires))
+        super().end(family, expires)
+
+    def _prune(self, now: float):
+        super()._prune(now)
+        # Every process prunes its mirror by the same clock, so deleted rows need no notice
+        db = self._db()
+        db.execute("DELETE FROM session_families WHERE expires <= ?", (now,))
+        db.execute("DELETE FROM session_cutoffs WHERE not_before <= ?", ((now - REFRESH_TOKEN_TTL) * 1000,))
+
+    def cut_off(self, username: str, at_ms: int):
+        self._db().execute("INSERT OR REPLACE INTO session_cutoffs (username, not_before) VALUES "
+                           "(?, MAX(?, COALESCE((SELECT not_before FROM session_cutoffs WHERE username = ?), 0)))",
+                           (username, at_ms, username))
+        super().cut_off(username, at_ms)
+
+
+class SessionTokens:
+    def __init__(self, secret: str, revocations=None, access_ttl: int = ACCESS_TOKEN_TTL,
+                 refresh_ttl: int = REFRESH_TOKEN_TTL, cache_size: int = TOKEN_CACHE_SIZE):
+        signer = {'digest_method': hashlib.sha256}
+        # Different salts, so a refresh token is never accepted as an access token or vice versa
+        self._access = URLSafeSerializer(secret, salt='aizeeno.access', signer_kwargs=signer)
+        self._refresh = URLSafeSerializer(secret, salt='aizeeno.refresh', signer_kwargs=signer)
+        self.revocations = revocations if revocations is not None else MemoryRevocations()
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, Session]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rejected = 0
+
+    def issue(self, username: str, family: Optional[str] = None, generation: int = 0) -> dict:
+        """A fresh access/refresh pair, shaped like an OAuth token response; a new family unless one is given."""
+        now = time.time()
+        issued = int(now * 1000)
+        family = family or secrets.token_urlsafe(9)
+        access_jti, refresh_jti = secrets.token_urlsafe(9), secrets.token_urlsafe(9)
+        access = self._access.dumps({'u': username, 'j': access_jti, 'i': issued, 'e': int(now) + self.access_ttl,
+                                     'f': family, 'g': generation})
+        refresh = self._refresh.dumps({'u': username, 'j': refresh_jti, 'i': issued, 'e': int(now) + self.refresh_ttl,
+                                       'f': family, 'g': generation})
+        return {'access_token': access, 'refresh_token': refresh, 'token_type': 'Bearer',
+                'expires_in': self.access_ttl}
+
+    @staticmethod
+    def _decode(serializer: URLSafeSerializer, token: str) -> Session:
+        try:
+            claims = serializer.loads(token)
+            # Tokens from before families count as a family of their own
+            return Session(claims['u'], claims['j'], claims['i'], claims['e'], claims.get('f', claims['j']),
+                           claims.get('g', 0))
+        except (BadData, KeyError, TypeError):
+            raise InvalidToken('Invalid token')
+
+    def _check(self, session: Session) -> Session:
+        if session.expires <= time.time():
+            self.rejected += 1
+            raise InvalidToken('Token expired')
+        if self.revocations.is_revoked(session):
+            self.rejected += 1
+            raise InvalidToken('Token revoked')
+        return session
+
+    def verify(self, token: str) -> Session:
+        """The session an access token stands for; raises InvalidToken."""
+        self.revocations.refresh()
+        session = self._cache.get(token)
+        if session is not None:
+            self.cache_hits += 1
+            return self._check(session)
+        self.cache_misses += 1
+        try:
+            session = self._decode(self._access, token)
+        except InvalidToken:
+            self.rejected += 1
+            raise
+        self._check(session)
+        # Only verified tokens are cached, so garbage cannot evict real sessions
+        with self._cache_lock:
+            self._cache[token] = session
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return session
+
+    def rotate(self, refresh_token: str) -> Tuple[str, dict]:
+        """Exchange a refresh token for a new pair; returns (username, tokens)."""
+        self.revocations.refresh()
+        try:
+            session = self._decode(self._refresh, refresh_token)
+        except InvalidToken:
+            self.rejected += 1
+            raise
+        # Not _check(): an older generation here means reuse, handled below
+        if session.expires <= time.time() or self.revocations.cut_off_before(session):
+            self.rejected += 1
+            raise InvalidToken('Token expired' if session.expires <= time.time() else 'Token revoked')
+        if self.revocations.generation(session.family) == ENDED:
+            self.rejected += 1
+            raise InvalidToken('Token revoked')
+        # The row lives as long as the refresh token about to be issued
+        if not self.revocations.advance(session.family, session.generation, time.time() + self.refresh_ttl):
+            # Already exchanged once: someone else holds a copy, so end every session of this user
+            self.revoke_all(session.username)
+            self.rejected += 1
+            log.warning('Refresh token reused; revoking all sessions', extra={'username': session.username})
+            raise InvalidToken('Token revoked')
+        return session.username, self.issue(session.username, session.family, session.generation + 1)
+
+    def revoke(self, access_token: Optional[str] = None, refresh_token: Optional[str] = None):
+        """Logout: end the family of whichever of the pair was presented; invalid tokens are ignored."""
+        for serializer, token in ((self._access, access_token), (self._refresh, refresh_token)):
+            if not token:
+                continue
+            try:
+                session = self._decode(serializer, token)
+            except InvalidToken:
+                continue
+            # The family's newest refresh token was issued with this pair, so it expires by then
+            self.revocations.end(session.family, session.issued / 1000 + self.refresh_ttl)
+
+    def revoke_all(self, username: str):
+        """Reject every token issued to this user so far (password change, token theft)."""
+        self.revocations.cut_off(username, int(time.time() * 1000))
+
+    def stats(self) -> dict:
+        return {'cache_hits': self.cache_hits, 'cache_misses': self.cache_misses, 'rejected': self.rejected,
+                'cached': len(self._cache), 'revoked': len(self.revocations)}
+
+
+def open_session_tokens() -> SessionTokens:
+    secret = os.getenv('SESSION_SECRET')
+    if not secret:
+        # Fine for one dev process; tokens die with it and other workers reject them
+        log.warning('SESSION_SECRET not set; using a random per-process secret')
+        secret = secrets.token_hex(32)
+    # SESSION_DB: SQLite file shared by workers; unset keeps revocations in this process
+    path = os.getenv('SESSION_DB')
+    return SessionTokens(secret, SQLiteRevocations(path) if path else MemoryRevocations())
@@ -0,0 +1,227 @@
+"""Coalescing of identical in-flight LLM requests.
+
+When many users send the same prompt at once (the suggested starters on
+the home page, say), only the first request goes upstream; the rest attach
+to it and receive the same answer. A flight carries the answer as a list
+of text deltas, so buffered and streaming callers can share one flight:
+streamers receive deltas as they arrive, buffered callers the joined text.
+
+Keys are the response cache keys, so only requests that would share a
+cache entry are coalesced; once a flight lands its answer is in the cache
+and later requests are served from there.
+"""
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional
+
+
+class Flight:
+    __slots__ = ('tokens', 'done', 'error', 'cond', 'followers')
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+        self.followers = 0
+
+    def push(self, token: str):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def result(self) -> str:
+        with self.cond:
+            while not self.done:
+                self.cond.wait()
+            if self.error is not None:
+                raise self.error
+            return ''.join(self.tokens)
+
+    def iter_tokens(self) -> Iterator[str]:
+        seen = 0
+        while True:
+            with self.cond:
+                while seen >= len(self.tokens) and not self.done:
+                    self.cond.wait()
+                batch = self.tokens[seen:]
+                seen = len(self.tokens)
+                finished, error = self.done, self.error
+            # Yield outside the lock so a slow client never holds up the others
+            yield from batch
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Thread-based coalescing for the sync (Flask) paths."""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.upstream_calls += 1
+            return flight, True
+
+    def _land(self, key: Hashable, flight: Flight, error: Optional[BaseException] = None):
+        flight.finish(error)
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def call(self, key: Hashable, fn: Callable[[], str]) -> str:
+        flight, leader = self._join(key)
+        if not leader:
+            return flight.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, flight, e)
+            raise
+        flight.push(result)
+        self._land(key, flight)
+        return result
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        flight, leader = self._join(key)
+        if leader:
+            # The upstream stream is pumped on its own thread so it keeps feeding
+            # followers (and lands in the cache) even if the first client goes away
+            threading.Thread(target=self._pump, args=(key, flight, fn), name='llm-flight', daemon=True).start()
+        return flight.iter_tokens()
+
+    def _pump(self, key: Hashable, flight: Flight, fn: Callable[[], Iterator[str]]):
+        try:
+            for token in fn():
+                flight.push(token)
+        except BaseException as e:
+            self._land(key, flight, e)
+            return
+        self._land(key, flight)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'upstream_calls': self.upstream_calls, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
+
+
+class AsyncFlight:
+    __slots__ = ('tokens', 'done', 'error', 'changed')
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def _notify(self):
+        # Wake current readers; each waits on a fresh event for the next change
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+    def push(self, token: str):
+        self.tokens.append(token)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def iter_tokens(self) -> AsyncIterator[str]:
+        seen = 0
+        while True:
+            if seen >= len(self.tokens) and not self.done:
+                await self.changed.wait()
+                continue
+            batch = self.tokens[seen:]
+            seen = len(self.tokens)
+            for token in batch:
+                yield token
+            if self.done and seen >= len(self.tokens):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AsyncSingleFlight:
+    """Event-loop coalescing for the ASGI paths; flights run as tasks so a disconnecting
+    client cancels only its own wait, never the shared upstream call."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, AsyncFlight] = {}
+        # The loop only keeps weak references to tasks
+        self._pumps = set()
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    async def call(self, key: Hashable, fn: Callable[[], Awaitable[str]]) -> str:
+        task = self._calls.get(key)
+        if task is None:
+            flight = self._streams.get(key)
+            if flight is not None:
+                # A stream for the same prompt is already running; wait for its full text
+                self.coalesced += 1
+                return ''.join([token async for token in flight.iter_tokens()])
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._calls.pop(key, None) if self._calls.get(key) is t else None)
+            self.upstream_calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._streams.get(key)
+        if flight is None:
+            task = self._calls.get(key)
+            if task is not None:
+                # A buffered call is already running; stream its answer in one piece
+                self.coalesced += 1
+                return self._from_task(task)
+            flight = self._streams[key] = AsyncFlight()
+            self.upstream_calls += 1
+            pump = asyncio.ensure_future(self._pump(key, flight, fn))
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+        else:
+            self.coalesced += 1
+        return flight.iter_tokens()
+
+    @staticmethod
+    async def _from_task(task: asyncio.Future) -> AsyncIterator[str]:
+        yield await asyncio.shield(task)
+
+    async def _pump(self, key: Hashable, flight: AsyncFlight, fn: Callable[[], AsyncIterator[str]]):
+        error = None
+        try:
+            async for token in fn():
+                flight.push(token)
+        except BaseException as e:
+            error = e
+        if self._streams.get(key) is flight:
+            del self._streams[key]
+        flight.finish(error)
+        if isinstance(error, asyncio.CancelledError):
+            raise error
+
+    def stats(self) -> dict:
+        return {'upstream_calls': self.upstream_calls, 'coalesced': self.coalesced,
+                'in_flight': len(self._calls) + len(self._streams)}
@@ -0,0 +1,137 @@
+"""Startup checks that run off the import path.
+
+Validating the Stripe price ids costs one API round trip per plan, which
+every worker boot, reload and script import used to pay serially before
+serving anything. The checks now run concurrently on a background thread
+with an overall timeout, and validated price metadata is cached on disk
+(PRICE_CACHE_FILE, default data/stripe_prices.json) for PRICE_CACHE_TTL
+seconds so most boots make no Stripe calls at all.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PRICE_CACHE_FILE = os.getenv('PRICE_CACHE_FILE', os.path.join(BASE_DIR, 'data', 'stripe_prices.json'))
+PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', '86400'))
+STARTUP_TIMEOUT = float(os.getenv('STARTUP_TIMEOUT', '10'))
+
+
+def key_mode(secret_key: Optional[str]) -> str:
+    return 'live' if (secret_key or '').startswith(('sk_live', 'rk_live')) else 'test'
+
+
+class PriceCache:
+    """Price metadata by price id, stored as JSON with a fetch time per entry."""
+
+    def __init__(self, path: Optional[str] = PRICE_CACHE_FILE, ttl: float = PRICE_CACHE_TTL, mode: str = 'test'):
+        self.path = path
+        self.ttl = ttl
+        # Test and live mode have different price ids; never mix their entries
+        self.mode = mode
+
+    def load(self) -> Dict[str, dict]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        entries = data.get(self.mode) or {}
+        return {pid: e for pid, e in entries.items() if now - e.get('fetched_at', 0) < self.ttl}
+
+    def save(self, entries: Dict[str, dict]):
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault(self.mode, {}).update(entries)
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+def price_metadata(price) -> dict:
+    return {
+        'active': price.get('active'),
+        'product': price.get('product') if isinstance(price.get('product'), str) else (price.get('product') or {}).get('id'),
+        'currency': price.get('currency'),
+        'unit_amount': price.get('unit_amount'),
+        'interval': (price.get('recurring') or {}).get('interval'),
+        'fetched_at': time.time(),
+    }
+
+
+def validate_price_ids(prices: Dict[str, str], retrieve: Callable[[str], dict], cache: PriceCache,
+                       max_workers: int = 4) -> Dict[str, dict]:
+    """Metadata for each plan's price, from the cache or fetched concurrently; errors are reported per plan."""
+    known = cache.load()
+    missing = [pid for pid in prices.values() if pid not in known]
+    fetched, errors = {}, {}
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+            futures = {pid: pool.submit(retrieve, pid) for pid in missing}
+        for pid, future in futures.items():
+            try:
+                fetched[pid] = price_metadata(future.result())
+            except Exception as e:
+                errors[pid] = {'error': str(e)}
+        if fetched:
+            cache.save(fetched)
+    known.update(fetched)
+    return {name: dict(known.get(pid) or errors[pid], price_id=pid, cached=pid not in fetched and pid in known)
+            for name, pid in prices.items()}
+
+
+class StartupChecks:
+    """Named checks run concurrently on a daemon thread; results are kept for status/health output."""
+
+    def __init__(self, timeout: float = STARTUP_TIMEOUT):
+        self.timeout = timeout
+        self._checks: Dict[str, Callable] = {}
+        self.results: Dict[str, dict] = {}
+        self.done = threading.Event()
+        self.elapsed: Optional[float] = None
+
+    def add(self, name: str, fn: Callable):
+        self._checks[name] = fn
+
+    def _run(self):
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=max(1, len(self._checks)), thread_name_prefix='startup')
+        futures = {pool.submit(fn): name for name, fn in self._checks.items()}
+        finished, _ = wait(futures, timeout=self.timeout)
+        for future, name in futures.items():
+            if future not in finished:
+                self.results[name] = {'status': 'timeout'}
+            elif future.exception() is not None:
+                self.results[name] = {'status': 'error', 'error': str(future.exception())}
+            else:
+                self.results[name] = {'status': 'ok', 'result': future.result()}
+        # Don't wait on checks that timed out; their threads finish on their own
+        pool.shutdown(wait=False)
+        self.elapsed = time.perf_counter() - start
+        self.done.set()
+
+    def start(self) -> 'StartupChecks':
+        threading.Thread(target=self._run, name='startup-checks', daemon=True).start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+    def status(self) -> dict:
+        return {'done': self.done.is_set(), 'elapsed': self.elapsed, 'checks': dict(self.results)}
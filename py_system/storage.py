@@ -0,0 +1,396 @@
+"""Pluggable persistence for users and conversations.
+
+The in-memory repositories stay the read path; a backend receives every
+write so state survives restarts:
+
+* ``sqlite`` - WAL-mode SQLite with parameterized statements; safe to share
+  between gunicorn workers. Single-field updates touch one row. Each write
+  also appends to a change log, and ``sync()`` replays other processes'
+  entries into the repositories, so every worker sees one view.
+* ``jsonl``  - append-only JSON-lines log replayed at startup and compacted
+  into a snapshot once it grows well past the live record count. Meant for
+  single-process deployments; use sqlite when running several workers.
+  A torn final line (crash mid-append) is cut off; a corrupt line anywhere
+  else is logged, moved to ``<path>.corrupt`` and dropped from the log.
+* ``memory`` - no persistence (the previous behaviour).
+
+Select one with ``STORAGE_BACKEND`` and ``STORAGE_PATH``.
+"""
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends still work, cross-process locking does not
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCHEMA_FILE = os.path.join(BASE_DIR, 'data', 'database.sql')
+
+USER_COLUMNS = ('username', 'password', 'salt', 'iterations', 'name', 'email', 'subscription', 'payment',
+                'stripe_customer_id', 'stripe_subscription_id')
+# Change log entries kept for workers that fall behind; one further back reloads everything
+CHANGE_LOG_KEEP = int(os.getenv('STORAGE_CHANGE_LOG_KEEP', '10000'))
+
+
+class StorageBackend:
+    name = 'memory'
+    # True when other processes may write to the same store
+    shared = False
+
+    def __init__(self):
+        # kind -> callback(keys); keys is None when everything must be reloaded
+        self._subscribers: Dict[str, Callable[[Optional[List[str]]], None]] = {}
+
+    def subscribe(self, kind: str, refresh: Callable[[Optional[List[str]]], None]):
+        """Register a repository to be told which of its records ('user', 'conversation') other processes changed."""
+        self._subscribers[kind] = refresh
+
+    def sync(self):
+        """Apply other processes' writes to the subscribed repositories; a no-op for unshared stores."""
+
+    def load_users(self) -> Iterator[dict]:
+        return iter(())
+
+    def load_user(self, username: str) -> Optional[dict]:
+        return None
+
+    def load_conversation(self, conv_id: str) -> Optional[dict]:
+        return None
+
+    def insert_user(self, user: dict) -> bool:
+        return True
+
+    def update_user(self, username: str, fields: dict):
+        pass
+
+    def load_conversations(self) -> Iterator[dict]:
+        return iter(())
+
+    def save_conversation(self, item: dict):
+        pass
+
+    def save_conversations(self, items: List[dict]):
+        """Save several conversations at once; backends override this to commit them together."""
+        for item in items:
+            self.save_conversation(item)
+
+    def close(self):
+        pass
+
+
+MemoryBackend = StorageBackend
+
+
+class SQLiteBackend(StorageBackend):
+    name = 'sqlite'
+    shared = True
+
+    def __init__(self, path: str, synchronous: str = 'NORMAL', change_log_keep: int = CHANGE_LOG_KEEP):
+        super().__init__()
+        self.path = path
+        self.synchronous = synchronous
+        self.change_log_keep = change_log_keep
+        self._local = threading.local()
+        # Identifies this process's change log entries, which it never needs to replay
+        self.origin = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._sync_lock = threading.Lock()
+        self._writes = 0
+        with open(SCHEMA_FILE, encoding='utf-8') as f:
+            self._conn().executescript(f.read())
+        self._migrate()
+        # Repositories load everything after this point, so only later changes need replaying
+        self._seq = self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _migrate(self):
+        # Databases created by older releases lack columns added to the schema since
+        existing = {row[1] for row in self._conn().execute("PRAGMA table_info(users)")}
+        for column, decl in (('iterations', 'INTEGER'),):
+            if column not in existing:
+                self._conn().execute(f"ALTER TABLE users ADD COLUMN {column} {decl}")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 caches the prepared statements per connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql: str, params: list, kind: str, key: str):
+        self._write_many(sql, [params], kind, [key])
+
+    def _write_many(self, sql: str, rows: List[list], kind: str, keys: List[str]):
+        # The rows and their change log entries commit together, in one transaction
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(sql, rows)
+            conn.executemany("INSERT INTO changes (kind, key, origin) VALUES (?, ?, ?)",
+                             [(kind, key, self.origin) for key in keys])
+            before, self._writes = self._writes, self._writes + len(rows)
+            if before // 1000 != self._writes // 1000:
+                conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+                             (self.change_log_keep,))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _foreign_commit(self, conn: sqlite3.Connection) -> bool:
+        # data_version moves only when another connection commits, and reading it costs no I/O
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        seen = getattr(self._local, 'data_version', None)
+        self._local.data_version = version
+        return version != seen
+
+    def sync(self):
+        conn = self._conn()
+        if not self._subscribers or not self._foreign_commit(conn):
+            return
+        with self._sync_lock:
+            rows = conn.execute("SELECT seq, kind, key, origin FROM changes WHERE seq > ? ORDER BY seq",
+                                (self._seq,)).fetchall()
+            if not rows:
+                return
+            oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            trimmed = oldest > self._seq + 1
+            self._seq = rows[-1][0]
+            changed: Dict[str, List[str]] = {}
+            for _, kind, key, origin in rows:
+                if origin != self.origin:
+                    changed.setdefault(kind, []).append(key)
+            for kind, refresh in self._subscribers.items():
+                if trimmed:
+                    # Entries this worker never saw were trimmed; rebuild from the tables
+                    refresh(None)
+                elif kind in changed:
+                    refresh(list(dict.fromkeys(changed[kind])))
+
+    def _user_row(self, row) -> dict:
+        user = dict(zip(USER_COLUMNS, row))
+        user['payment'] = bool(user['payment'])
+        return user
+
+    def load_users(self) -> Iterator[dict]:
+        cur = self._conn().execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users ORDER BY rowid")
+        for row in cur:
+            yield self._user_row(row)
+
+    def load_user(self, username: str) -> Optional[dict]:
+        row = self._conn().execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = ?",
+                                   (username,)).fetchone()
+        return self._user_row(row) if row else None
+
+    def insert_user(self, user: dict) -> bool:
+        values = [user.get(c) for c in USER_COLUMNS]
+        try:
+            self._write(
+                f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})",
+                values, 'user', user['username'])
+        except sqlite3.IntegrityError:
+            # Username already taken, possibly by another worker
+            return False
+        return True
+
+    def update_user(self, username: str, fields: dict):
+        cols = [c for c in USER_COLUMNS if c in fields and c != 'username']
+        if not cols:
+            return
+        # Column order is fixed by USER_COLUMNS so each column set maps to one cached statement
+        sql = f"UPDATE users SET {', '.join(c + ' = ?' for c in cols)} WHERE username = ?"
+        self._write(sql, [fields[c] for c in cols] + [username], 'user', username)
+
+    def load_conversations(self) -> Iterator[dict]:
+        for (data,) in self._conn().execute("SELECT data FROM conversations ORDER BY ts, rowid"):
+            yield json.loads(data)
+
+    def load_conversation(self, conv_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT data FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_conversation(self, item: dict):
+        self.save_conversations([item])
+
+    def save_conversations(self, items: List[dict]):
+        self._write_many("INSERT OR REPLACE INTO conversations (id, ts, data) VALUES (?, ?, ?)",
+                         [[item['id'], item.get('ts', 0), json.dumps(item)] for item in items],
+                         'conversation', [item['id'] for item in items])
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class JsonlBackend(StorageBackend):
+    name = 'jsonl'
+
+    def __init__(self, path: str, fsync: bool = True, compact_ratio: float = 2.0, compact_min: int = 1000):
+        super().__init__()
+        self.path = path
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self._lock = threading.Lock()
+        self._users = {}
+        self._conversations = {}
+        self._log_lines = 0
+        self._replay()
+        self._fh = open(self.path, 'a', encoding='utf-8')
+        self._maybe_compact()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        good, corrupt = 0, {}
+        with open(self.path, 'rb') as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.endswith(b'\n'):
+                    # Only the last line can lack its newline: a torn append from a crash.
+                    # Everything before it is intact, so it is cut off below
+                    break
+                good += len(line)
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # Complete lines were fully written, so this is damage rather than a crash;
+                    # keep the rest of the log and set the line aside for inspection
+                    log.error('Skipping corrupt line %d of %s', lineno, self.path)
+                    corrupt[lineno] = line
+                    continue
+                self._apply(rec)
+                self._log_lines += 1
+        if corrupt:
+            self._quarantine(corrupt, good)
+        elif good != os.path.getsize(self.path):
+            log.warning('Truncating torn final line of %s', self.path)
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def _quarantine(self, corrupt: Dict[int, bytes], good: int):
+        # Copy the lines out, then rewrite the log without them (and without any torn tail)
+        # so the next replay neither reports nor copies them again
+        with open(self.path + '.corrupt', 'ab') as out:
+            out.writelines(corrupt.values())
+            out.flush()
+            os.fsync(out.fileno())
+        tmp = self.path + '.quarantine'
+        with open(self.path, 'rb') as f, open(tmp, 'wb') as out:
+            read = 0
+            for lineno, line in enumerate(f, 1):
+                read += len(line)
+                if read > good:
+                    break
+                if lineno not in corrupt:
+                    out.write(line)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+        log.warning('Moved %d corrupt line(s) of %s to %s.corrupt', len(corrupt), self.path, self.path)
+
+    def _apply(self, rec: dict):
+        op = rec.get('op')
+        if op == 'user':
+            self._users[rec['v']['username']] = rec['v']
+        elif op == 'user_update':
+            user = self._users.get(rec['k'])
+            if user is not None:
+                user.update(rec['v'])
+        elif op == 'conv':
+            self._conversations[rec['v']['id']] = rec['v']
+
+    def _append(self, rec: dict):
+        self._append_many([rec])
+
+    def _append_many(self, recs: List[dict]):
+        # One write and one fsync for the whole group
+        lines = ''.join(json.dumps(rec, separators=(',', ':')) + '\n' for rec in recs)
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._fh, fcntl.LOCK_EX)
+            try:
+                self._fh.write(lines)
+                self._fh.flush()
+                if self.fsync:
+                    os.fsync(self._fh.fileno())
+            finally:
+                if fcntl:
+                    fcntl.flock(self._fh, fcntl.LOCK_UN)
+            for rec in recs:
+                self._apply(rec)
+            self._log_lines += len(recs)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        live = len(self._users) + len(self._conversations)
+        if self._log_lines > max(self.compact_min, live * self.compact_ratio):
+            self.compact()
+
+    def compact(self):
+        # Rewrite the log as one record per live object, then atomically swap it in
+        tmp = self.path + '.compact'
+        with self._lock:
+            with open(tmp, 'w', encoding='utf-8') as out:
+                for user in self._users.values():
+                    out.write(json.dumps({'op': 'user', 'v': user}, separators=(',', ':')) + '\n')
+                for conv in self._conversations.values():
+                    out.write(json.dumps({'op': 'conv', 'v': conv}, separators=(',', ':')) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, self.path)
+            self._fh.close()
+            self._fh = open(self.path, 'a', encoding='utf-8')
+            self._log_lines = len(self._users) + len(self._conversations)
+
+    def load_users(self) -> Iterator[dict]:
+        return iter([dict(u) for u in self._users.values()])
+
+    def insert_user(self, user: dict) -> bool:
+        if user['username'] in self._users:
+            return False
+        self._append({'op': 'user', 'v': {c: user.get(c) for c in USER_COLUMNS}})
+        return True
+
+    def update_user(self, username: str, fields: dict):
+        fields = {c: fields[c] for c in USER_COLUMNS if c in fields and c != 'username'}
+        if fields:
+            self._append({'op': 'user_update', 'k': username, 'v': fields})
+
+    def load_conversations(self) -> Iterator[dict]:
+        return iter(sorted(self._conversations.values(), key=lambda c: c.get('ts', 0)))
+
+    def save_conversation(self, item: dict):
+        self._append({'op': 'conv', 'v': item})
+
+    def save_conversations(self, items: List[dict]):
+        self._append_many([{'op': 'conv', 'v': item} for item in items])
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+def open_backend(kind: Optional[str] = None, path: Optional[str] = None) -> StorageBackend:
+    kind = (kind or os.getenv('STORAGE_BACKEND', 'sqlite')).lower()
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'sqlite':
+        return SQLiteBackend(path or os.getenv('STORAGE_PATH') or os.path.join(BASE_DIR, 'data', 'aizeeno.db'),
+                             synchronous=os.getenv('STORAGE_SYNCHRONOUS', 'NORMAL'))
+    if kind == 'jsonl':
+        return JsonlBackend(path or os.getenv('STORAGE_PATH') or os.path.join(BASE_DIR, 'data', 'aizeeno.jsonl'),
+                            fsync=os.getenv('STORAGE_FSYNC', '1') != '0')
+    raise ValueError(f"Unknown STORAGE_BACKEND '{kind}' (use sqlite, jsonl or memory)")
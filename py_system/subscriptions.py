@@ -0,0 +1,311 @@
+"""Local mirror of Stripe checkout sessions and subscriptions.
+
+After checkout the frontend polls /api/payment-status until the payment is
+confirmed, and every poll used to cost two serial Stripe calls. Webhook
+events now write the latest known state of each session and subscription
+here, and anything fetched from Stripe is kept for a short TTL. Repeat
+polls are answered locally; Stripe is only asked about a session that no
+webhook has reported yet, and one expanded retrieve replaces the two calls.
+
+Webhook-fed state is bounded too (STRIPE_MIRROR_SIZE entries per kind,
+each kept STRIPE_MIRROR_TTL seconds). An entry that has aged out is simply
+fetched again. A webhook reaches only one worker, so with STRIPE_MIRROR_DB
+set that state lives in a SQLite file every worker reads; unset, it stays
+in this process. Fetched copies are always per process, they only last
+seconds.
+
+``stripe_client`` is anything exposing ``checkout.Session.retrieve`` and
+``Subscription.retrieve`` (the stripe module in production, a stub in
+scripts). Stripe objects are dict subclasses, so plain dicts work as well.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from cachetools import TTLCache
+
+from metrics import time_stripe
+
+# Seconds a fetched Stripe object is reused; unpaid sessions are re-checked sooner
+STRIPE_CACHE_TTL = float(os.getenv('STRIPE_CACHE_TTL', '30'))
+STRIPE_PENDING_TTL = float(os.getenv('STRIPE_PENDING_TTL', '3'))
+# Webhook-fed sessions and subscriptions: how many are kept, and for how long
+STRIPE_MIRROR_SIZE = int(os.getenv('STRIPE_MIRROR_SIZE', '50000'))
+STRIPE_MIRROR_TTL = float(os.getenv('STRIPE_MIRROR_TTL', str(86400)))
+# How often the SQLite store drops aged-out entries
+MIRROR_PRUNE_INTERVAL = 300.0
+
+
+def _id(value) -> Optional[str]:
+    # Expandable fields hold either an id or the expanded object
+    if isinstance(value, dict):
+        return value.get('id')
+    return value
+
+
+def session_state(session: dict) -> dict:
+    subscription = session.get('subscription')
+    state = {
+        'id': session.get('id'),
+        'payment_status': session.get('payment_status'),
+        'customer': _id(session.get('customer')),
+        'subscription': _id(subscription),
+        # Who started the checkout, as recorded when the session was created
+        'username': (session.get('metadata') or {}).get('username') or session.get('client_reference_id'),
+    }
+    if isinstance(subscription, dict):
+        state['subscription_state'] = subscription_state(subscription)
+    return state
+
+
+def subscription_state(subscription: dict) -> dict:
+    items = (subscription.get('items') or {}).get('data') or []
+    period_end = subscription.get('current_period_end')
+    if period_end is None and items:
+        # Recent API versions report the billing period per item
+        period_end = items[0].get('current_period_end')
+    return {
+        'id': subscription.get('id'),
+        'status': subscription.get('status'),
+        'customer': _id(subscription.get('customer')),
+        'price': (items[0].get('price') or {}).get('id') if items else None,
+        'current_period_end': period_end,
+        'cancel_at_period_end': subscription.get('cancel_at_period_end'),
+    }
+
+
+class MemoryMirrorStore:
+    """Webhook-fed sessions and subscriptions, in this process."""
+
+    def __init__(self, size: int = STRIPE_MIRROR_SIZE, ttl: float = STRIPE_MIRROR_TTL):
+        self._lock = threading.Lock()
+        self._states = {kind: TTLCache(maxsize=size, ttl=ttl) for kind in ('session', 'subscription')}
+        self._event_times = TTLCache(maxsize=size, ttl=ttl)
+
+    def get(self, kind: str, object_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._states[kind].get(object_id)
+
+    def put(self, kind: str, object_id: str, state: dict, event_created: Optional[float] = None) -> bool:
+        """Store a snapshot; False (and nothing stored) if a newer event already wrote this object."""
+        with self._lock:
+            if event_created is not None:
+                if event_created < self._event_times.get(object_id, 0):
+                    return False
+                self._event_times[object_id] = event_created
+            self._states[kind][object_id] = state
+            return True
+
+    def update(self, kind: str, object_id: str, change: Callable[[dict], Optional[dict]]):
+        # change() gets the stored state and returns its replacement, or None to leave it
+        with self._lock:
+            state = self._states[kind].get(object_id)
+            new = change(state) if state is not None else None
+            if new is not None:
+                self._states[kind][object_id] = new
+
+    def count(self, kind: str) -> int:
+        with self._lock:
+            return len(self._states[kind])
+
+
+class SQLiteMirrorStore:
+    """Same entries in a SQLite file shared by all workers; writes run in IMMEDIATE transactions."""
+
+    def __init__(self, path: str, size: int = STRIPE_MIRROR_SIZE, ttl: float = STRIPE_MIRROR_TTL,
+                 prune_interval: float = MIRROR_PRUNE_INTERVAL):
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+        self._local = threading.local()
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS stripe_mirror (kind TEXT NOT NULL, id TEXT NOT NULL, state TEXT NOT NULL, "
+                   "event_created REAL, updated REAL NOT NULL, PRIMARY KEY (kind, id))")
+        db.execute("CREATE INDEX IF NOT EXISTS stripe_mirror_updated ON stripe_mirror (kind, updated)")
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _row(self, db, kind: str, object_id: str):
+        # Aged-out rows read as missing until the next prune deletes them
+        return db.execute("SELECT state, event_created FROM stripe_mirror WHERE kind = ? AND id = ? AND updated > ?",
+                          (kind, object_id, time.time() - self.ttl)).fetchone()
+
+    def get(self, kind: str, object_id: str) -> Optional[dict]:
+        row = self._row(self._db(), kind, object_id)
+        return json.loads(row[0]) if row else None
+
+    def _write(self, kind: str, object_id: str, decide: Callable) -> bool:
+        now = time.time()
+        if now >= self._next_prune:
+            self._prune(now)
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._row(db, kind, object_id)
+            write = decide(row)
+            if write is not None:
+                state, event_created = write
+                db.execute("INSERT INTO stripe_mirror (kind, id, state, event_created, updated) VALUES (?, ?, ?, ?, ?) "
+                           "ON CONFLICT (kind, id) DO UPDATE SET state = excluded.state, updated = excluded.updated, "
+                           "event_created = COALESCE(excluded.event_created, event_created)",
+                           (kind, object_id, json.dumps(state), event_created, now))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return write is not None
+
+    def put(self, kind: str, object_id: str, state: dict, event_created: Optional[float] = None) -> bool:
+        def decide(row):
+            # Stripe does not guarantee delivery order, and two workers may handle events for one object
+            if event_created is not None and row and row[1] is not None and event_created < row[1]:
+                return None
+            return state, event_created
+        return self._write(kind, object_id, decide)
+
+    def update(self, kind: str, object_id: str, change: Callable[[dict], Optional[dict]]):
+        def decide(row):
+            new = change(json.loads(row[0])) if row else None
+            return (new, None) if new is not None else None
+        self._write(kind, object_id, decide)
+
+    def _prune(self, now: float):
+        self._next_prune = now + self.prune_interval
+        db = self._db()
+        db.execute("DELETE FROM stripe_mirror WHERE updated <= ?", (now - self.ttl,))
+        for kind in ('session', 'subscription'):
+            # Past STRIPE_MIRROR_SIZE the least recently written go first, as in the TTLCache
+            db.execute("DELETE FROM stripe_mirror WHERE kind = ? AND updated < (SELECT updated FROM stripe_mirror "
+                       "WHERE kind = ? ORDER BY updated DESC LIMIT 1 OFFSET ?)", (kind, kind, self.size - 1))
+
+    def count(self, kind: str) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM stripe_mirror WHERE kind = ? AND updated > ?",
+                                  (kind, time.time() - self.ttl)).fetchone()[0]
+
+
+class SubscriptionMirror:
+    def __init__(self, stripe_client=None, ttl: float = STRIPE_CACHE_TTL, pending_ttl: float = STRIPE_PENDING_TTL,
+                 maxsize: int = 4096, store=None):
+        self.stripe = stripe_client
+        self._lock = threading.Lock()
+        # Webhook-fed state; preferred over fetched copies while it lasts
+        self._store = store if store is not None else MemoryMirrorStore()
+        # Short-lived copies of objects fetched from Stripe
+        self._fetched = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._pending = TTLCache(maxsize=maxsize, ttl=pending_ttl)
+        self._fetch_locks = {}  # key -> [lock, callers using it]
+        self.stripe_calls = 0
+        self.local_hits = 0
+
+    # ---- fed by webhooks ----
+
+    def record_session(self, session: dict):
+        state = session_state(session)
+        self._store.put('session', state['id'], state)
+        if 'subscription_state' in state:
+            self._store.put('subscription', state['subscription'], state['subscription_state'])
+        with self._lock:
+            self._pending.pop(('session', state['id']), None)
+
+    def record_subscription(self, subscription: dict, event_created: Optional[float] = None) -> bool:
+        """Store a subscription snapshot; returns False if a newer event already did."""
+        state = subscription_state(subscription)
+        # Stripe does not guarantee delivery order
+        if not self._store.put('subscription', state['id'], state, event_created):
+            return False
+        with self._lock:
+            self._fetched.pop(('subscription', state['id']), None)
+        return True
+
+    def record_invoice_paid(self, subscription_id: Optional[str]):
+        if subscription_id:
+            self._store.update('subscription', subscription_id, lambda state: dict(state, status='active')
+                               if state.get('status') not in ('active', 'trialing') else None)
+
+    # ---- reads ----
+
+    def _cached(self, key) -> Optional[dict]:
+        state = self._store.get(*key)
+        with self._lock:
+            if state is None:
+                state = self._fetched.get(key) or self._pending.get(key)
+            if state is not None:
+                self.local_hits += 1
+            return state
+
+    def _fetch(self, key, retrieve) -> dict:
+        # Concurrent polls for the same object share one Stripe call
+        with self._lock:
+            entry = self._fetch_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+            fetch_lock = entry[0]
+        try:
+            with fetch_lock:
+                state = self._cached(key)
+                if state is not None:
+                    return state
+                state = retrieve()
+                with self._lock:
+                    self.stripe_calls += 1
+                    if key[0] == 'session' and state.get('payment_status') != 'paid':
+                        self._pending[key] = state
+                    else:
+                        self._fetched[key] = state
+                        if 'subscription_state' in state:
+                            self._fetched[('subscription', state['subscription'])] = state['subscription_state']
+                return state
+        finally:
+            # Dropped only by the last caller, so a waiter never ends up on a lock nobody else shares
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._fetch_locks[key]
+
+    def session(self, session_id: str) -> dict:
+        key = ('session', session_id)
+        return self._cached(key) or self._fetch(key, lambda: session_state(self._retrieve_session(session_id)))
+
+    def _retrieve_session(self, session_id: str):
+        with time_stripe('checkout.Session.retrieve'):
+            return self.stripe.checkout.Session.retrieve(session_id, expand=['subscription'])
+
+    def _retrieve_subscription(self, subscription_id: str):
+        with time_stripe('Subscription.retrieve'):
+            return self.stripe.Subscription.retrieve(subscription_id)
+
+    def subscription(self, subscription_id: Optional[str], fetch: bool = True) -> Optional[dict]:
+        if not subscription_id:
+            return None
+        key = ('subscription', subscription_id)
+        state = self._cached(key)
+        if state is not None or not fetch:
+            return state
+        return self._fetch(key, lambda: subscription_state(self._retrieve_subscription(subscription_id)))
+
+    def stats(self) -> dict:
+        counts = {'sessions': self._store.count('session'), 'subscriptions': self._store.count('subscription')}
+        with self._lock:
+            return {
+                'stripe_calls': self.stripe_calls,
+                'local_hits': self.local_hits,
+                **counts,
+                'cached': len(self._fetched) + len(self._pending),
+            }
+
+
+def open_subscription_mirror(stripe_client=None) -> SubscriptionMirror:
+    # STRIPE_MIRROR_DB: SQLite file shared by workers; unset keeps webhook-fed state in this process
+    path = os.getenv('STRIPE_MIRROR_DB')
+    return SubscriptionMirror(stripe_client, store=SQLiteMirrorStore(path) if path else None)
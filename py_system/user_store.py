@@ -0,0 +1,170 @@
+"""In-memory user repository with hash indexes.
+
+Lookups by username, email and Stripe customer id are O(1) dict hits, so
+login, signup, Google sign-in and webhook handling cost the same with a
+thousand users or a million. Writes go through to a storage backend
+(see storage.py) so the repository can be rebuilt after a restart. With a
+shared backend, reads first pick up users other workers added or changed.
+"""
+import threading
+from typing import Iterator, List, Optional
+
+from storage import MemoryBackend, StorageBackend
+
+# Fields callers may change through UserRepository.update
+UPDATABLE_FIELDS = ('name', 'email', 'subscription', 'payment', 'stripe_customer_id', 'stripe_subscription_id')
+# The subset a user may change about themselves; billing fields are only set from Stripe
+PROFILE_FIELDS = ('name', 'email')
+
+
+class UserRecord:
+    __slots__ = ('username', 'password', 'salt', 'iterations', 'name', 'email', 'subscription', 'payment',
+                 'stripe_customer_id', 'stripe_subscription_id')
+
+    def __init__(self, username: str, password: str, salt: Optional[str], name: str = '', email: str = '',
+                 subscription: str = 'free', payment: bool = False, stripe_customer_id: Optional[str] = None,
+                 stripe_subscription_id: Optional[str] = None, iterations: Optional[int] = None):
+        self.username = username
+        self.password = password
+        self.salt = salt
+        # PBKDF2 iteration count; None for records written before it was stored
+        self.iterations = iterations
+        self.name = name
+        self.email = email or ''
+        self.subscription = subscription or 'free'
+        self.payment = bool(payment)
+        self.stripe_customer_id = stripe_customer_id
+        self.stripe_subscription_id = stripe_subscription_id
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'UserRecord':
+        return cls(**{k: d.get(k) for k in cls.__slots__ if k in d})
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def public(self) -> dict:
+        # Shape returned to the frontend after login/sign-in
+        return {"username": self.username, "name": self.name, "email": self.email}
+
+    def __repr__(self):
+        return f"UserRecord(username={self.username!r}, email={self.email!r})"
+
+
+def _email_key(email: Optional[str]) -> Optional[str]:
+    return email.strip().casefold() if email else None
+
+
+class UserRepository:
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self._lock = threading.RLock()
+        self._by_username = {}
+        self._by_email = {}
+        self._by_customer = {}
+        self.backend = backend if backend is not None else MemoryBackend()
+        self._load_all()
+        self.backend.subscribe('user', self._refresh)
+
+    def _load_all(self):
+        self._by_username.clear()
+        self._by_email.clear()
+        self._by_customer.clear()
+        for d in self.backend.load_users():
+            user = UserRecord.from_dict(d)
+            self._by_username[user.username] = user
+            self._index(user)
+
+    def _refresh(self, usernames: Optional[List[str]]):
+        # Called by backend.sync() with the users another worker wrote; None means reload everything
+        with self._lock:
+            if usernames is None:
+                self._load_all()
+                return
+            for username in usernames:
+                d = self.backend.load_user(username)
+                if d is None:
+                    continue
+                user = self._by_username.get(username)
+                if user is None:
+                    user = self._by_username[username] = UserRecord.from_dict(d)
+                else:
+                    self._unindex(user)
+                    for field in UserRecord.__slots__:
+                        if field in d:
+                            setattr(user, field, d[field])
+                self._index(user)
+
+    def __len__(self) -> int:
+        self.backend.sync()
+        return len(self._by_username)
+
+    def __iter__(self) -> Iterator[UserRecord]:
+        self.backend.sync()
+        return iter(list(self._by_username.values()))
+
+    def get(self, username: str) -> Optional[UserRecord]:
+        self.backend.sync()
+        return self._by_username.get(username)
+
+    def get_by_email(self, email: str) -> Optional[UserRecord]:
+        self.backend.sync()
+        key = _email_key(email)
+        return self._by_email.get(key) if key else None
+
+    def get_by_customer(self, customer_id: str) -> Optional[UserRecord]:
+        self.backend.sync()
+        return self._by_customer.get(customer_id) if customer_id else None
+
+    def _index(self, user: UserRecord):
+        key = _email_key(user.email)
+        if key:
+            # First account registered with an address keeps the email index entry
+            self._by_email.setdefault(key, user)
+        if user.stripe_customer_id:
+            self._by_customer[user.stripe_customer_id] = user
+
+    def _unindex(self, user: UserRecord):
+        key = _email_key(user.email)
+        if key and self._by_email.get(key) is user:
+            del self._by_email[key]
+        if user.stripe_customer_id and self._by_customer.get(user.stripe_customer_id) is user:
+            del self._by_customer[user.stripe_customer_id]
+
+    def add(self, user: UserRecord) -> bool:
+        self.backend.sync()
+        with self._lock:
+            if user.username in self._by_username:
+                return False
+            if not self.backend.insert_user(user.to_dict()):
+                return False
+            self._by_username[user.username] = user
+            self._index(user)
+            return True
+
+    def update(self, username: str, updates: dict) -> Optional[UserRecord]:
+        self.backend.sync()
+        with self._lock:
+            user = self._by_username.get(username)
+            if user is None:
+                return None
+            changed = {f: updates[f] for f in UPDATABLE_FIELDS if f in updates and getattr(user, f) != updates[f]}
+            if changed:
+                # Only the changed columns are written back
+                self.backend.update_user(username, changed)
+                self._unindex(user)
+                for field, value in changed.items():
+                    setattr(user, field, value)
+                self._index(user)
+            return user
+
+    def set_password(self, username: str, pwd_hash: str, salt: Optional[str], iterations: Optional[int]) -> bool:
+        self.backend.sync()
+        with self._lock:
+            user = self._by_username.get(username)
+            if user is None:
+                return False
+            self.backend.update_user(username, {'password': pwd_hash, 'salt': salt, 'iterations': iterations})
+            user.password = pwd_hash
+            user.salt = salt
+            user.iterations = iterations
+            return True
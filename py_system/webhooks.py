@@ -0,0 +1,135 @@
+"""Stripe webhook event processing.
+
+The HTTP endpoint only verifies the signature, queues the event and
+acknowledges it; a job queue worker applies it to the user record. Stripe
+retries deliveries and can send the same event more than once, so events
+are de-duplicated by id when they are queued and every handler sets state
+rather than toggling it, which makes re-running one harmless.
+"""
+from typing import Callable, Dict, Optional
+
+from metrics import time_stripe
+from subscriptions import SubscriptionMirror
+from user_store import UserRecord, UserRepository
+
+# Subscription statuses that keep paid features enabled
+ACTIVE_STATUSES = ('active', 'trialing')
+
+
+def event_dedup_key(event: dict) -> Optional[str]:
+    event_id = event.get('id')
+    return f"stripe:{event_id}" if event_id else None
+
+
+def _invoice_subscription(invoice: dict) -> Optional[str]:
+    # Newer API versions move the subscription id under parent.subscription_details
+    if invoice.get('subscription'):
+        return invoice['subscription']
+    details = (invoice.get('parent') or {}).get('subscription_details') or {}
+    return details.get('subscription')
+
+
+class StripeEventProcessor:
+    def __init__(self, users: UserRepository, prices: Dict[str, str], stripe_client=None,
+                 mirror: Optional[SubscriptionMirror] = None):
+        self.users = users
+        self.plans_by_price = {pid: name for name, pid in prices.items()}
+        self.stripe = stripe_client
+        self.mirror = mirror if mirror is not None else SubscriptionMirror(stripe_client)
+        self.handlers: Dict[str, Callable[[dict, Optional[float]], str]] = {
+            'checkout.session.completed': self._checkout_completed,
+            'customer.subscription.created': self._subscription_updated,
+            'customer.subscription.updated': self._subscription_updated,
+            'customer.subscription.deleted': self._subscription_deleted,
+            'invoice.paid': self._invoice_paid,
+        }
+
+    def handles(self, event_type: Optional[str]) -> bool:
+        return event_type in self.handlers
+
+    def process(self, event: dict) -> str:
+        """Apply one event; returns a short outcome for the log. Raises to have the job retried."""
+        handler = self.handlers.get(event.get('type'))
+        if handler is None:
+            return 'ignored'
+        return handler(event['data']['object'], event.get('created'))
+
+    def _find_user(self, obj: dict) -> Optional[UserRecord]:
+        metadata = obj.get('metadata') or {}
+        username = metadata.get('username') or obj.get('client_reference_id')
+        user = self.users.get(username) if username else None
+        return user or self.users.get_by_customer(obj.get('customer'))
+
+    def plan_for_price(self, price_id: Optional[str]) -> Optional[str]:
+        return self.plans_by_price.get(price_id) if price_id else None
+
+    def _plan_for_subscription(self, subscription: dict) -> Optional[str]:
+        items = (subscription.get('items') or {}).get('data') or []
+        for item in items:
+            plan = self.plan_for_price((item.get('price') or {}).get('id'))
+            if plan:
+                return plan
+        return (subscription.get('metadata') or {}).get('plan')
+
+    def _checkout_completed(self, session: dict, created: Optional[float]) -> str:
+        self.mirror.record_session(session)
+        user = self._find_user(session)
+        if user is None:
+            return 'no matching user'
+        subscription_id = session.get('subscription')
+        if not subscription_id and session.get('mode') == 'subscription' and self.stripe is not None:
+            # Only older payloads lack the id; fetch the session instead of guessing
+            with time_stripe('checkout.Session.retrieve'):
+                full = self.stripe.checkout.Session.retrieve(session['id'])
+            subscription_id = getattr(full, 'subscription', None)
+        updates = {
+            'payment': session.get('payment_status') in (None, 'paid', 'no_payment_required'),
+            'stripe_customer_id': session.get('customer') or user.stripe_customer_id,
+            'stripe_subscription_id': subscription_id or user.stripe_subscription_id,
+        }
+        plan = (session.get('metadata') or {}).get('plan')
+        if plan:
+            updates['subscription'] = plan
+        self.users.update(user.username, updates)
+        return f"{user.username} paid={updates['payment']}"
+
+    def _subscription_updated(self, subscription: dict, created: Optional[float]) -> str:
+        if not self.mirror.record_subscription(subscription, created):
+            return 'out of order, skipped'
+        user = self._find_user(subscription)
+        if user is None:
+            return 'no matching user'
+        active = subscription.get('status') in ACTIVE_STATUSES
+        updates = {
+            'payment': active,
+            'stripe_customer_id': subscription.get('customer') or user.stripe_customer_id,
+            'stripe_subscription_id': subscription.get('id'),
+        }
+        plan = self._plan_for_subscription(subscription)
+        if plan and active:
+            updates['subscription'] = plan
+        self.users.update(user.username, updates)
+        return f"{user.username} status={subscription.get('status')}"
+
+    def _subscription_deleted(self, subscription: dict, created: Optional[float]) -> str:
+        self.mirror.record_subscription(dict(subscription, status=subscription.get('status') or 'canceled'), created)
+        user = self._find_user(subscription)
+        if user is None:
+            return 'no matching user'
+        if user.stripe_subscription_id and user.stripe_subscription_id != subscription.get('id'):
+            # An older subscription ended after the user had already moved to a new one
+            return f"{user.username} stale subscription"
+        self.users.update(user.username, {'payment': False, 'subscription': 'free', 'stripe_subscription_id': None})
+        return f"{user.username} canceled"
+
+    def _invoice_paid(self, invoice: dict, created: Optional[float]) -> str:
+        subscription_id = _invoice_subscription(invoice)
+        self.mirror.record_invoice_paid(subscription_id)
+        user = self._find_user(invoice)
+        if user is None:
+            return 'no matching user'
+        self.users.update(user.username, {
+            'payment': True,
+            'stripe_subscription_id': subscription_id or user.stripe_subscription_id,
+        })
+        return f"{user.username} invoice paid"
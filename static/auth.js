@@ -51,7 +51,8 @@ async function handleSignup(name, username, password, email, errorEl){
     const data = await postJson(API_BASE + '/api/auth/signup', { username, password, name, email });
     if (data.success){
       // auto-login after signup
-      localStorage.setItem('aizeeno_user', JSON.stringify({ username: username, name: name, email: email }));
+      localStorage.setItem('aizeeno_user', JSON.stringify({ username: username, name: name, email: email,
+        access_token: data.access_token, refresh_token: data.refresh_token }));
       // Redirect to home page (index) after signup
       setTimeout(()=> { location.href = '/templates/index.html'; }, 350);
       return true;
@@ -72,7 +73,8 @@ async function handleLogin(username, password, errorEl){
   try{
     const data = await postJson(API_BASE + '/api/auth/login', { username, password });
     if (data.success){
-      localStorage.setItem('aizeeno_user', JSON.stringify({ username: data.user.username, name: data.user.name }));
+      localStorage.setItem('aizeeno_user', JSON.stringify({ username: data.user.username, name: data.user.name,
+        access_token: data.access_token, refresh_token: data.refresh_token }));
       // Redirect to home page (index) after login
       location.href = '/templates/index.html';
       return true;
@@ -200,7 +202,8 @@ async function handleGoogleCallback(response) {
     // Send token to backend for verification and user creation/login
     const data = await postJson(API_BASE + '/api/auth/google', { token });
     if (data.success) {
-      localStorage.setItem('aizeeno_user', JSON.stringify({ username: data.user.username, name: data.user.name, email: data.user.email }));
+      localStorage.setItem('aizeeno_user', JSON.stringify({ username: data.user.username, name: data.user.name, email: data.user.email,
+        access_token: data.access_token, refresh_token: data.refresh_token }));
       alert('Welcome! Signing you in...');
       setTimeout(() => { location.href = '/templates/index.html'; }, 500);
     } else {
@@ -23,6 +23,26 @@ const BACKEND_BASE = 'http://127.0.0.1:5000';
 // ------------------------
 let currentPersonality = 'friendly';
 let isProcessing = false;
+let currentConversationId = null;
+
+function currentUser() {
+    try {
+        return JSON.parse(localStorage.getItem('aizeeno_user') || 'null');
+    } catch (e) {
+        return null;
+    }
+}
+
+function currentUsername() {
+    const u = currentUser();
+    return u && u.username ? u.username : null;
+}
+
+// Conversations belong to the signed-in user; the server reads who that is from the access token
+function authHeaders(headers = {}) {
+    const u = currentUser();
+    return u && u.access_token ? { ...headers, 'Authorization': 'Bearer ' + u.access_token } : headers;
+}
 
 // ------------------------
 // UI HELPERS
@@ -59,26 +79,130 @@ function removeTypingIndicator(indicator) {
 // ------------------------
 // API FUNCTIONS
 // ------------------------
+// Each chat session is a server-side conversation so follow-up questions keep their context
+async function ensureConversation() {
+    if (currentConversationId) return currentConversationId;
+    // Signed-out chats are one-off messages
+    if (!currentUsername()) return null;
+    try {
+        const response = await fetch('/api/conversations/new', {
+            method: 'POST',
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify({})
+        });
+        if (response.ok) {
+            const data = await response.json();
+            currentConversationId = data.item ? data.item.id : null;
+        }
+    } catch (error) {
+        console.error('Conversation create error:', error);
+    }
+    return currentConversationId;
+}
+
+function chatPayload(message) {
+    return { message, conversation_id: currentConversationId };
+}
+
+// Thrown on a 429 so callers show the limit instead of retrying
+class RateLimitError extends Error {
+    constructor(data) {
+        super(data.error || 'Rate limited');
+        this.retryAfter = data.retry_after;
+        this.quota = data.quota;
+    }
+}
+
+async function rateLimitError(response) {
+    const data = await response.json().catch(() => ({}));
+    if (!data.retry_after) data.retry_after = parseInt(response.headers.get('Retry-After') || '0', 10);
+    return new RateLimitError(data);
+}
+
+function rateLimitMessage(error) {
+    const wait = error.retryAfter || 0;
+    if (wait >= 3600) return `${error.message}. Upgrade your plan for a bigger daily allowance.`;
+    return `${error.message}. Try again in ${wait} second${wait === 1 ? '' : 's'}.`;
+}
+
+// Remaining daily tokens, shown as a hint on the input box
+function updateQuota(quota) {
+    if (!quota || !userInput) return;
+    userInput.title = `${quota.remaining_tokens.toLocaleString()} of ${quota.daily_tokens.toLocaleString()} tokens left today (${quota.plan} plan)`;
+}
+
 async function sendMessageToBackend(message) {
     try {
         const response = await fetch('/api/chat', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message })
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify(chatPayload(message))
         });
         
+        if (response.status === 429) {
+            throw await rateLimitError(response);
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
         const data = await response.json();
+        updateQuota(data.quota);
         return data.response || 'No response received';
     } catch (error) {
         console.error('Chat API Error:', error);
+        if (error instanceof RateLimitError) return rateLimitMessage(error);
         return 'Sorry, I encountered an error. Please try again.';
     }
 }
 
+// Streams the reply as Server-Sent Events, calling onToken for every chunk.
+// Resolves with the full text once the server sends the final "done" frame.
+async function streamMessageFromBackend(message, onToken) {
+    const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: authHeaders({ 'Content-Type': 'application/json', 'Accept': 'text/event-stream' }),
+        body: JSON.stringify(chatPayload(message))
+    });
+
+    if (response.status === 429) {
+        throw await rateLimitError(response);
+    }
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullText = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            if (!frame.startsWith('data: ')) continue;
+
+            const event = JSON.parse(frame.slice(6));
+            if (event.error) throw new Error(event.error);
+            if (event.done) {
+                updateQuota(event.quota);
+                return fullText;
+            }
+            if (event.token) {
+                fullText += event.token;
+                onToken(event.token, fullText);
+            }
+        }
+    }
+    return fullText;
+}
+
 // ------------------------
 // MESSAGE HANDLING
 // ------------------------
@@ -94,13 +218,31 @@ async function sendMessage() {
 
     const typingIndicator = showTypingIndicator();
 
+    let aiMsg = null;
+    await ensureConversation();
     try {
-        const response = await sendMessageToBackend(text);
+        await streamMessageFromBackend(text, (token, fullText) => {
+            if (!aiMsg) {
+                removeTypingIndicator(typingIndicator);
+                addMessage('', 'ai');
+                aiMsg = chatContainer?.lastElementChild;
+            }
+            if (aiMsg) aiMsg.textContent = fullText;
+            if (chatContainer) chatContainer.scrollTop = chatContainer.scrollHeight;
+        });
         removeTypingIndicator(typingIndicator);
-        addMessage(response, 'ai');
+        if (!aiMsg) addMessage('No response received', 'ai');
     } catch (error) {
+        console.error('Chat stream error:', error);
         removeTypingIndicator(typingIndicator);
-        addMessage('Sorry, I encountered an error. Please try again.', 'ai');
+        if (error instanceof RateLimitError) {
+            updateQuota(error.quota);
+            if (!aiMsg) addMessage(rateLimitMessage(error), 'ai');
+        } else if (!aiMsg) {
+            // Nothing streamed yet: fall back to the buffered endpoint
+            const response = await sendMessageToBackend(text);
+            addMessage(response, 'ai');
+        }
     } finally {
         isProcessing = false;
     }
@@ -206,6 +348,7 @@ function registerEventListeners() {
     micBtn?.addEventListener('click', startVoiceInput);
     newChatBtn?.addEventListener('click', () => {
         if (chatContainer) chatContainer.innerHTML = '';
+        currentConversationId = null;
         title && (title.style.display = 'block');
         chatBar && (chatBar.style.animation = 'slideToMiddle 0.8s ease forwards');
     });
@@ -251,6 +394,23 @@ async function fetchJson(url, options = {}) {
     return data;
 }
 
+// Account routes need the access token issued at login; an expired one is refreshed once and the call retried
+async function fetchAuthed(url, user, options = {}) {
+    const withToken = () => ({ ...options, headers: { ...(options.headers || {}), 'Authorization': 'Bearer ' + (user.access_token || '') } });
+    try {
+        return await fetchJson(url, withToken());
+    } catch (err) {
+        if (!user.refresh_token || !/^Token|^Authentication/.test(err.message)) throw err;
+        const tokens = await fetchJson('/api/auth/refresh', {
+            method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ refresh_token: user.refresh_token })
+        });
+        user.access_token = tokens.access_token;
+        user.refresh_token = tokens.refresh_token;
+        localStorage.setItem('aizeeno_user', JSON.stringify(user));
+        return fetchJson(url, withToken());
+    }
+}
+
 async function fetchWithRetries(path, options = {}, attempts = 4, initialDelay = 400) {
     let lastErr = null;
     const makeUrl = (p) => (/^https?:\/\//i.test(p) ? p : BACKEND_BASE + p);
@@ -283,8 +443,8 @@ async function handleReturnFromStripe() {
     const user = JSON.parse(userStr);
 
     try {
-        const payload = { username: user.username, session_id: sessionId, plan };
-        const result = await fetchJson('/api/payment-status', {
+        const payload = { session_id: sessionId, plan };
+        const result = await fetchAuthed('/api/payment-status', user, {
             method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(payload)
         });
 
@@ -352,9 +512,10 @@ async function initSubscription() {
 
             try {
                 const payload = { plan };
-                if (user && user.username) payload.username = user.username;
+                const headers = { 'Content-Type': 'application/json' };
+                if (user && user.access_token) headers['Authorization'] = 'Bearer ' + user.access_token;
                 const resp = await fetchWithRetries('/api/create-checkout-session', {
-                    method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(payload)
+                    method: 'POST', headers, body: JSON.stringify(payload)
                 }, 3, 300);
 
                 const sessionId = resp.sessionId || resp.id || resp.session_id;
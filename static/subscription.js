@@ -21,6 +21,23 @@ async function fetchJson(url, options = {}) {
   }
 }
 
+// Account routes need the access token issued at login; an expired one is refreshed once and the call retried
+async function fetchAuthed(url, user, options = {}) {
+  const withToken = () => ({ ...options, headers: { ...(options.headers || {}), 'Authorization': 'Bearer ' + (user.access_token || '') } });
+  try {
+    return await fetchJson(url, withToken());
+  } catch (err) {
+    if (!user.refresh_token || !/^Token|^Authentication/.test(err.message)) throw err;
+    const tokens = await fetchJson('/api/auth/refresh', {
+      method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ refresh_token: user.refresh_token })
+    });
+    user.access_token = tokens.access_token;
+    user.refresh_token = tokens.refresh_token;
+    localStorage.setItem('aizeeno_user', JSON.stringify(user));
+    return fetchJson(url, withToken());
+  }
+}
+
 // Fetch with retries + exponential backoff and origin fallback
 async function fetchWithRetries(path, options = {}, attempts = 4, initialDelay = 400) {
   let lastErr = null;
@@ -59,8 +76,8 @@ async function handleReturnFromStripe() {
   const user = JSON.parse(userStr);
 
   try {
-    const payload = { username: user.username, session_id: sessionId, plan };
-    const result = await fetchJson('/api/payment-status', {
+    const payload = { session_id: sessionId, plan };
+    const result = await fetchAuthed('/api/payment-status', user, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload)
@@ -153,9 +170,13 @@ async function initSubscription() {
       try {
         // Create Checkout session (use retries for transient errors)
         const payload = { plan };
+        const headers = { 'Content-Type': 'application/json' };
+        // Signed-in checkouts are tied to the account, so payment-status can confirm them
+        const user = JSON.parse(localStorage.getItem('aizeeno_user') || 'null');
+        if (user && user.access_token) headers['Authorization'] = 'Bearer ' + user.access_token;
         const resp = await fetchWithRetries('/api/create-checkout-session', {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers,
           body: JSON.stringify(payload)
         }, 3, 300);
 